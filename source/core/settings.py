@@ -133,4 +133,109 @@ CHANNEL_LAYERS = {
             'hosts': [(host.strip(), 6379) for host in ALLOWED_HOSTS],
         },
     },
-}
\ No newline at end of file
+}
+
+# DOCKER CONFIGURATION
+DOCKER_CLIENT_POOL_SIZE = config('DOCKER_CLIENT_POOL_SIZE', default=4, cast=int)
+DOCKER_CLIENT_MAX_CONNECTIONS = config('DOCKER_CLIENT_MAX_CONNECTIONS', default=10, cast=int)
+# Docker daemons containers can be placed on, as comma separated "name|base_url|weight" entries.
+# An empty base_url uses the environment's daemon; the first entry is the default endpoint.
+DOCKER_ENDPOINTS = [
+    dict(zip(('name', 'base_url', 'weight'), entry.strip().split('|')))
+    for entry in config('DOCKER_ENDPOINTS', default='default||1').split(',') if entry.strip()
+]
+# Host directory holding warm container workspace slots; leave empty to disable the warm pool.
+# Claiming a warm container bind-mounts on the host, so the web process must run as root.
+DOCKER_WARM_POOL_ROOT = config('DOCKER_WARM_POOL_ROOT', default='')
+DOCKER_WARM_POOL_SIZES = {
+    'free': config('DOCKER_WARM_POOL_SIZE_FREE', default=4, cast=int),
+    'basic': config('DOCKER_WARM_POOL_SIZE_BASIC', default=2, cast=int),
+    'full': config('DOCKER_WARM_POOL_SIZE_FULL', default=1, cast=int),
+}
+# Idle containers are paused, then stopped, by one reaper per process (or `manage.py reap_idle_containers`)
+DOCKER_IDLE_TIMEOUT = config('DOCKER_IDLE_TIMEOUT', default=3600, cast=int)
+DOCKER_IDLE_TIMEOUTS = {
+    'free': {'pause': config('DOCKER_PAUSE_TIMEOUT_FREE', default=300, cast=int), 'stop': DOCKER_IDLE_TIMEOUT},
+    'basic': {'pause': config('DOCKER_PAUSE_TIMEOUT_BASIC', default=900, cast=int), 'stop': DOCKER_IDLE_TIMEOUT * 2},
+    'full': {'pause': config('DOCKER_PAUSE_TIMEOUT_FULL', default=1800, cast=int), 'stop': DOCKER_IDLE_TIMEOUT * 4},
+}
+DOCKER_REAPER_INTERVAL = config('DOCKER_REAPER_INTERVAL', default=60, cast=int)
+DOCKER_REAPER_BATCH_SIZE = config('DOCKER_REAPER_BATCH_SIZE', default=50, cast=int)
+DOCKER_REAPER_MAX_WORKERS = config('DOCKER_REAPER_MAX_WORKERS', default=4, cast=int)
+DOCKER_REAPER_IN_PROCESS = config('DOCKER_REAPER_IN_PROCESS', default=True, cast=bool)
+
+# TERMINAL STREAMING
+TERMINAL_FRAME_INTERVAL = config('TERMINAL_FRAME_INTERVAL', default=0.05, cast=float)
+TERMINAL_FRAME_BYTES = config('TERMINAL_FRAME_BYTES', default=16384, cast=int)
+TERMINAL_MAX_BYTES_IN_FLIGHT = config('TERMINAL_MAX_BYTES_IN_FLIGHT', default=262144, cast=int)
+# Keystroke messages waiting to be written to a terminal before further input is refused
+TERMINAL_INPUT_QUEUE_SIZE = config('TERMINAL_INPUT_QUEUE_SIZE', default=256, cast=int)
+
+# Thread pools for blocking Docker and GitHub calls
+DOCKER_CALL_POOL_WORKERS = config('DOCKER_CALL_POOL_WORKERS', default=32, cast=int)
+GITHUB_CALL_POOL_WORKERS = config('GITHUB_CALL_POOL_WORKERS', default=8, cast=int)
+
+# Container resource sampling (`manage.py sample_container_stats`, or in-process when enabled)
+DOCKER_STATS_INTERVAL = config('DOCKER_STATS_INTERVAL', default=60, cast=int)
+DOCKER_STATS_RETENTION = config('DOCKER_STATS_RETENTION', default=7 * 24 * 3600, cast=int)
+DOCKER_STATS_MAX_WORKERS = config('DOCKER_STATS_MAX_WORKERS', default=8, cast=int)
+DOCKER_STATS_IN_PROCESS = config('DOCKER_STATS_IN_PROCESS', default=False, cast=bool)
+
+# Storage usage is updated by file actions and corrected by a reconciler (`manage.py reconcile_storage`, or in-process)
+STORAGE_RECONCILE_INTERVAL = config('STORAGE_RECONCILE_INTERVAL', default=600, cast=int)
+STORAGE_RECONCILE_BATCH_SIZE = config('STORAGE_RECONCILE_BATCH_SIZE', default=50, cast=int)
+STORAGE_RECONCILE_MAX_WORKERS = config('STORAGE_RECONCILE_MAX_WORKERS', default=4, cast=int)
+STORAGE_RECONCILE_IN_PROCESS = config('STORAGE_RECONCILE_IN_PROCESS', default=True, cast=bool)
+
+# Ignored on top of each project's .gitignore and .git/info/exclude (comma separated)
+PROJECT_IGNORE_PATTERNS = [
+    pattern.strip()
+    for pattern in config('PROJECT_IGNORE_PATTERNS', default='node_modules/,__pycache__/,venv/,.venv/').split(',') if pattern.strip()
+]
+PROJECT_TREE_PAGE_SIZE = config('PROJECT_TREE_PAGE_SIZE', default=200, cast=int)
+PROJECT_DIRECTORY_CACHE_SIZE = config('PROJECT_DIRECTORY_CACHE_SIZE', default=1024, cast=int)
+
+# Opening files in the IDE: larger or binary files open read-only and load further ranges on demand
+OPEN_FILE_PREVIEW_BYTES = config('OPEN_FILE_PREVIEW_BYTES', default=262144, cast=int)
+OPEN_FILE_HEX_BYTES = config('OPEN_FILE_HEX_BYTES', default=16384, cast=int)
+OPEN_FILE_RANGE_MAX_BYTES = config('OPEN_FILE_RANGE_MAX_BYTES', default=1048576, cast=int)
+OPEN_FILE_LINE_INDEX_CACHE_SIZE = config('OPEN_FILE_LINE_INDEX_CACHE_SIZE', default=64, cast=int)
+# Content hashes of open files, reused while their stat data is unchanged, for editor save versions
+FILE_VERSION_CACHE_SIZE = config('FILE_VERSION_CACHE_SIZE', default=1024, cast=int)
+
+# Project downloads are zipped on the fly at this zlib level (0 stores every file)
+DOWNLOAD_COMPRESSION_LEVEL = config('DOWNLOAD_COMPRESSION_LEVEL', default=6, cast=int)
+
+# Uploaded project archives are extracted in chunks against the user's remaining storage
+UPLOAD_MAX_COMPRESSION_RATIO = config('UPLOAD_MAX_COMPRESSION_RATIO', default=200, cast=int)
+UPLOAD_PARALLEL_MEMBER_BYTES = config('UPLOAD_PARALLEL_MEMBER_BYTES', default=8 * 1024 * 1024, cast=int)
+UPLOAD_EXTRACT_WORKERS = config('UPLOAD_EXTRACT_WORKERS', default=4, cast=int)
+
+# Repository clones run as background jobs, limited overall and per remote host
+CLONE_MAX_RUNNING = config('CLONE_MAX_RUNNING', default=4, cast=int)
+CLONE_MAX_PER_HOST = config('CLONE_MAX_PER_HOST', default=2, cast=int)
+CLONE_MAX_PENDING = config('CLONE_MAX_PENDING', default=32, cast=int)
+CLONE_TIMEOUT = config('CLONE_TIMEOUT', default=1800, cast=int)
+# Popular repositories get a shared bare mirror that clones borrow objects from (`manage.py refresh_git_mirrors`)
+GIT_MIRROR_ENABLED = config('GIT_MIRROR_ENABLED', default=True, cast=bool)
+GIT_MIRROR_ROOT = config('GIT_MIRROR_ROOT', default=str(BASE_DIR / 'GitMirrors'))
+GIT_MIRROR_MIN_CLONES = config('GIT_MIRROR_MIN_CLONES', default=2, cast=int)
+GIT_MIRROR_REFRESH_INTERVAL = config('GIT_MIRROR_REFRESH_INTERVAL', default=3600, cast=int)
+GIT_MIRROR_IN_PROCESS = config('GIT_MIRROR_IN_PROCESS', default=True, cast=bool)
+# Projects without a .git directory are compared with GitHub by blob hash, cached per file stat signature
+BLOB_HASH_CACHE_DIR = config('BLOB_HASH_CACHE_DIR', default=str(BASE_DIR / 'BlobHashCache'))
+BLOB_HASH_CACHE_PROJECTS = config('BLOB_HASH_CACHE_PROJECTS', default=64, cast=int)
+BLOB_HASH_WORKERS = config('BLOB_HASH_WORKERS', default=4, cast=int)
+# Remote branch snapshots: trees cached by commit SHA, branch heads revalidated with ETags
+REMOTE_TREE_CACHE_SIZE = config('REMOTE_TREE_CACHE_SIZE', default=128, cast=int)
+REMOTE_REF_CACHE_SIZE = config('REMOTE_REF_CACHE_SIZE', default=1024, cast=int)
+# GitHub clients are reused per token; repository and branch lookups are shared for a few seconds
+GITHUB_LOOKUP_TTL = config('GITHUB_LOOKUP_TTL', default=30, cast=int)
+GITHUB_LOOKUP_CACHE_SIZE = config('GITHUB_LOOKUP_CACHE_SIZE', default=1024, cast=int)
+# GitHub rate limits: page-load calls leave a reserve for user actions and wait at most
+# GITHUB_MAX_DEFER seconds for a reset; user actions wait at most GITHUB_MAX_WAIT
+GITHUB_RATE_LIMIT_RESERVE = config('GITHUB_RATE_LIMIT_RESERVE', default=200, cast=int)
+GITHUB_MAX_DEFER = config('GITHUB_MAX_DEFER', default=5, cast=int)
+GITHUB_MAX_WAIT = config('GITHUB_MAX_WAIT', default=20, cast=int)
+GITHUB_MAX_RETRIES = config('GITHUB_MAX_RETRIES', default=3, cast=int)
+GITHUB_MAX_CONCURRENT_PER_TOKEN = config('GITHUB_MAX_CONCURRENT_PER_TOKEN', default=4, cast=int)
@@ -1,8 +1,9 @@
-import zipfile
 import os
-import subprocess
+import re
+import shutil
+import uuid
 from datetime import timedelta
-from github import Github
+from threading import Lock
 
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
@@ -18,7 +19,9 @@ from django.views.generic import TemplateView
 
 from chat.models import ChatRoom, Message
 from project.models import Project
-from user.models import CustomUser, ActivityLog, Subscription
+from project.utils import storage_exceeded, storage_reconciler, storage_remaining, extract_zip, ExtractionError, \
+    clone_jobs, CloneError, github_clients, github_scheduler, GitHubRateLimited, publish_progress
+from user.models import CustomUser, ActivityLog
 from home.models import HomePage
 
 
@@ -129,8 +132,12 @@ class ProfileView(TemplateView):
                 else:
                     access_token = user_profile.social_auth.get(provider='github').extra_data['access_token']
 
-                github = Github(access_token)
-                github_repos = github.get_user().get_repos()
+                # Listing repos is background work on a page load, so it gives way when the token runs low
+                github = github_clients.client(access_token)
+                github_repos = github_scheduler.call(github, lambda: list(github.get_user().get_repos()),
+                                                     interactive=False)
+            except GitHubRateLimited as e:
+                messages.warning(request, f"Your GitHub repos could not be listed right now. {e}")
             except Exception:
                 messages.warning(request, "Error fetching GitHub repos. Please go to settings and connect your GitHub account.")
 
@@ -214,19 +221,44 @@ class ProfileView(TemplateView):
         project_folder = request.FILES.get('project_folder')
         project_path = os.path.join(request.user.project_dir, project_name)
 
+        project_created = not os.path.exists(project_path)
         os.makedirs(project_path, exist_ok=True)
 
         if project_folder:
             extracted_path = os.path.join(project_path, 'another')
+            created = not os.path.exists(extracted_path)
             os.makedirs(extracted_path, exist_ok=True)
-            with zipfile.ZipFile(project_folder, 'r') as zip_ref:
-                for file_info in zip_ref.namelist():
-                    target_path = os.path.join(extracted_path, file_info)
-                    if file_info.endswith(os.sep):
-                        os.makedirs(target_path, exist_ok=True)
-                    else:
-                        with zip_ref.open(file_info) as src, open(target_path, 'wb') as dest:
-                            dest.write(src.read())
+
+            # Shown on the profile page, which stays open until this request responds
+            job = {'id': uuid.uuid4().hex, 'project': project_name, 'url': None, 'status': 'running',
+                   'phase': 'Extracting', 'percent': 0, 'error': None, 'cancellable': False}
+            job_lock = Lock()
+            publish_progress(request.user.id, job)
+
+            def report_progress(written, total):
+                percent = written * 100 // max(total, 1)
+                with job_lock:
+                    if percent < job['percent'] + 5:
+                        return
+                    job['percent'] = percent
+                    publish_progress(request.user.id, dict(job))
+
+            try:
+                extract_zip(project_folder, extracted_path, storage_remaining(request.user), progress=report_progress)
+            except Exception as e:
+                # Leave nothing behind for an upload that was refused or failed halfway
+                if project_created:
+                    shutil.rmtree(project_path, ignore_errors=True)
+                elif created:
+                    shutil.rmtree(extracted_path, ignore_errors=True)
+                error = str(e) if isinstance(e, ExtractionError) else "Extraction failed."
+                publish_progress(request.user.id, {**job, 'status': 'failed', 'error': error})
+                if not isinstance(e, ExtractionError):
+                    raise
+                messages.warning(request, f"Could not extract {project_folder.name}: {e}")
+                return redirect('profile', username=request.user)
+
+            publish_progress(request.user.id, {**job, 'status': 'finished', 'percent': 100})
 
         project = Project.objects.create(
             project_name=project_name,
@@ -239,6 +271,7 @@ class ProfileView(TemplateView):
         with open(os.path.join(project_path, "README.md"), "w") as readme_file:
             readme_file.write(
                 f"# Welcome to your {project_name}!\n\nThis is the README.md file for your project.\n\n{project_description or 'No description provided.'}")
+        storage_reconciler.reconcile_project(project)
 
         add_activity_to_log(request.user, activity_type='project', sender=None, task=None, project=project,
                             message='You created a new project')
@@ -248,26 +281,13 @@ class ProfileView(TemplateView):
     @staticmethod
     def check_storage_limit(request):
         """Check if the user exceeds storage limit and returns a bool"""
-
-        subscription = Subscription.objects.filter(user=request.user).first()
-
-        # Calculate the current folder size
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(request.user.project_dir):
-            for f in filenames:
-                file_path = os.path.join(dirpath, f)
-                total_size += os.path.getsize(file_path)
-
-        current_folder_size = total_size / (1024 * 1024)  # Convert bytes to MB
-        storage_limit = subscription.storage_limit  # Get the folder size limit (assuming it's a model field for user)
-
-        # Check if the current folder size exceeds the storage limit
-        return current_folder_size >= storage_limit
+        return storage_exceeded(request.user)
 
     @staticmethod
     def clone_repo(request):
         """
-        Create a new project using the repo name and clone the repo into the user's project directory.
+        Create a new project using the repo name and start a background job cloning the repo into
+        the user's project directory.
         """
 
         # Check if the current folder size exceeds the storage limit
@@ -275,13 +295,25 @@ class ProfileView(TemplateView):
             messages.warning(request, "Storage limit exceeded. Cannot create a new project.")
             return redirect('profile', username=request.user)
 
-        repo_url = request.POST.get('repo_url')
-        repo_name = repo_url.split('/')[-1]
+        repo_url = (request.POST.get('repo_url') or '').strip().rstrip('/')
+        repo_name = repo_url.split('/')[-1].split(':')[-1]
+        if repo_name.endswith('.git'):
+            repo_name = repo_name[:-len('.git')]
 
-        user_project_dir = request.user.project_dir
+        # The name becomes a folder in the user's project directory
+        if not re.fullmatch(r'[\w.-]+', repo_name) or repo_name in ('.', '..'):
+            messages.warning(request, "Enter a valid repository URL, such as https://github.com/owner/repo.git.")
+            return redirect('profile', username=request.user)
 
-        project_dir = os.path.join(user_project_dir, repo_name)
-        os.makedirs(project_dir, exist_ok=True)
+        project_dir = os.path.join(request.user.project_dir, repo_name)
+        if os.path.exists(project_dir):
+            messages.warning(request, f"A project folder named '{repo_name}' already exists.")
+            return redirect('profile', username=request.user)
+
+        try:
+            depth = int(request.POST.get('depth') or 0) or None
+        except ValueError:
+            depth = None
 
         project = Project.objects.create(
             user=request.user,
@@ -291,16 +323,21 @@ class ProfileView(TemplateView):
             project_description=f"Cloned from {repo_url}",
         )
 
-        try:
-            subprocess.run(['git', 'clone', repo_url, project_dir], check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"Error while cloning repository: {e}")
-            return HttpResponse("Error cloning repository", status=500)
+        def log_clone(job):
+            add_activity_to_log(project.user, activity_type='project', sender=None, task=None, project=project,
+                                message='You cloned a repository')
 
-        add_activity_to_log(request.user, activity_type='project', sender=None, task=None, project=project,
-                            message='You cloned a repository')
+        # The clone runs in the background; the profile page follows its progress over a websocket
+        try:
+            clone_jobs.submit(project, repo_url, depth=depth, blob_filter='blob_filter' in request.POST,
+                              on_success=log_clone)
+        except CloneError as e:
+            project.delete()
+            messages.warning(request, str(e))
+            return redirect('profile', username=request.user)
 
-        return redirect('ide', username=request.user.username, project_project_name=project.project_name)
+        messages.info(request, f"Cloning {repo_name} in the background.")
+        return redirect('profile', username=request.user)
 
     @staticmethod
     def edit_bio(request):
@@ -7,7 +7,7 @@ class ProjectAdmin(admin.ModelAdmin):
     """
     Admin interface for managing projects.
     """
-    list_display = ('project_name', 'user', 'is_public', 'likes', 'modified_at', 'created_at')
+    list_display = ('project_name', 'user', 'is_public', 'likes', 'storage_used', 'modified_at', 'created_at')
     list_filter = ('is_public', 'created_at', 'modified_at')
     search_fields = ('project_name', 'user__username', 'repository', 'project_description')
     ordering = ('-created_at',)
@@ -16,13 +16,13 @@ class ProjectAdmin(admin.ModelAdmin):
 
     fieldsets = (
         (None, {
-            'fields': ('user', 'project_name', 'project_path', 'repository', 'project_description')
+            'fields': ('user', 'project_name', 'project_path', 'repository', 'project_description', 'ignore_patterns')
         }),
         ('Privacy & Collaboration', {
             'fields': ('is_public', 'collaborators')
         }),
         ('Likes & Statistics', {
-            'fields': ('likes', 'liked_by', 'modified_at', 'created_at')
+            'fields': ('likes', 'liked_by', 'storage_used', 'modified_at', 'created_at')
         }),
     )
 
@@ -1,12 +1,68 @@
+import asyncio
+import codecs
 import json
+import queue
+import threading
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+async def run_docker_call(func, *args):
+    """
+    Run a blocking Docker call on the dedicated Docker thread pool.
+    """
+    from .utils import docker_call_pool
+    return await docker_call_pool.run(func, *args)
+
+
+class OutputWindow:
+    """
+    Caps the number of output bytes sent to the browser but not yet acknowledged by it.
+
+    The thread reading exec output blocks in `acquire` once the cap is reached, so a slow
+    browser slows down the reader instead of output piling up in server memory.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.closed = False
+        self._condition = threading.Condition()
+
+    def acquire(self, size):
+        """
+        Waits for room in the window and reserves `size` bytes. Returns False once closed.
+        """
+        with self._condition:
+            while self.in_flight and self.in_flight + size > self.limit and not self.closed:
+                self._condition.wait()
+            self.in_flight += size
+            return not self.closed
+
+    def release(self, size):
+        """
+        Frees bytes acknowledged by the browser.
+        """
+        with self._condition:
+            self.in_flight = max(0, self.in_flight - size)
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
 
 
 class TerminalConsumer(AsyncWebsocketConsumer):
     """
     WebSocket consumer for handling terminal commands within a project context.
     """
+    FRAME_INTERVAL = getattr(settings, 'TERMINAL_FRAME_INTERVAL', 0.05)  # Seconds to coalesce output for
+    FRAME_BYTES = getattr(settings, 'TERMINAL_FRAME_BYTES', 16 * 1024)  # Output size that flushes a frame early
+    MAX_BYTES_IN_FLIGHT = getattr(settings, 'TERMINAL_MAX_BYTES_IN_FLIGHT', 256 * 1024)
+    INPUT_QUEUE_SIZE = getattr(settings, 'TERMINAL_INPUT_QUEUE_SIZE', 256)  # Input messages waiting per connection
+    INTERRUPT = '\x03'  # Ctrl-C
 
     async def connect(self):
         """
@@ -19,53 +75,168 @@ class TerminalConsumer(AsyncWebsocketConsumer):
         self.user = await self.get_user(self.username)
         if not self.user:
             await self.close()
+            return
 
         # Retrieve the project by project_name
         self.project = await self.get_project(self.project_name)
         if not self.project:
             await self.close()
+            return
 
         # Create a room group name based on the user ID and project name
         self.room_group_name = f"terminal_{self.user.id}_{self.project.project_name}"
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+
+        # One container manager per connection so its pooled client is reused for every command
+        from .utils import ProjectContainerManager
+        self.container_manager = ProjectContainerManager(project=self.project, user=self.user)
+
+        # Output is read and input written on the connection's own threads, so acknowledgements
+        # keep flowing while output streams and a stalled shell never holds a Docker pool worker
+        self.output_window = OutputWindow(self.MAX_BYTES_IN_FLIGHT)
+        self.input_queue = queue.Queue(maxsize=self.INPUT_QUEUE_SIZE)
+        self.tasks = set()
+        self.shell = None
         await self.accept()
+        await self.open_shell()
 
     async def disconnect(self, close_code):
         """
-        Remove channel from room group on disconnect.
+        Stop streaming output and writing input, hang up the shell and remove channel from
+        room group on disconnect.
+        """
+        # Connections refused in `connect` never set these up
+        if getattr(self, 'output_window', None):
+            self.output_window.close()
+        if getattr(self, 'input_queue', None):
+            self.discard_input()
+            self.input_queue.put_nowait(None)
+        for task in getattr(self, 'tasks', ()):
+            task.cancel()
+        if getattr(self, 'shell', None):
+            await run_docker_call(self.shell.close)
+        if getattr(self, 'room_group_name', None):
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+
+    async def open_shell(self):
+        """
+        Attach an interactive PTY shell for this connection and start streaming its output.
+        """
+        try:
+            self.shell = await run_docker_call(self.container_manager.open_shell)
+        except Exception as e:
+            await self.send(text_data=json.dumps({'type': 'terminal_error', 'error': str(e)}))
+            return
+
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        shell, input_queue = self.shell, self.input_queue
+
+        def read_shell():
+            try:
+                while True:
+                    chunk = shell.read()
+                    if not chunk or not self.output_window.acquire(len(chunk)):
+                        break
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+        def write_shell():
+            while (data := input_queue.get()) is not None:
+                try:
+                    shell.write(data)
+                except OSError:
+                    break
+
+        # Both live as long as the connection, so they get their own threads
+        threading.Thread(target=read_shell, name=f'shell-out-{self.channel_name}', daemon=True).start()
+        threading.Thread(target=write_shell, name=f'shell-in-{self.channel_name}', daemon=True).start()
+        task = asyncio.ensure_future(self.stream_shell(chunks))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def stream_shell(self, chunks):
+        """
+        Forward shell output until the shell exits.
         """
-        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.forward_output(chunks)
+        await self.send(text_data=json.dumps({'type': 'terminal_closed'}))
 
     async def receive(self, text_data):
         """
-        Handle received message and send terminal command output or error.
+        Handle received message: keystrokes and resizes for the shell, or acknowledgements of
+        rendered output.
         """
         text_data_json = json.loads(text_data)
-        command = text_data_json.get('command', None)
 
-        if command:
-            response = await self.execute_terminal_command(command)
-            await self.send(text_data=json.dumps(response))
+        if 'ack' in text_data_json:
+            self.output_window.release(int(text_data_json['ack']))
+            return
+
+        if 'input' in text_data_json and self.shell:
+            await self.queue_input(str(text_data_json['input']))
+            return
 
-    async def execute_terminal_command(self, command):
+        if 'resize' in text_data_json and self.shell:
+            size = text_data_json['resize']
+            await run_docker_call(self.shell.resize, int(size['rows']), int(size['cols']))
+
+    async def queue_input(self, data):
         """
-        Execute terminal command and return result or error.
+        Queue keystrokes for the shell, refusing them once INPUT_QUEUE_SIZE messages are waiting.
+        Ctrl-C discards the input still queued, so the interrupt reaches the foreground program
+        (as SIGINT, through the PTY) right after what is being written now.
         """
-        from .utils import ProjectContainerManager
-        container_manager = ProjectContainerManager(project=self.project, user=self.user)
-
+        if self.INTERRUPT in data:
+            self.discard_input()
         try:
-            result = await sync_to_async(container_manager.execute_command)(command)
-            return {
-                'type': 'terminal_output',
-                'output': result['formatted_output'],
-                'exit_code': result['exit_code']
-            }
-        except Exception as e:
-            return {
+            self.input_queue.put_nowait(data)
+        except queue.Full:
+            await self.send(text_data=json.dumps({
                 'type': 'terminal_error',
-                'error': str(e)
-            }
+                'error': "Too much input is waiting for the terminal. Press Ctrl-C to interrupt it."
+            }))
+
+    def discard_input(self):
+        while True:
+            try:
+                self.input_queue.get_nowait()
+            except queue.Empty:
+                return
+
+    async def forward_output(self, chunks):
+        """
+        Send output chunks until the end marker, coalesced into one frame per FRAME_INTERVAL
+        or FRAME_BYTES, whichever comes first.
+        """
+        loop = asyncio.get_running_loop()
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        pending, pending_size, deadline = [], 0, None
+
+        while True:
+            timeout = max(0.0, deadline - loop.time()) if pending else None
+            try:
+                chunk = await asyncio.wait_for(chunks.get(), timeout)
+            except asyncio.TimeoutError:
+                chunk = b''
+
+            if chunk:
+                if not pending:
+                    deadline = loop.time() + self.FRAME_INTERVAL
+                pending.append(chunk)
+                pending_size += len(chunk)
+
+            if pending and (not chunk or pending_size >= self.FRAME_BYTES):
+                await self.send(text_data=json.dumps({
+                    'type': 'terminal_stream',
+                    'output': decoder.decode(b''.join(pending), final=chunk is None),
+                    'bytes': pending_size,
+                }))
+                pending, pending_size = [], 0
+
+            if chunk is None:
+                return
 
     @sync_to_async
     def get_user(self, username):
@@ -88,3 +259,49 @@ class TerminalConsumer(AsyncWebsocketConsumer):
             return Project.objects.get(project_name=project_name)
         except Project.DoesNotExist:
             return None
+
+
+class CloneProgressConsumer(AsyncWebsocketConsumer):
+    """
+    WebSocket consumer pushing the progress of the signed-in user's background clones and
+    accepting `{'cancel': job_id}` to stop one.
+    """
+
+    async def connect(self):
+        """
+        Join the user's clone group and send the jobs this process is running for them.
+        """
+        self.user = self.scope['user']
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+
+        from .utils import clone_jobs
+        self.group_name = clone_jobs.group_name(self.user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        for job in clone_jobs.jobs_for(self.user.id):
+            await self.send(text_data=json.dumps({'type': 'clone_progress', 'job': job.as_dict()}))
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'group_name', None):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data):
+        """
+        Relay a cancel request to the whole group, since the job may run in another process.
+        """
+        text_data_json = json.loads(text_data)
+        if 'cancel' in text_data_json:
+            await self.channel_layer.group_send(self.group_name, {
+                'type': 'clone.cancel',
+                'job_id': str(text_data_json['cancel']),
+                'user_id': self.user.id,
+            })
+
+    async def clone_progress(self, event):
+        await self.send(text_data=json.dumps({'type': 'clone_progress', 'job': event['job']}))
+
+    async def clone_cancel(self, event):
+        from .utils import clone_jobs
+        clone_jobs.cancel(event['job_id'], event['user_id'])
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+
+class PeriodicWorkerCommand(BaseCommand):
+    """
+    Runs a `PeriodicWorker` from the command line, either once or continuously on its interval.
+
+    Subclasses set `worker` and describe one run: `once_help` for the `--once` flag,
+    `interval_setting` for the default interval, `done_message` (formatted with the count
+    `run_once` returns) and `running_message` (formatted with the interval).
+    """
+    worker = None
+    once_help = "Run once and exit."
+    interval_setting = None
+    done_message = "Handled {count} item(s)."
+    running_message = "Running every {interval}s..."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help=self.once_help)
+        parser.add_argument('--interval', type=int, help=f"Seconds between runs (defaults to {self.interval_setting}).")
+
+    def handle(self, *args, **options):
+        if options['interval']:
+            self.worker.interval = options['interval']
+
+        if options['once']:
+            count = self.worker.run_once()
+            self.stdout.write(self.style.SUCCESS(self.done_message.format(count=count)))
+            return
+
+        self.stdout.write(self.running_message.format(interval=self.worker.interval))
+        try:
+            self.worker.run_forever()
+        except KeyboardInterrupt:
+            self.worker.stop()
@@ -0,0 +1,14 @@
+from project.management.base import PeriodicWorkerCommand
+from project.utils import idle_container_reaper
+
+
+class Command(PeriodicWorkerCommand):
+    """
+    Pauses and stops idle terminal containers, either once or continuously on the sweep interval.
+    """
+    help = "Pause, then stop, terminal containers whose Docker session has been idle (see DOCKER_IDLE_TIMEOUTS)."
+    worker = idle_container_reaper
+    once_help = "Run a single sweep and exit."
+    interval_setting = 'DOCKER_REAPER_INTERVAL'
+    done_message = "Paused or stopped {count} idle container(s)."
+    running_message = "Sweeping for idle containers every {interval}s..."
@@ -0,0 +1,14 @@
+from project.management.base import PeriodicWorkerCommand
+from project.utils import storage_reconciler
+
+
+class Command(PeriodicWorkerCommand):
+    """
+    Recomputes users' and projects' stored storage usage from disk, either once or continuously.
+    """
+    help = "Correct stored storage usage by scanning users' project directories."
+    worker = storage_reconciler
+    once_help = "Reconcile a single batch of users and exit."
+    interval_setting = 'STORAGE_RECONCILE_INTERVAL'
+    done_message = "Reconciled storage for {count} user(s)."
+    running_message = "Reconciling storage every {interval}s..."
@@ -0,0 +1,14 @@
+from project.management.base import PeriodicWorkerCommand
+from project.utils import git_mirrors
+
+
+class Command(PeriodicWorkerCommand):
+    """
+    Fetches the shared git mirrors that clones borrow objects from, either once or continuously.
+    """
+    help = "Refresh the shared bare mirrors of popular repositories."
+    worker = git_mirrors
+    once_help = "Refresh stale mirrors once and exit."
+    interval_setting = 'GIT_MIRROR_REFRESH_INTERVAL'
+    done_message = "Refreshed {count} git mirror(s)."
+    running_message = "Refreshing git mirrors every {interval}s..."
@@ -0,0 +1,14 @@
+from project.management.base import PeriodicWorkerCommand
+from project.utils import container_stats_sampler
+
+
+class Command(PeriodicWorkerCommand):
+    """
+    Records resource usage of running terminal containers, either once or continuously.
+    """
+    help = "Sample CPU, memory and process usage of running terminal containers into ContainerUsageSample."
+    worker = container_stats_sampler
+    once_help = "Take a single sample and exit."
+    interval_setting = 'DOCKER_STATS_INTERVAL'
+    done_message = "Recorded {count} container sample(s)."
+    running_message = "Sampling container stats every {interval}s..."
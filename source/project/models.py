@@ -17,12 +17,14 @@ class Project(models.Model):
     project_path = models.CharField(max_length=100)
     repository = models.CharField(max_length=100, blank=True, null=True)
     project_description = TextField(blank=True, null=True)
+    ignore_patterns = TextField(blank=True, null=True, help_text="Extra .gitignore-style patterns, one per line, hidden from the file tree and git scans.")
     is_public = models.BooleanField(default=False)
     likes = models.PositiveIntegerField(default=0)
     liked_by = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='liked_projects', blank=True)
     modified_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
     collaborators = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='collaborating_projects', blank=True)
+    storage_used = models.BigIntegerField(default=0, help_text="Bytes on disk, kept current by file actions and periodic reconciliation.")
 
     def __str__(self):
         return self.project_name
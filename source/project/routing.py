@@ -2,5 +2,6 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
+    re_path(r'ws/clones$', consumers.CloneProgressConsumer.as_asgi()),
     re_path(r'ws/(?P<username>\w+)/(?P<project_name>[\w\-]+)/editor$', consumers.TerminalConsumer.as_asgi()),
 ]
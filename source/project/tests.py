@@ -0,0 +1,642 @@
+import io
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from github import RateLimitExceededException
+
+from project.consumers import TerminalConsumer
+from project.models import Project
+from project.routing import websocket_urlpatterns
+from project.utils import (
+    SHELL_COMMAND, ByteBudget, DirectoryListingCache, ExtractionError, FileVersionConflict, GitHubRateLimited,
+    GitHubRequestScheduler, GitHubUtils, IdleContainerReaper, IgnoreMatcher, ProjectContainerManager, ShellSession,
+    apply_file_edits, extract_zip, file_version, git_mirrors, git_status, resolve_project_path, stream_zip,
+)
+from user.models import DockerSession
+
+
+def temp_dir(test_case):
+    path = os.path.realpath(tempfile.mkdtemp())
+    test_case.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+def write_file(path, content=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb' if isinstance(content, bytes) else 'w') as file:
+        file.write(content)
+
+
+class IdleContainerReaperClaimTests(TestCase):
+    def setUp(self):
+        user, = get_user_model().objects.bulk_create([get_user_model()(username='reaper')])  # Skips the profile signal
+        self.session = DockerSession.objects.create(
+            user=user, container_id='abc123', container_name='ide_reaper', status='running',
+            last_activity_at=timezone.now() - timedelta(hours=1),
+        )
+
+    def status(self):
+        return DockerSession.objects.get(pk=self.session.pk).status
+
+    def test_claims_idle_session(self):
+        self.assertEqual(IdleContainerReaper._claim(self.session, 'paused'), 1)
+        self.assertEqual(self.status(), 'paused')
+
+    def test_skips_session_active_since_selected(self):
+        DockerSession.objects.filter(pk=self.session.pk).update(last_activity_at=timezone.now())
+        self.assertEqual(IdleContainerReaper._claim(self.session, 'paused'), 0)
+        self.assertEqual(self.status(), 'running')
+
+    def test_skips_session_claimed_by_another_sweep(self):
+        DockerSession.objects.filter(pk=self.session.pk).update(status='stopped')
+        self.assertEqual(IdleContainerReaper._claim(self.session, 'paused'), 0)
+        self.assertEqual(self.status(), 'stopped')
+
+
+class FakeContainer:
+    """
+    Stands in for a docker-py container with the given execs, keyed by id.
+    """
+
+    def __init__(self, execs):
+        self.attrs = {'ExecIDs': list(execs)}
+        self.client = SimpleNamespace(api=SimpleNamespace(exec_inspect=lambda exec_id: execs[exec_id]))
+        self.status = 'running'
+        self.paused = False
+
+    def pause(self):
+        self.paused = True
+
+
+class IdleContainerActivityTests(TestCase):
+    SHELL = {'Running': True, 'ProcessConfig': {'entrypoint': SHELL_COMMAND[0],
+                                                'arguments': [*SHELL_COMMAND[1:], '/tmp/.ide-shell.pid']}}
+    BUILD = {'Running': True, 'ProcessConfig': {'entrypoint': '/bin/bash', 'arguments': ['-c', 'make']}}
+    FINISHED = {'Running': False, 'ProcessConfig': {'entrypoint': '/bin/bash', 'arguments': ['-c', 'ls']}}
+
+    def setUp(self):
+        self.user, = get_user_model().objects.bulk_create([get_user_model()(username='builder')])
+        self.idle_since = timezone.now() - timedelta(hours=1)
+        self.session = DockerSession.objects.create(
+            user=self.user, container_id='abc123', container_name='ide_builder', status='running',
+            last_activity_at=self.idle_since,
+        )
+
+    def pause(self, container):
+        client = SimpleNamespace(containers=SimpleNamespace(get=lambda container_id: container))
+        with mock.patch('project.utils.docker_endpoints.client', return_value=client):
+            return IdleContainerReaper.pause_session(self.session)
+
+    def test_pauses_container_with_only_a_shell_open(self):
+        container = FakeContainer({'shell': self.SHELL, 'ls': self.FINISHED})
+        self.assertTrue(self.pause(container))
+        self.assertTrue(container.paused)
+        self.assertEqual(DockerSession.objects.get(pk=self.session.pk).status, 'paused')
+
+    def test_skips_container_running_a_command(self):
+        container = FakeContainer({'shell': self.SHELL, 'make': self.BUILD})
+        self.assertFalse(self.pause(container))
+        self.assertFalse(container.paused)
+        session = DockerSession.objects.get(pk=self.session.pk)
+        self.assertEqual(session.status, 'running')
+        self.assertGreater(session.last_activity_at, self.idle_since)
+
+    def test_long_running_program_output_counts_as_activity(self):
+        manager = ProjectContainerManager.__new__(ProjectContainerManager)
+        manager.user, manager.last_activity_written = self.user, 0.0
+        sock = mock.Mock(recv=mock.Mock(return_value=b'compiling\n'))
+        shell = ShellSession(manager, 'shell', '/tmp/.ide-shell.pid', sock)
+
+        def output():
+            while True:
+                yield shell.read()
+        output = output()
+
+        def last_activity():
+            return DockerSession.objects.get(pk=self.session.pk).last_activity_at
+
+        later = 1000.0 + ProjectContainerManager.ACTIVITY_WRITE_INTERVAL
+        with mock.patch('project.utils.time.monotonic', return_value=1000.0):
+            next(output)
+            self.assertGreater(last_activity(), self.idle_since)
+            DockerSession.objects.filter(pk=self.session.pk).update(last_activity_at=self.idle_since)
+            next(output)  # Within ACTIVITY_WRITE_INTERVAL, so not written
+            self.assertEqual(last_activity(), self.idle_since)
+        with mock.patch('project.utils.time.monotonic', return_value=later):
+            next(output)
+            self.assertGreater(last_activity(), self.idle_since)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class TerminalConsumerTests(TestCase):
+    @async_to_sync
+    async def connect(self, path):
+        """
+        Opens a WebSocket to `path` and returns the consumer's answer: accept or close.
+        """
+        communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), {
+            'type': 'websocket', 'path': path, 'headers': [], 'subprotocols': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        answer = await communicator.receive_output(timeout=5)
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(timeout=5)
+        return answer['type']
+
+    def test_refuses_unknown_user(self):
+        self.assertEqual(self.connect('ws/nobody/project/editor'), 'websocket.close')
+
+    def test_refuses_unknown_project(self):
+        get_user_model().objects.bulk_create([get_user_model()(username='coder')])
+        self.assertEqual(self.connect('ws/coder/missing/editor'), 'websocket.close')
+
+
+class TerminalInputTests(SimpleTestCase):
+    def setUp(self):
+        self.consumer = TerminalConsumer()
+        self.consumer.input_queue = queue.Queue(maxsize=3)
+        self.consumer.send = mock.AsyncMock()
+
+    def queued(self):
+        return list(self.consumer.input_queue.queue)
+
+    def test_refuses_input_past_queue_size(self):
+        for data in ('l', 's', '\r', 'x'):
+            async_to_sync(self.consumer.queue_input)(data)
+        self.assertEqual(self.queued(), ['l', 's', '\r'])
+        self.assertIn('terminal_error', self.consumer.send.call_args.kwargs['text_data'])
+
+    def test_interrupt_discards_queued_input(self):
+        for data in ('yes\r', 'yes\r', '\x03'):
+            async_to_sync(self.consumer.queue_input)(data)
+        self.assertEqual(self.queued(), ['\x03'])
+        async_to_sync(self.consumer.queue_input)('ls\r')
+        self.assertEqual(self.queued(), ['\x03', 'ls\r'])
+        self.consumer.send.assert_not_called()
+
+
+class DirectoryListingCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.project_path = temp_dir(self)
+        for name in ('src/main.py', 'Docs/index.md', 'b.txt', 'A.txt', 'c.txt', '.env'):
+            write_file(os.path.join(self.project_path, name), 'x')
+        self.cache = DirectoryListingCache(max_dirs=4)
+
+    def names(self, relative_dir='', limit=2):
+        names, cursor = [], None
+        while True:
+            page = self.cache.page(self.project_path, relative_dir, cursor=cursor, limit=limit)
+            names += [entry['name'] for entry in page['entries']]
+            cursor = page['next_cursor']
+            if not cursor:
+                return names
+
+    def test_pages_follow_cursor(self):
+        self.assertEqual(self.names(), ['Docs', 'src', 'A.txt', 'b.txt', 'c.txt'])
+
+    def test_cursor_survives_removed_entry(self):
+        page = self.cache.page(self.project_path, '', limit=3)
+        self.assertEqual(page['next_cursor'], 'f/A.txt')
+        os.remove(os.path.join(self.project_path, 'A.txt'))
+        page = self.cache.page(self.project_path, '', cursor=page['next_cursor'], limit=3)
+        self.assertEqual([entry['name'] for entry in page['entries']], ['b.txt', 'c.txt'])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_lists_subdirectory(self):
+        page = self.cache.page(self.project_path, 'src')
+        self.assertEqual(page['path'], 'src')
+        self.assertEqual([(entry['relative_path'], entry['type']) for entry in page['entries']], [('src/main.py', 'file')])
+
+    def test_flags_directories_with_visible_children(self):
+        os.makedirs(os.path.join(self.project_path, 'empty'))
+        write_file(os.path.join(self.project_path, 'hidden', '.cache'), 'x')
+        write_file(os.path.join(self.project_path, 'logs', 'app.log'), 'x')
+        self.cache.page(self.project_path, 'src')  # Answered from the cached listing
+        matcher = IgnoreMatcher(self.project_path, ['*.log'])
+        page = self.cache.page(self.project_path, '', matcher=matcher)
+        flags = {entry['name']: entry['has_children'] for entry in page['entries'] if entry['type'] == 'directory'}
+        self.assertEqual(flags, {'Docs': True, 'empty': False, 'hidden': False, 'logs': False, 'src': True})
+
+    def test_refuses_paths_outside_project(self):
+        outside = temp_dir(self)
+        os.symlink(outside, os.path.join(self.project_path, 'escape'))
+        for relative_dir in ('..', '../..', '/etc', 'src/../..', 'escape'):
+            with self.subTest(relative_dir=relative_dir), self.assertRaises(ValueError):
+                self.cache.page(self.project_path, relative_dir)
+
+    def test_resolves_paths_inside_project(self):
+        self.assertEqual(resolve_project_path(self.project_path, 'src/../Docs'), os.path.join(self.project_path, 'Docs'))
+        self.assertEqual(resolve_project_path(self.project_path, ''), self.project_path)
+
+
+class IgnoreMatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.project_path = temp_dir(self)
+        write_file(os.path.join(self.project_path, '.gitignore'),
+                   "# build output\n/build\n*.log\n!keep.log\ndocs/**/draft.md\nnode_modules/\n")
+        write_file(os.path.join(self.project_path, 'sub', '.gitignore'), "!*.log\nlocal.txt\n")
+        self.matcher = IgnoreMatcher(self.project_path)
+
+    def test_anchored_pattern_matches_only_at_its_base(self):
+        self.assertTrue(self.matcher.ignored('build', is_dir=True))
+        self.assertFalse(self.matcher.ignored('src/build', is_dir=True))
+
+    def test_unanchored_pattern_matches_at_any_depth(self):
+        self.assertTrue(self.matcher.ignored('app.log'))
+        self.assertTrue(self.matcher.ignored('src/deep/app.log'))
+        self.assertFalse(self.matcher.ignored('app.log.txt'))
+
+    def test_negation_reincludes(self):
+        self.assertFalse(self.matcher.ignored('keep.log'))
+        self.assertFalse(self.matcher.ignored('src/keep.log'))
+
+    def test_double_star_matches_any_number_of_directories(self):
+        self.assertTrue(self.matcher.ignored('docs/draft.md'))
+        self.assertTrue(self.matcher.ignored('docs/a/b/draft.md'))
+        self.assertFalse(self.matcher.ignored('draft.md'))
+        self.assertFalse(self.matcher.ignored('other/docs/draft.md'))
+
+    def test_directory_only_pattern(self):
+        self.assertTrue(self.matcher.ignored('node_modules', is_dir=True))
+        self.assertTrue(self.matcher.ignored('web/node_modules', is_dir=True))
+        self.assertFalse(self.matcher.ignored('node_modules', is_dir=False))
+
+    def test_nested_gitignore_overrides_parent(self):
+        self.assertFalse(self.matcher.ignored('sub/app.log'))
+        self.assertTrue(self.matcher.ignored('sub/local.txt'))
+        self.assertFalse(self.matcher.ignored('local.txt'))
+
+    def test_extra_patterns_have_lowest_precedence(self):
+        matcher = IgnoreMatcher(self.project_path, ['*.txt', '!app.log'])
+        self.assertTrue(matcher.ignored('notes.txt'))
+        self.assertTrue(matcher.ignored('app.log'))
+
+    def test_git_directory_is_always_ignored(self):
+        self.assertTrue(self.matcher.ignored('.git', is_dir=True))
+        self.assertTrue(self.matcher.ignored('.git/config'))
+
+
+class ApplyFileEditsTests(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(temp_dir(self), 'notes.txt')
+        write_file(self.path, b'hello\r\nworld\n')
+
+    def read(self):
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def test_applies_edits_in_order(self):
+        version = file_version(self.path)
+        new_version, size_change = apply_file_edits(self.path, version, [
+            {'offset': 0, 'remove': 5, 'text': 'goodbye'},
+            {'offset': 8, 'remove': 5, 'text': 'there'},
+        ])
+        self.assertEqual(self.read(), b'goodbye\nthere\n')
+        self.assertEqual(size_change, 1)
+        self.assertEqual(new_version, file_version(self.path))
+        self.assertNotEqual(new_version, version)
+
+    def test_offsets_count_utf16_code_units(self):
+        write_file(self.path, 'a\U0001F600b'.encode())
+        apply_file_edits(self.path, file_version(self.path), [{'offset': 3, 'remove': 1, 'text': 'c'}])
+        self.assertEqual(self.read().decode(), 'a\U0001F600c')
+
+    def test_same_size_rewrite_conflicts(self):
+        version = file_version(self.path)
+        write_file(self.path, b'HELLO\r\nworld\n')
+        with self.assertRaises(FileVersionConflict) as raised:
+            apply_file_edits(self.path, version, [{'offset': 0, 'remove': 5, 'text': 'bye'}])
+        self.assertEqual(raised.exception.version, file_version(self.path))
+        self.assertEqual(self.read(), b'HELLO\r\nworld\n')
+
+    def test_rejects_edit_outside_file(self):
+        with self.assertRaises(ValueError):
+            apply_file_edits(self.path, file_version(self.path), [{'offset': 10, 'remove': 5, 'text': ''}])
+        self.assertEqual(self.read(), b'hello\r\nworld\n')
+
+    def test_rejects_malformed_edits(self):
+        for edits in ({'offset': 0}, [[0, 5, 'bye']], [{'offset': '0'}], [{'offset': 0, 'remove': None}],
+                      [{'offset': 0, 'text': 5}], [{'remove': 5}]):
+            with self.subTest(edits=edits), self.assertRaises(ValueError):
+                apply_file_edits(self.path, file_version(self.path), edits)
+        self.assertEqual(self.read(), b'hello\r\nworld\n')
+
+
+@override_settings(STORAGE_RECONCILE_IN_PROCESS=False)
+class IdeViewApplyEditsTests(TestCase):
+    def setUp(self):
+        self.user, = get_user_model().objects.bulk_create([get_user_model()(username='editor', is_active=True)])
+        project_path = temp_dir(self)
+        self.path = os.path.join(project_path, 'notes.txt')
+        write_file(self.path, 'hello\n')
+        Project.objects.create(user=self.user, project_name='notes', project_path=project_path)
+        self.client.force_login(self.user)
+
+    def apply_edits(self, edits):
+        return self.client.post(reverse('ide', args=['editor', 'notes']), {
+            'apply_edits': '1', 'file_path': 'notes.txt', 'base_version': file_version(self.path), 'edits': edits,
+        })
+
+    def test_applies_edits(self):
+        response = self.apply_edits('[{"offset": 0, "remove": 5, "text": "bye"}]')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], file_version(self.path))
+
+    def test_rejects_malformed_edits(self):
+        for edits in ('{"offset": 0}', '[1, 2]', '[{"offset": "zero"}]', 'not json'):
+            with self.subTest(edits=edits):
+                response = self.apply_edits(edits)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        with open(self.path) as file:
+            self.assertEqual(file.read(), 'hello\n')
+
+
+class StreamZipTests(SimpleTestCase):
+    def setUp(self):
+        self.project_path = temp_dir(self)
+        self.files = {
+            'src/main.py': b'print("hello")\n' * 1000,
+            'data.bin': os.urandom(200000),
+            '.env': b'SECRET=1\n',
+            '.gitignore': b'*.log\n',
+        }
+        for name, content in self.files.items():
+            write_file(os.path.join(self.project_path, name), content)
+        write_file(os.path.join(self.project_path, 'debug.log'), 'ignored')
+        write_file(os.path.join(self.project_path, '.git', 'config'), '[core]\n')
+        os.makedirs(os.path.join(self.project_path, 'empty'))
+
+    def archive(self, **kwargs):
+        data = b''.join(stream_zip(self.project_path, IgnoreMatcher(self.project_path), **kwargs))
+        return zipfile.ZipFile(io.BytesIO(data))
+
+    def test_round_trips_project_files(self):
+        with self.archive() as archive:
+            self.assertEqual(set(archive.namelist()), {*self.files, 'src/', 'empty/'})
+            for name, content in self.files.items():
+                self.assertEqual(archive.read(name), content)
+
+    def test_stores_incompressible_files(self):
+        with self.archive() as archive:
+            self.assertEqual(archive.getinfo('data.bin').compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(archive.getinfo('src/main.py').compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_yields_bounded_chunks(self):
+        chunks = list(stream_zip(self.project_path, chunk_size=4096))
+        self.assertGreater(len(chunks), 10)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), 3 * 4096)
+
+
+class ExtractZipTests(SimpleTestCase):
+    def setUp(self):
+        self.target = os.path.join(temp_dir(self), 'project')
+        os.makedirs(self.target)
+
+    @staticmethod
+    def upload(members):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, content in members:
+                archive.writestr(name, content)
+        data.seek(0)
+        return data
+
+    def test_extracts_members_and_reports_progress(self):
+        progress = []
+        written = extract_zip(self.upload([('a/b.txt', b'hi'), ('c.txt', b'x' * 100)]), self.target, 1000,
+                              progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual(written, 102)
+        with open(os.path.join(self.target, 'a', 'b.txt'), 'rb') as file:
+            self.assertEqual(file.read(), b'hi')
+        self.assertEqual(progress[-1], (102, 102))
+
+    def test_refuses_paths_escaping_target(self):
+        for name in ('../evil.txt', 'a/../../evil.txt', 'a\\..\\..\\evil.txt', 'C:/evil.txt'):
+            with self.subTest(name=name), self.assertRaises(ExtractionError):
+                extract_zip(self.upload([(name, b'evil')]), self.target, 1000)
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(self.target), 'evil.txt')))
+
+    def test_keeps_absolute_paths_inside_target(self):
+        extract_zip(self.upload([('/etc/evil.txt', b'evil')]), self.target, 1000)
+        self.assertTrue(os.path.isfile(os.path.join(self.target, 'etc', 'evil.txt')))
+
+    def test_refuses_paths_through_symlinks(self):
+        outside = temp_dir(self)
+        os.symlink(outside, os.path.join(self.target, 'link'))
+        with self.assertRaises(ExtractionError):
+            extract_zip(self.upload([('link/evil.txt', b'evil')]), self.target, 1000)
+        self.assertEqual(os.listdir(outside), [])
+
+    def test_refuses_archive_over_budget_before_writing(self):
+        with self.assertRaises(ExtractionError):
+            extract_zip(self.upload([('a.txt', b'x' * 60), ('b.txt', b'y' * 60)]), self.target, 100)
+        self.assertEqual(os.listdir(self.target), [])
+
+    def test_refuses_zip_bombs(self):
+        with self.assertRaises(ExtractionError):
+            extract_zip(self.upload([('zeros', bytes(4 * 1024 * 1024))]), self.target, 10 ** 9)
+
+    def test_refuses_invalid_archive(self):
+        with self.assertRaises(ExtractionError):
+            extract_zip(io.BytesIO(b'not a zip'), self.target, 1000)
+
+    def test_budget_stops_writes_past_limit(self):
+        budget = ByteBudget(100)
+        self.assertEqual(budget.consume(60), 60)
+        with self.assertRaises(ExtractionError):
+            budget.consume(60)
+
+
+@skipUnless(shutil.which('git'), "git is not installed")
+class GitStatusTests(SimpleTestCase):
+    def setUp(self):
+        self.project_path = temp_dir(self)
+        self.git('init', '-q', '-b', 'main')
+        write_file(self.path('.gitignore'), '*.log\n')
+        write_file(self.path('src/app.py'), 'print("app")\n')
+        write_file(self.path('src/util.py'), 'print("util")\n')
+        write_file(self.path('README.md'), '# Readme\n')
+        self.commit('Initial commit')
+
+    def path(self, name):
+        return os.path.join(self.project_path, name)
+
+    def git(self, *args):
+        subprocess.run(['git', '-c', 'user.name=Test', '-c', 'user.email=test@example.com', *args],
+                       cwd=self.project_path, check=True, capture_output=True,
+                       env={**os.environ, 'GIT_CONFIG_NOSYSTEM': '1', 'HOME': self.project_path})
+
+    def commit(self, message):
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', message)
+
+    def status(self):
+        return {change['file']: change['change_type'] for change in git_status(self.project_path)}
+
+    def test_clean_checkout(self):
+        self.assertEqual(self.status(), {})
+        time.sleep(1.1)  # Past the racy window, so files are compared by stat data alone
+        self.assertEqual(self.status(), {})
+
+    def test_worktree_and_staged_changes(self):
+        write_file(self.path('src/app.py'), 'print("changed")\n')
+        os.remove(self.path('README.md'))
+        write_file(self.path('staged.txt'), 'new\n')
+        self.git('add', 'staged.txt')
+        self.git('rm', '-q', '--cached', 'src/util.py')
+        write_file(self.path('notes/todo.txt'), 'todo\n')
+        write_file(self.path('debug.log'), 'ignored\n')
+        self.assertEqual(self.status(), {
+            'README.md': 'Deleted',
+            'notes/todo.txt': 'Untracked',
+            'src/app.py': 'Modified',
+            'src/util.py': 'Untracked',
+            'staged.txt': 'Added',
+        })
+
+    def test_executable_bit_change(self):
+        os.chmod(self.path('README.md'), 0o755)
+        self.assertEqual(self.status(), {'README.md': 'Modified'})
+
+    def test_reads_packed_objects(self):
+        for line in range(5):
+            with open(self.path('src/app.py'), 'a') as file:
+                file.write(f'print({line})\n' * 50)
+            self.commit(f'Change {line}')
+        self.git('gc', '-q', '--aggressive')
+        self.assertEqual(self.status(), {})
+        write_file(self.path('src/util.py'), 'print("changed")\n')
+        self.git('add', 'src/util.py')
+        self.assertEqual(self.status(), {'src/util.py': 'Modified'})
+
+    def test_unborn_branch(self):
+        shutil.rmtree(self.path('.git'))
+        self.git('init', '-q')
+        self.git('add', 'README.md')
+        self.assertEqual(self.status(), {'README.md': 'Added', '.gitignore': 'Untracked',
+                                         'src/app.py': 'Untracked', 'src/util.py': 'Untracked'})
+
+    def test_merge_conflict(self):
+        self.git('checkout', '-q', '-b', 'other')
+        write_file(self.path('README.md'), 'other\n')
+        self.commit('Other')
+        self.git('checkout', '-q', 'main')
+        write_file(self.path('README.md'), 'main\n')
+        self.commit('Main')
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.git('merge', '-q', 'other')
+        self.assertEqual(self.status(), {'README.md': 'Conflicted'})
+
+    def test_untracked_nested_repository(self):
+        os.makedirs(self.path('vendor/lib'))
+        subprocess.run(['git', 'init', '-q', self.path('vendor/lib')], check=True, capture_output=True)
+        write_file(self.path('vendor/lib/code.py'), '')
+        self.assertEqual(self.status(), {'vendor/lib/': 'Untracked'})
+
+    def test_does_not_run_repository_config(self):
+        marker = os.path.join(temp_dir(self), 'ran')
+        self.git('config', 'core.fsmonitor', f'touch {marker}')
+        write_file(self.path('.gitattributes'), '* filter=evil\n')
+        self.git('config', 'filter.evil.clean', f'touch {marker}')
+        self.assertEqual(self.status(), {'.gitattributes': 'Untracked'})
+        self.assertFalse(os.path.exists(marker))
+
+    def test_refuses_symlinks_out_of_repository(self):
+        os.remove(self.path('.git/HEAD'))
+        os.symlink('/etc/hostname', self.path('.git/HEAD'))
+        with self.assertRaises(OSError):
+            git_status(self.project_path)
+
+    def test_refuses_alternates_outside_git_mirrors(self):
+        other = temp_dir(self)
+        self.assertFalse(other.startswith(os.path.realpath(git_mirrors.root)))
+        write_file(self.path('.git/objects/info/alternates'), f'{other}\n')
+        with self.assertRaises(ValueError):
+            git_status(self.project_path)
+
+    def test_refuses_git_file(self):
+        shutil.rmtree(self.path('.git'))
+        write_file(self.path('.git'), 'gitdir: /somewhere/else\n')
+        with self.assertRaises(ValueError):
+            git_status(self.project_path)
+
+    def test_unreadable_checkout_without_github_token(self):
+        os.remove(self.path('.git/HEAD'))
+        os.symlink('/etc/hostname', self.path('.git/HEAD'))
+        with self.assertRaises(OSError):
+            GitHubUtils.uncommitted_files(None, 1, self.project_path, 'https://github.com/owner/repo', (), False)
+
+
+class FakeGitHubClient:
+    """
+    Stands in for a PyGithub client, reporting a fixed rate limit state.
+    """
+
+    def __init__(self, remaining, reset_in, limit=5000):
+        self.requester = SimpleNamespace(rate_limiting=(remaining, limit), rate_limiting_resettime=time.time() + reset_in)
+
+
+class GitHubRequestSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = GitHubRequestScheduler(reserve=10, max_defer=5, max_wait=20, max_retries=2, max_concurrent=2)
+        self.client = FakeGitHubClient(remaining=4000, reset_in=3600)
+        sleep = mock.patch('project.utils.time.sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    @staticmethod
+    def rate_limited(headers=None):
+        return RateLimitExceededException(403, {'message': 'API rate limit exceeded'}, headers or {})
+
+    def test_retries_rate_limited_call(self):
+        responses = [self.rate_limited({'Retry-After': '3'}), 'done']
+
+        def call():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        self.assertEqual(self.scheduler.call(self.client, call), 'done')
+        self.assertEqual(self.scheduler.budget('anonymous').retries, 1)
+        self.assertAlmostEqual(self.sleep.call_args[0][0], 3, delta=0.5)
+
+    def test_gives_up_after_max_retries(self):
+        call = mock.Mock(side_effect=self.rate_limited({'Retry-After': '1'}))
+        with self.assertRaises(GitHubRateLimited):
+            self.scheduler.call(self.client, call)
+        self.assertEqual(call.call_count, 3)
+
+    def test_defers_background_call_below_reserve(self):
+        client = FakeGitHubClient(remaining=5, reset_in=3600)
+        self.scheduler.call(client, lambda: None)
+        call = mock.Mock()
+        with self.assertRaises(GitHubRateLimited) as raised:
+            self.scheduler.call(client, call, interactive=False)
+        call.assert_not_called()
+        self.assertGreater(raised.exception.retry_in, 3000)
+        self.assertEqual(self.scheduler.budget('anonymous').deferred, 1)
+        self.scheduler.call(client, call)  # The reserve is kept for the user's own actions
+        call.assert_called_once()
+
+    def test_background_call_waits_for_near_reset(self):
+        client = FakeGitHubClient(remaining=5, reset_in=2)
+        self.scheduler.call(client, lambda: None)
+        self.assertEqual(self.scheduler.call(client, lambda: 'done', interactive=False), 'done')
+        self.assertAlmostEqual(self.sleep.call_args[0][0], 2, delta=0.5)
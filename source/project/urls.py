@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import ProjectView, IdeView
+from .views import ProjectView, IdeView, GitHubMetricsView
 
 urlpatterns = [
+    path('metrics/github/', GitHubMetricsView.as_view(), name='github_metrics'),
     path('<str:username>/<str:project_name>/', ProjectView.as_view(), name='project'),
     path('<str:username>/<str:project_name>/editor', IdeView.as_view(), name='ide'),
 ]
@@ -1,23 +1,2244 @@
+import abc
+import asyncio
+import bisect
 import hashlib
-from threading import Timer
+import itertools
+import logging
+import mmap
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import uuid
+import weakref
+import zipfile
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from stat import S_ISDIR, S_ISLNK, S_ISREG
+from threading import Lock, Thread, Event, Semaphore, Timer
+from urllib.parse import urlparse
 import docker
 import os
 import re
 import base64
-from github import Github
+import socket
+import struct
+from github import Github, RateLimitExceededException
 from github import InputGitTreeElement
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from urllib3.util.retry import Retry
 
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections
+from django.db.models import F, Q
 from django.http import HttpResponseRedirect
 from django.utils import timezone
-from user.models import DockerSession
+from user.models import DockerSession, Subscription, ContainerUsageSample
+from .models import Project
+
+
+logger = logging.getLogger(__name__)
+
+
+class DockerClientPool:
+    """
+    Process-wide, bounded pool of Docker API clients.
+
+    Each client keeps its own keep-alive connection pool to the daemon, so handing out
+    an existing client avoids opening a new connection for every terminal command.
+    """
+
+    def __init__(self, size, max_connections):
+        self.size = size
+        self.max_connections = max_connections
+        self._clients = {}
+        self._cycles = {}
+        self._lock = Lock()
+
+    def get(self, base_url=None):
+        """
+        Returns a client for the given daemon (or the environment default), creating
+        clients lazily until the pool is full and then rotating through them.
+        """
+        with self._lock:
+            clients = self._clients.setdefault(base_url, [])
+            if len(clients) < self.size:
+                clients.append(self._create_client(base_url))
+                return clients[-1]
+            cycle = self._cycles.get(base_url)
+            if cycle is None:
+                cycle = self._cycles[base_url] = itertools.cycle(clients)
+            return next(cycle)
+
+    def _create_client(self, base_url):
+        """
+        Builds a Docker client with a keep-alive connection pool of the configured size.
+        """
+        if base_url:
+            return docker.DockerClient(base_url=base_url, max_pool_size=self.max_connections)
+        return docker.from_env(max_pool_size=self.max_connections)
+
+    def close(self):
+        """
+        Closes every pooled client and empties the pool.
+        """
+        with self._lock:
+            for clients in self._clients.values():
+                for client in clients:
+                    client.close()
+            self._clients.clear()
+            self._cycles.clear()
+
+
+class ContainerHandleCache:
+    """
+    In-memory cache of container handles keyed by user id.
+
+    Entries are dropped on container lifecycle events (create, stop, remove) so that a
+    cached handle is only reused while the container it points to is known to be running.
+    """
+
+    def __init__(self):
+        self._handles = {}
+        self._lock = Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            return self._handles.get(user_id)
+
+    def set(self, user_id, container):
+        with self._lock:
+            self._handles[user_id] = container
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._handles.pop(user_id, None)
+
+
+class DockerEndpointRegistry:
+    """
+    Registry of the Docker daemons terminal containers can be placed on.
+
+    Each endpoint has a capacity weight that scales the memory and CPUs its daemon reports.
+    New containers go to the endpoint with the most headroom left after the limits of the
+    sessions already running or paused there. Every endpoint must see project directories
+    at the same host paths (local daemons, or shared storage) since they are bind-mounted.
+    """
+    INFO_TTL = 30  # Seconds a daemon's reported capacity is cached
+
+    def __init__(self, endpoints):
+        endpoints = endpoints or [{'name': 'default'}]
+        self.endpoints = {
+            endpoint['name']: {
+                'base_url': endpoint.get('base_url') or None,
+                'weight': float(endpoint.get('weight') or 1),
+            } for endpoint in endpoints
+        }
+        self.default = endpoints[0]['name']
+        self._info = {}
+        self._lock = Lock()
+
+    def client(self, name=None):
+        """
+        Returns a pooled client for the named endpoint, or for the default endpoint.
+        """
+        endpoint = self.endpoints.get(name) or self.endpoints[self.default]
+        return docker_client_pool.get(endpoint['base_url'])
+
+    def capacity(self, name):
+        """
+        Returns the weighted memory (bytes) and CPUs of an endpoint's daemon.
+        """
+        with self._lock:
+            fetched_at, info = self._info.get(name, (0, None))
+        if info is None or time.monotonic() - fetched_at > self.INFO_TTL:
+            info = self.client(name).info()
+            with self._lock:
+                self._info[name] = (time.monotonic(), info)
+
+        weight = self.endpoints[name]['weight']
+        return {'memory': info['MemTotal'] * weight, 'cpus': info['NCPU'] * weight}
+
+    def committed(self):
+        """
+        Returns the memory and CPU limits of running and paused sessions, summed per endpoint.
+        """
+        committed = {}
+        sessions = DockerSession.objects.filter(status__in=['running', 'paused']).values_list(
+            'endpoint', 'user__subscription__mem_limit', 'user__subscription__cpus'
+        )
+        for endpoint, mem_limit, cpus in sessions:
+            used = committed.setdefault(endpoint or self.default, {'memory': 0, 'cpus': 0.0})
+            used['memory'] += docker.utils.parse_bytes(mem_limit or '0')
+            used['cpus'] += float(cpus or 0)
+        return committed
+
+    def place(self):
+        """
+        Returns the name of the reachable endpoint with the most memory and CPU headroom.
+        """
+        if len(self.endpoints) == 1:
+            return self.default
+
+        committed = self.committed()
+        best, best_headroom = self.default, None
+        for name in self.endpoints:
+            try:
+                capacity = self.capacity(name)
+            except docker.errors.DockerException as e:
+                logger.warning("Skipping unreachable Docker endpoint '%s': %s", name, e)
+                continue
+            used = committed.get(name, {'memory': 0, 'cpus': 0.0})
+            headroom = min(1 - used['memory'] / capacity['memory'], 1 - used['cpus'] / capacity['cpus'])
+            if best_headroom is None or headroom > best_headroom:
+                best, best_headroom = name, headroom
+        return best
+
+
+class LatencyStats:
+    """
+    Running count, total and maximum of a latency measured in seconds.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'avg': self.total / self.count if self.count else 0.0,
+                'max': self.max,
+            }
+
+
+class BlockingCallPool:
+    """
+    Sized thread pool for blocking Docker and GitHub calls.
+
+    Unlike `sync_to_async`, which funnels calls through one shared thread by default, calls
+    from independent users run in parallel here. Queue depth and the time calls spend
+    waiting for a free worker are tracked for monitoring.
+    """
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self.queued = 0
+        self.running = 0
+        self.wait_time = LatencyStats()
+        self.run_time = LatencyStats()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedules a call on the pool and returns its `concurrent.futures.Future`.
+        """
+        submitted = time.monotonic()
+        with self._lock:
+            self.queued += 1
+        return self._executor.submit(self._call, submitted, func, args, kwargs)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Awaits a blocking call run on the pool.
+        """
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def _call(self, submitted, func, args, kwargs):
+        started = time.monotonic()
+        self.wait_time.observe(started - submitted)
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+            self.run_time.observe(time.monotonic() - started)
+            with self._lock:
+                self.running -= 1
+
+    def snapshot(self):
+        """
+        Returns queue depth, busy workers and wait/run time statistics.
+        """
+        with self._lock:
+            queued, running = self.queued, self.running
+        return {
+            'name': self.name,
+            'max_workers': self.max_workers,
+            'queued': queued,
+            'running': running,
+            'wait_time': self.wait_time.snapshot(),
+            'run_time': self.run_time.snapshot(),
+        }
+
+
+CPU_PERIOD = 100000  # CFS scheduler period in microseconds
+CONTAINER_WORKSPACE = '/workspace'  # Where terminal containers see the user's project directory
+CONTAINER_VOLUME = '/mnt/volume'  # Where terminal containers see the user's volume directory
+# The interactive terminal shell's exec: a login shell that records its pid in the file passed as $0
+SHELL_COMMAND = ['/bin/bash', '-c', 'echo $$ > "$0"; exec /bin/bash -l']
+
+
+def resource_limit_options(limits):
+    """
+    Returns the memory and CPU options for a subscription plan's limits. They are accepted by
+    both `containers.run` and `container.update`, so running containers can be re-limited live.
+    """
+    return {
+        'mem_limit': limits['mem_limit'],
+        'memswap_limit': limits['memswap_limit'],
+        'cpu_period': CPU_PERIOD,
+        'cpu_quota': int(float(limits['cpus']) * CPU_PERIOD),
+        'cpu_shares': limits['cpu_shares'],
+    }
+
+
+def terminal_container_options(limits):
+    """
+    Returns the `containers.run` options shared by every terminal container, with the
+    resource limits taken from a subscription plan.
+    """
+    return {
+        'image': 'terminal_session',
+        'stdin_open': True,
+        'tty': True,
+        'command': '/bin/bash -l',
+        'detach': True,
+        'user': f"{os.getuid()}:{os.getgid()}",
+        'security_opt': ["no-new-privileges"],
+        'read_only': False,
+        'pids_limit': limits['pids_limit'],
+        **resource_limit_options(limits),
+    }
+
+
+def mount_points():
+    """
+    Returns the paths mounted in this process's mount namespace, or an empty set where
+    /proc is not available.
+    """
+    try:
+        with open('/proc/self/mountinfo') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return set()
+    # Whitespace and backslashes in mount points are octal-escaped
+    return {re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), line.split()[4]) for line in lines}
+
+
+class WarmContainerPool:
+    """
+    Pool of idle, generic terminal containers kept running for each subscription plan.
+
+    Docker cannot add mounts to a running container, so each warm container binds two
+    per-slot host directories at CONTAINER_WORKSPACE and CONTAINER_VOLUME with slave mount
+    propagation, the same targets cold containers use. Claiming one only needs host-side
+    bind mounts of the user's directories onto those slots (which requires root) and a
+    rename, instead of a full `docker run`.
+
+    The pool itself is the set of running containers carrying PLAN_LABEL under a `warm_`
+    name on each endpoint, so every process shares it and it survives restarts. Renaming a
+    container is atomic in the daemon, which makes it the claim: only one process can take
+    a given container out of the pool.
+    """
+    PLAN_LABEL = 'ide.warm_pool'
+    SLOT_LABEL = 'ide.warm_slot'
+    NAME_PATTERN = re.compile(r'warm_[a-z]+_[0-9a-f]{12}')
+    SLOT_MOUNTS = (('workspace', CONTAINER_WORKSPACE), ('volume', CONTAINER_VOLUME))
+
+    def __init__(self, root, sizes):
+        self.root = root
+        self.sizes = sizes
+        self.enabled = bool(root)
+        self.hits = 0
+        self.misses = 0
+        self.claim_latency = LatencyStats()
+        self._idle = {}
+        self._refilling = set()
+        self._lock = Lock()
+
+    def claim(self, user, container_name, endpoint, volume_path):
+        """
+        Hands a warm container on the endpoint over to the user, or returns None on a pool miss.
+        """
+        started = time.monotonic()
+        key = (endpoint, user.subscription.plan_name)
+        container = self._take(*key, container_name) if self.enabled else None
+
+        if container is None:
+            self._record(hit=False)
+            self.refill_async(*key)
+            return None
+
+        try:
+            self.bind(container, user.project_dir, volume_path)
+        except (OSError, subprocess.CalledProcessError) as e:
+            # Without bind-mount privileges no claim can ever succeed, so stop warming containers.
+            logger.warning("Disabling warm container pool, workspace bind mount failed: %s", e)
+            self.enabled = False
+            self._discard(container)
+            self.drain()
+            self._record(hit=False)
+            return None
+
+        self._record(hit=True)
+        self.claim_latency.observe(time.monotonic() - started)
+        self.refill_async(*key)
+        return container
+
+    def _take(self, endpoint, plan, container_name):
+        """
+        Renames the first idle container of the plan on the endpoint that no other process
+        claimed first, and returns it.
+        """
+        try:
+            client = docker_endpoints.client(endpoint)
+            for container in self._idle_containers(client, plan):
+                if self._acquire(container, container_name):
+                    return client.containers.get(container.id)
+        except docker.errors.DockerException as e:
+            logger.warning("Failed to claim a warm container for plan '%s' on '%s': %s", plan, endpoint, e)
+        return None
+
+    def _idle_containers(self, client, plan, running=True):
+        """
+        Lists the plan's containers still waiting in the pool on the client's endpoint.
+        """
+        filters = {'label': f"{self.PLAN_LABEL}={plan}"}
+        if running:
+            filters['status'] = 'running'
+        containers = client.containers.list(all=not running, sparse=True, filters=filters)
+        return [container for container in containers
+                if any(self.NAME_PATTERN.fullmatch(name.lstrip('/')) for name in container.attrs.get('Names') or [])]
+
+    @staticmethod
+    def _acquire(container, name):
+        """
+        Takes a container out of the pool by renaming it; False if another process got it first.
+        """
+        try:
+            container.rename(name)
+            return True
+        except docker.errors.APIError:
+            return False
+
+    def _record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def bind(self, container, project_dir, volume_path):
+        """
+        Bind-mounts the user's project and volume directories onto a pool container's slots,
+        skipping slots that are already mounted. Containers that did not come from the pool
+        are left alone.
+        """
+        slot = self._slot(container)
+        if not slot:
+            return
+        mounted = mount_points()
+        for source, (directory, _) in zip((project_dir, volume_path), self.SLOT_MOUNTS):
+            target = os.path.join(slot, directory)
+            if target in mounted:
+                continue
+            os.makedirs(source, exist_ok=True)
+            os.makedirs(target, exist_ok=True)
+            subprocess.run(['mount', '--bind', source, target], check=True, capture_output=True)
+
+    def rebind(self, container, project_dir, volume_path):
+        """
+        Restores the bind mounts of a claimed pool container after the host lost them (e.g. on
+        reboot). Returns False if they cannot be restored and the container must be replaced.
+        """
+        try:
+            self.bind(container, project_dir, volume_path)
+            return True
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning("Failed to restore the workspace of container %s: %s", container.name, e)
+            return False
+
+    def refill_async(self, endpoint, plan):
+        """
+        Tops the endpoint's pool for the plan back up on a background thread, unless this
+        process is already refilling it.
+        """
+        if not self.enabled or not self.sizes.get(plan):
+            return
+        key = (endpoint, plan)
+        with self._lock:
+            if key in self._refilling:
+                return
+            self._refilling.add(key)
+        Thread(target=self._refill, args=key, daemon=True).start()
+
+    def _refill(self, endpoint, plan):
+        """
+        Removes the plan's pool containers that stopped (e.g. after a host restart) or exceed
+        the pool size, then starts new ones until the pool is full.
+        """
+        key = (endpoint, plan)
+        size = self.sizes.get(plan, 0)
+        try:
+            client = docker_endpoints.client(endpoint)
+            pooled = self._idle_containers(client, plan, running=False)
+            running = [container for container in pooled if container.attrs.get('State') == 'running']
+            stale = [container for container in pooled if container.attrs.get('State') != 'running']
+            for container in stale + running[size:]:
+                if self._acquire(container, f"reap_{uuid.uuid4().hex[:12]}"):
+                    self._discard(container)
+
+            idle = min(len(running), size)
+            while self.enabled and idle < size:
+                self._create_warm_container(client, plan)
+                idle += 1
+            with self._lock:
+                self._idle[key] = idle
+        except (OSError, docker.errors.DockerException) as e:
+            logger.warning("Failed to refill warm container pool for plan '%s' on '%s': %s", plan, endpoint, e)
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+    def _create_warm_container(self, client, plan):
+        """
+        Starts one generic container for the plan with empty workspace and volume slots.
+        """
+        name = f"warm_{plan}_{uuid.uuid4().hex[:12]}"
+        slot = os.path.join(self.root, name)
+        mounts = []
+        for directory, target in self.SLOT_MOUNTS:
+            os.makedirs(os.path.join(slot, directory), exist_ok=True)
+            mounts.append(docker.types.Mount(target=target, source=os.path.join(slot, directory),
+                                             type='bind', propagation='rslave'))
+
+        return client.containers.run(
+            name=name,
+            labels={self.PLAN_LABEL: plan, self.SLOT_LABEL: slot},
+            mounts=[*mounts, *git_mirrors.container_mounts()],
+            working_dir=CONTAINER_WORKSPACE,
+            **terminal_container_options(Subscription.PLAN_LIMITS[plan]),
+        )
+
+    def release(self, container):
+        """
+        Unmounts and removes the slots of a container that came from the pool.
+        """
+        slot = self._slot(container)
+        if not slot:
+            return
+        for directory, _ in self.SLOT_MOUNTS:
+            subprocess.run(['umount', os.path.join(slot, directory)], capture_output=True)
+        shutil.rmtree(slot, ignore_errors=True)
+
+    def drain(self):
+        """
+        Removes every idle warm container from the pools of all endpoints.
+        """
+        for endpoint in docker_endpoints.endpoints:
+            try:
+                client = docker_endpoints.client(endpoint)
+                pooled = client.containers.list(all=True, sparse=True, filters={'label': self.PLAN_LABEL})
+            except docker.errors.DockerException as e:
+                logger.warning("Failed to drain warm container pool on '%s': %s", endpoint, e)
+                continue
+            for container in pooled:
+                names = [name.lstrip('/') for name in container.attrs.get('Names') or []]
+                if any(self.NAME_PATTERN.fullmatch(name) for name in names) \
+                        and self._acquire(container, f"reap_{uuid.uuid4().hex[:12]}"):
+                    self._discard(container)
+        with self._lock:
+            self._idle.clear()
+
+    def _slot(self, container):
+        """
+        Returns the slot directory label of a full or sparse container object.
+        """
+        labels = container.attrs.get('Labels') or (container.attrs.get('Config') or {}).get('Labels') or {}
+        return labels.get(self.SLOT_LABEL)
+
+    def _discard(self, container):
+        try:
+            container.remove(force=True)
+        except docker.errors.APIError:
+            pass
+        self.release(container)
+
+    def snapshot(self):
+        """
+        Returns pool hit/miss counters, claim latency and the idle container counts per endpoint
+        and plan seen by this process's last refills.
+        """
+        with self._lock:
+            idle = {f"{endpoint}:{plan}": count for (endpoint, plan), count in self._idle.items()}
+            hits, misses = self.hits, self.misses
+        return {'hits': hits, 'misses': misses, 'claim_latency': self.claim_latency.snapshot(), 'idle': idle}
+
+
+docker_client_pool = DockerClientPool(
+    size=getattr(settings, 'DOCKER_CLIENT_POOL_SIZE', 4),
+    max_connections=getattr(settings, 'DOCKER_CLIENT_MAX_CONNECTIONS', 10),
+)
+container_handle_cache = ContainerHandleCache()
+docker_endpoints = DockerEndpointRegistry(getattr(settings, 'DOCKER_ENDPOINTS', []))
+docker_call_pool = BlockingCallPool('docker', max_workers=getattr(settings, 'DOCKER_CALL_POOL_WORKERS', 32))
+github_call_pool = BlockingCallPool('github', max_workers=getattr(settings, 'GITHUB_CALL_POOL_WORKERS', 8))
+warm_container_pool = WarmContainerPool(
+    root=getattr(settings, 'DOCKER_WARM_POOL_ROOT', ''),
+    sizes=Subscription.WARM_POOL_SIZES,
+)
+
+
+class PeriodicWorker(abc.ABC):
+    """
+    Daemon thread that calls `run_once` every `interval` seconds, started at most once per process.
+    Subclasses implement `run_once`.
+    """
+    name = 'periodic-worker'
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._thread = None
+        self._stopped = Event()
+        self._lock = Lock()
+
+    def start(self):
+        """
+        Starts the worker thread once per process.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self.run_forever, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run_forever(self):
+        """
+        Runs every `interval` seconds until stopped.
+        """
+        while not self._stopped.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.exception("%s failed: %s", self.name, e)
+            self._stopped.wait(self.interval)
+
+    @abc.abstractmethod
+    def run_once(self):
+        """
+        Does one round of work. Workers with a management command return how many items they handled.
+        """
+
+
+class IdleContainerReaper(PeriodicWorker):
+    """
+    Single scheduler that pauses, then stops, containers whose session has been idle.
+
+    Idle time is read from `DockerSession.last_activity_at`, so one sweep covers the
+    sessions touched by every process. Output of running commands and shells counts as
+    activity, and containers still running a one-off command are left alone. After a short
+    idle window a container is frozen
+    with `container.pause()`, which keeps its shell state and resumes in milliseconds; it
+    is only fully stopped after a much longer idle period. Both timeouts are set per
+    subscription plan. Containers are handled in batches on a bounded thread pool. It runs
+    as a daemon thread in the web process or through the `reap_idle_containers` management
+    command.
+    """
+    name = 'idle-container-reaper'
+
+    def __init__(self, timeouts, interval, batch_size, max_workers):
+        super().__init__(interval)
+        self.timeouts = timeouts
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+
+    def run_once(self):
+        return self.sweep()
+
+    @staticmethod
+    def idle_sessions(plan, statuses, idle_seconds):
+        """
+        Returns the plan's sessions in one of `statuses` with no activity within `idle_seconds`,
+        oldest first.
+        """
+        cutoff = timezone.now() - timedelta(seconds=idle_seconds)
+        return DockerSession.objects.filter(status__in=statuses, user__subscription__plan_name=plan).filter(
+            Q(last_activity_at__lt=cutoff) | Q(last_activity_at__isnull=True, created_at__lt=cutoff)
+        ).order_by('last_activity_at')
+
+    def sweep(self):
+        """
+        Stops long-idle containers, then pauses briefly idle ones, and returns how many were handled.
+        """
+        handled = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for plan, timeouts in self.timeouts.items():
+                if timeouts.get('stop'):
+                    handled += self._sweep_stage(executor, plan, ['running', 'paused'], timeouts['stop'], self.stop_session)
+                if timeouts.get('pause'):
+                    handled += self._sweep_stage(executor, plan, ['running'], timeouts['pause'], self.pause_session)
+        return handled
+
+    def _sweep_stage(self, executor, plan, statuses, idle_seconds, action):
+        handled = 0
+        while True:
+            batch = list(self.idle_sessions(plan, statuses, idle_seconds)[:self.batch_size])
+            if not batch:
+                break
+            handled += sum(executor.map(action, batch))
+            if len(batch) < self.batch_size:
+                break
+        return handled
+
+    @staticmethod
+    def _claim(session, status):
+        """
+        Moves the session to `status` unless it became active since it was selected.
+        """
+        return DockerSession.objects.filter(
+            pk=session.pk, status=session.status, last_activity_at=session.last_activity_at
+        ).update(status=status)
+
+    @staticmethod
+    def has_live_execs(container):
+        """
+        True while a one-off command runs in the container. Interactive shells do not count: they
+        stay open as long as the terminal does, and their output refreshes activity instead.
+        """
+        for exec_id in container.attrs.get('ExecIDs') or ():
+            try:
+                info = container.client.api.exec_inspect(exec_id)
+            except docker.errors.NotFound:
+                continue
+            process = info.get('ProcessConfig') or {}
+            command = [process.get('entrypoint'), *(process.get('arguments') or [])]
+            if info.get('Running') and command[:len(SHELL_COMMAND)] != SHELL_COMMAND:
+                return True
+        return False
+
+    @classmethod
+    def _idle_container(cls, session):
+        """
+        Returns the session's container, or None if it is gone. Returns False, and restarts the
+        session's idle clock, while a command is still running in it.
+        """
+        try:
+            container = docker_endpoints.client(session.endpoint).containers.get(session.container_id)
+        except docker.errors.NotFound:
+            return None
+        if cls.has_live_execs(container):
+            DockerSession.objects.filter(pk=session.pk, last_activity_at=session.last_activity_at).update(
+                last_activity_at=timezone.now()
+            )
+            return False
+        return container
+
+    @classmethod
+    def pause_session(cls, session):
+        """
+        Freezes a single idle session's container.
+        """
+        try:
+            container = cls._idle_container(session)
+        except docker.errors.APIError as e:
+            logger.warning("Failed to inspect idle container %s: %s", session.container_name, e)
+            return False
+        if container is False or not cls._claim(session, 'paused'):
+            return False
+
+        container_handle_cache.invalidate(session.user_id)
+        if container is None:
+            DockerSession.objects.filter(pk=session.pk).update(status='removed')
+            return True
+        try:
+            container.pause()
+        except docker.errors.NotFound:
+            DockerSession.objects.filter(pk=session.pk).update(status='removed')
+        except docker.errors.APIError as e:
+            logger.warning("Failed to pause idle container %s: %s", session.container_name, e)
+        return True
+
+    @classmethod
+    def stop_session(cls, session):
+        """
+        Stops a single idle session's container, unfreezing it first if it was paused.
+        """
+        try:
+            container = cls._idle_container(session)
+        except docker.errors.APIError as e:
+            logger.warning("Failed to inspect idle container %s: %s", session.container_name, e)
+            return False
+        if container is False or not cls._claim(session, 'stopped'):
+            return False
+
+        container_handle_cache.invalidate(session.user_id)
+        if container is None:
+            return True
+        try:
+            if container.status == 'paused':
+                container.unpause()
+            container.stop()
+        except docker.errors.NotFound:
+            pass
+        except docker.errors.APIError as e:
+            logger.warning("Failed to stop idle container %s: %s", session.container_name, e)
+        return True
+
+
+idle_container_reaper = IdleContainerReaper(
+    timeouts=Subscription.IDLE_TIMEOUTS,
+    interval=getattr(settings, 'DOCKER_REAPER_INTERVAL', 60),
+    batch_size=getattr(settings, 'DOCKER_REAPER_BATCH_SIZE', 50),
+    max_workers=getattr(settings, 'DOCKER_REAPER_MAX_WORKERS', 4),
+)
+
+
+def cpu_percent(stats):
+    """
+    Computes CPU usage from one Docker stats snapshot the same way `docker stats` does.
+    """
+    cpu, precpu = stats.get('cpu_stats', {}), stats.get('precpu_stats', {})
+    cpu_delta = cpu.get('cpu_usage', {}).get('total_usage', 0) - precpu.get('cpu_usage', {}).get('total_usage', 0)
+    system_delta = cpu.get('system_cpu_usage', 0) - precpu.get('system_cpu_usage', 0)
+    if cpu_delta <= 0 or system_delta <= 0:
+        return 0.0
+    online_cpus = cpu.get('online_cpus') or len(cpu.get('cpu_usage', {}).get('percpu_usage') or [1])
+    return cpu_delta / system_delta * online_cpus * 100.0
+
+
+class ContainerStatsSampler(PeriodicWorker):
+    """
+    Records CPU, memory and process usage of every running terminal container into
+    `ContainerUsageSample`, pruning samples older than the retention period.
+    """
+    name = 'container-stats-sampler'
+
+    def __init__(self, interval, retention, max_workers):
+        super().__init__(interval)
+        self.retention = retention
+        self.max_workers = max_workers
+
+    def run_once(self):
+        return self.sample()
+
+    def sample(self):
+        """
+        Samples all running sessions in parallel and returns how many samples were saved.
+        """
+        sessions = list(DockerSession.objects.filter(status='running'))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            samples = [sample for sample in executor.map(self.sample_session, sessions) if sample]
+
+        ContainerUsageSample.objects.bulk_create(samples)
+        ContainerUsageSample.objects.filter(sampled_at__lt=timezone.now() - timedelta(seconds=self.retention)).delete()
+        return len(samples)
+
+    @staticmethod
+    def sample_session(session):
+        try:
+            stats = docker_endpoints.client(session.endpoint).api.stats(session.container_id, stream=False)
+        except docker.errors.APIError:
+            return None
+
+        return ContainerUsageSample(
+            session=session,
+            sampled_at=timezone.now(),
+            cpu_percent=round(cpu_percent(stats), 2),
+            memory_bytes=stats.get('memory_stats', {}).get('usage', 0),
+            pids=stats.get('pids_stats', {}).get('current', 0),
+        )
+
+
+container_stats_sampler = ContainerStatsSampler(
+    interval=getattr(settings, 'DOCKER_STATS_INTERVAL', 60),
+    retention=getattr(settings, 'DOCKER_STATS_RETENTION', 7 * 24 * 3600),
+    max_workers=getattr(settings, 'DOCKER_STATS_MAX_WORKERS', 8),
+)
+
+
+def _translate_glob(pattern):
+    """
+    Translates a gitignore glob into a regular expression body.
+    """
+    i, n, out = 0, len(pattern), []
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                i += 2
+                if pattern.startswith('/', i):
+                    out.append('(?:.*/)?')  # "**/" matches zero or more directories
+                    i += 1
+                else:
+                    out.append('.*')
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            j = pattern.find(']', j)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j].replace('\\', '\\\\')
+                if body[:1] in ('!', '^'):
+                    body = '^' + body[1:]
+                out.append(f'[{body}]')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+class IgnoreRules:
+    """
+    Compiled gitignore patterns declared in one directory (`base`, relative to the project).
+    """
+
+    def __init__(self, lines, base=''):
+        self.base = base
+        self.rules = []
+        for line in lines:
+            line = re.sub(r'(?<!\\) +$', '', line.rstrip('\r\n'))
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            # Patterns with a slash before the end are anchored to `base`; others match at any depth
+            anchored = '/' in line
+            regex = ('' if anchored else '(?:.*/)?') + _translate_glob(line.lstrip('/'))
+            self.rules.append((re.compile(f'^{regex}$'), negate, dir_only))
+
+    @classmethod
+    def from_file(cls, path, base=''):
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                return cls(file.readlines(), base)
+        except OSError:
+            return None
+
+    def match(self, relative_path, is_dir):
+        """
+        Returns True (ignored), False (re-included by "!") or None when no pattern matches.
+        """
+        if self.base:
+            if not relative_path.startswith(self.base + '/'):
+                return None
+            relative_path = relative_path[len(self.base) + 1:]
+        for regex, negate, dir_only in reversed(self.rules):
+            if (is_dir or not dir_only) and regex.match(relative_path):
+                return not negate
+        return None
+
+
+class IgnoreMatcher:
+    """
+    Decides which project paths are ignored, the way git does.
+
+    Rules come, from lowest to highest precedence, from the project's extra ignore list,
+    `.git/info/exclude` and every `.gitignore` from the project root down to the path's
+    directory. Nested `.gitignore` files are read lazily the first time a walk reaches them.
+    Paths are relative to the project and use "/" separators.
+    """
+
+    def __init__(self, project_path, extra_patterns=()):
+        self.project_path = project_path
+        self.base_rules = [
+            IgnoreRules(extra_patterns),
+            IgnoreRules.from_file(os.path.join(project_path, '.git', 'info', 'exclude')),
+        ]
+        self._dir_rules = {}
+
+    def sources(self):
+        """
+        Returns the ignore files read so far, so callers can tell when the rules are stale.
+        """
+        return [os.path.join(self.project_path, '.git', 'info', 'exclude')] + [
+            os.path.join(self.project_path, relative_dir, '.gitignore') for relative_dir in self._dir_rules
+        ]
+
+    def rules_for(self, relative_dir):
+        if relative_dir not in self._dir_rules:
+            path = os.path.join(self.project_path, relative_dir, '.gitignore')
+            self._dir_rules[relative_dir] = IgnoreRules.from_file(path, relative_dir)
+        return self._dir_rules[relative_dir]
+
+    def ignored(self, relative_path, is_dir=False):
+        if relative_path == '.git' or relative_path.startswith('.git/'):
+            return True
+        parts = relative_path.split('/')
+        rule_sets = self.base_rules + [self.rules_for('/'.join(parts[:depth])) for depth in range(len(parts))]
+        for rules in reversed(rule_sets):
+            if rules is not None:
+                matched = rules.match(relative_path, is_dir)
+                if matched is not None:
+                    return matched
+        return False
+
+
+def project_ignore_patterns(project):
+    """
+    Returns the site-wide ignore patterns followed by the project's own extra ignore list.
+    """
+    return list(getattr(settings, 'PROJECT_IGNORE_PATTERNS', [])) + (project.ignore_patterns or '').splitlines()
+
+
+def ignore_matcher(project):
+    return IgnoreMatcher(project.project_path, project_ignore_patterns(project))
+
+
+def walk_project(project_path, matcher=None, include_hidden=False):
+    """
+    Walks a directory top-down like `os.walk`, yielding (relative dir, dir entries, file entries).
+
+    Built on `os.scandir`, so callers can use each entry's cached stat data. Hidden entries are
+    skipped unless `include_hidden`, and entries ignored by `matcher` are skipped before their
+    subtree is read. Callers may also prune by removing entries from the yielded dir list.
+    Symlinked directories are reported as files and never followed.
+    """
+    stack = ['']
+    while stack:
+        relative_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(project_path, relative_dir)) as scanned:
+                entries = list(scanned)
+        except OSError:
+            continue
+
+        dirs, files = [], []
+        for entry in entries:
+            if not include_hidden and entry.name.startswith('.'):
+                continue
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+            if matcher is not None and matcher.ignored(relative_path, is_dir):
+                continue
+            (dirs if is_dir else files).append(entry)
+
+        yield relative_dir, dirs, files
+        stack.extend(f"{relative_dir}/{entry.name}" if relative_dir else entry.name for entry in reversed(dirs))
+
+
+def folder_size(path):
+    """
+    Returns the size in bytes of every file under `path`, hidden and ignored files included.
+    """
+    total_size = 0
+    for _, _, files in walk_project(path, include_hidden=True):
+        for entry in files:
+            try:
+                total_size += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+    return total_size
+
+
+# Formats that are already compressed; deflating them again only costs CPU
+INCOMPRESSIBLE_EXTENSIONS = {
+    '.7z', '.avi', '.br', '.bz2', '.docx', '.gif', '.gz', '.jar', '.jpeg', '.jpg', '.mkv', '.mov', '.mp3',
+    '.mp4', '.ogg', '.pdf', '.png', '.pptx', '.rar', '.tgz', '.webm', '.webp', '.whl', '.woff', '.woff2',
+    '.xlsx', '.xz', '.zip', '.zst',
+}
+
+
+def is_compressible(path, sample_size=65536):
+    """
+    Guesses whether deflating a file is worthwhile, from its extension or a fast trial compression
+    of its first `sample_size` bytes.
+    """
+    if os.path.splitext(path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+        return False
+    try:
+        with open(path, 'rb') as file:
+            sample = file.read(sample_size)
+    except OSError:
+        return False
+    return len(sample) < 1024 or len(zlib.compress(sample, 1)) < len(sample) * 0.9
+
+
+class ZipStreamBuffer:
+    """
+    Write-only file object that collects what `zipfile` writes, so it can be yielded as it is produced.
+
+    It has no `seek`, so `zipfile` writes sizes in data descriptors instead of seeking back.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        self.size = 0
+        return data
+
+
+def stream_zip(project_path, matcher=None, level=6, chunk_size=65536):
+    """
+    Yields a zip archive of `project_path` while it is being built, holding at most about one
+    chunk in memory. Ignored paths and `.git` are left out; incompressible files are stored.
+    """
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=level) as archive:
+        for relative_dir, dirs, files in walk_project(project_path, matcher, include_hidden=True):
+            for entry in dirs:
+                arcname = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                archive.writestr(zipfile.ZipInfo.from_file(entry.path, arcname), b'')
+
+            for entry in files:
+                if not entry.is_file():
+                    continue
+                arcname = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                try:
+                    info = zipfile.ZipInfo.from_file(entry.path, arcname)
+                    source = open(entry.path, 'rb')
+                except OSError:
+                    continue
+                if level and is_compressible(entry.path):
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    info._compresslevel = level  # Per-entry level; ZipInfo has no public setter before Python 3.13
+                else:
+                    info.compress_type = zipfile.ZIP_STORED
+
+                with source, archive.open(info, 'w') as target:
+                    while chunk := source.read(chunk_size):
+                        target.write(chunk)
+                        if buffer.size >= chunk_size:
+                            yield buffer.drain()
+                yield buffer.drain()
+    yield buffer.drain()
+
+
+def file_size(path):
+    """
+    Returns the size of `path` in bytes, or 0 if it does not exist.
+    """
+    try:
+        return os.lstat(path).st_size
+    except OSError:
+        return 0
+
+
+def start_storage_reconciler():
+    """
+    Starts this process's storage reconciler, unless reconciliation runs as its own command.
+    """
+    if getattr(settings, 'STORAGE_RECONCILE_IN_PROCESS', True):
+        storage_reconciler.start()
+
+
+def adjust_storage(project, delta):
+    """
+    Adds `delta` bytes to the stored storage usage of a project and of its owner.
+    """
+    start_storage_reconciler()
+    if delta:
+        Project.objects.filter(pk=project.pk).update(storage_used=F('storage_used') + delta)
+        get_user_model().objects.filter(pk=project.user_id).update(storage_used=F('storage_used') + delta)
+
+
+def storage_used(user):
+    """
+    Returns the user's stored storage usage in bytes. A user whose usage has never been
+    reconciled is scanned once first.
+    """
+    start_storage_reconciler()
+    if user.storage_reconciled_at is None:
+        storage_reconciler.reconcile_user(user)
+    user.refresh_from_db(fields=['storage_used', 'storage_reconciled_at'])
+    return user.storage_used
+
+
+def plan_storage_limit(user):
+    """
+    Returns the user's storage limit in MB, falling back to the free plan's without a subscription.
+    """
+    subscription = Subscription.objects.filter(user=user).first()
+    return subscription.storage_limit if subscription else Subscription.PLAN_LIMITS['free']['storage_limit']
+
+
+def storage_remaining(user):
+    """
+    Returns the bytes left in the user's plan from their stored usage, without touching the disk.
+    """
+    return plan_storage_limit(user) * 1024 * 1024 - storage_used(user)
+
+
+def storage_exceeded(user):
+    return storage_remaining(user) <= 0
+
+
+class ExtractionError(Exception):
+    """
+    Raised when an uploaded archive is unsafe or does not fit in the user's remaining storage.
+    """
+
+
+class ByteBudget:
+    """
+    Running byte allowance shared by the threads extracting one archive.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._lock = Lock()
+
+    def consume(self, size):
+        with self._lock:
+            self.used += size
+            if self.used > self.limit:
+                raise ExtractionError("The archive does not fit in your remaining storage.")
+            return self.used
+
+
+def archive_member_path(target_dir, name):
+    """
+    Returns where an archive member should be written, refusing names that escape `target_dir`.
+    """
+    name = name.replace('\\', '/')
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if not parts or '..' in parts or ':' in parts[0]:
+        raise ExtractionError(f"Unsafe path in archive: {name}")
+    root = os.path.realpath(target_dir)
+    path = os.path.realpath(os.path.join(root, *parts))
+    if os.path.commonpath([root, path]) != root:
+        raise ExtractionError(f"Unsafe path in archive: {name}")
+    return path
+
+
+def extract_zip(upload, target_dir, byte_budget, progress=None, chunk_size=1024 * 1024):
+    """
+    Extracts an uploaded zip into `target_dir` in fixed-size chunks and returns the bytes written.
+
+    Sizes declared in the archive are checked against `byte_budget` before anything is written,
+    and the bytes actually written are counted against it while copying, so a lying or
+    over-quota archive stops as soon as it runs over. Members that inflate more than
+    UPLOAD_MAX_COMPRESSION_RATIO times are refused as likely zip bombs. Members of at least
+    UPLOAD_PARALLEL_MEMBER_BYTES are extracted on a thread pool. `progress(written, total)`
+    is called as extraction advances.
+    """
+    max_ratio = getattr(settings, 'UPLOAD_MAX_COMPRESSION_RATIO', 200)
+    parallel_size = getattr(settings, 'UPLOAD_PARALLEL_MEMBER_BYTES', 8 * 1024 * 1024)
+    budget = ByteBudget(byte_budget)
+
+    try:
+        archive = zipfile.ZipFile(upload)
+    except zipfile.BadZipFile as e:
+        raise ExtractionError(f"Not a valid zip file: {e}")
+
+    with archive:
+        members = []
+        for info in archive.infolist():
+            path = archive_member_path(target_dir, info.filename)
+            if info.is_dir():
+                os.makedirs(path, exist_ok=True)
+                continue
+            if info.file_size > 1024 * 1024 and info.file_size > max(info.compress_size, 1) * max_ratio:
+                raise ExtractionError(f"{info.filename} expands too much to be extracted safely.")
+            members.append((info, path))
+
+        total = sum(info.file_size for info, _ in members)
+        if total > byte_budget:
+            raise ExtractionError("The archive does not fit in your remaining storage.")
+
+        failed = Event()
+
+        def extract_member(info, path):
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with archive.open(info) as source, open(path, 'wb') as target:
+                    while not failed.is_set() and (chunk := source.read(chunk_size)):
+                        written = budget.consume(len(chunk))
+                        target.write(chunk)
+                        if progress:
+                            progress(written, total)
+            except BaseException:
+                failed.set()  # Stop the other members early
+                raise
+
+        large = [member for member in members if member[0].file_size >= parallel_size]
+        with ThreadPoolExecutor(max_workers=getattr(settings, 'UPLOAD_EXTRACT_WORKERS', 4),
+                                thread_name_prefix='zip-extract') as executor:
+            futures = [executor.submit(extract_member, info, path) for info, path in large]
+            for info, path in members:
+                if info.file_size < parallel_size:
+                    extract_member(info, path)
+            for future in futures:
+                future.result()
+
+    return budget.used
+
+
+class StorageReconciler(PeriodicWorker):
+    """
+    Recomputes stored storage usage from disk, correcting drift from files written inside
+    containers or outside the app.
+
+    Every sweep reconciles the `batch_size` users reconciled longest ago. A user's project
+    directories are scanned in parallel, and their total also counts loose files in `project_dir`.
+    """
+    name = 'storage-reconciler'
+
+    def __init__(self, interval, batch_size, max_workers):
+        super().__init__(interval)
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='storage-reconciler')
+
+    def run_once(self):
+        """
+        Reconciles one batch of users and returns how many were reconciled.
+        """
+        close_old_connections()
+        users = list(get_user_model().objects.exclude(project_dir__isnull=True).exclude(project_dir='')
+                     .order_by(F('storage_reconciled_at').asc(nulls_first=True))[:self.batch_size])
+        for user in users:
+            self.reconcile_user(user)
+        return len(users)
+
+    def reconcile_user(self, user):
+        """
+        Scans the user's project directory and stores the usage of the user and each project.
+        """
+        sizes, loose_size = {}, 0
+        try:
+            with os.scandir(user.project_dir) as scanned:
+                entries = list(scanned)
+        except (OSError, TypeError):
+            entries = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                sizes[os.path.normpath(entry.path)] = self.executor.submit(folder_size, entry.path)
+            else:
+                loose_size += file_size(entry.path)
+        sizes = {path: future.result() for path, future in sizes.items()}
+
+        for project in Project.objects.filter(user=user).exclude(status='deleted').only('pk', 'project_path'):
+            Project.objects.filter(pk=project.pk).update(
+                storage_used=sizes.get(os.path.normpath(project.project_path), 0))
+
+        total_size = loose_size + sum(sizes.values())
+        get_user_model().objects.filter(pk=user.pk).update(storage_used=total_size,
+                                                           storage_reconciled_at=timezone.now())
+        return total_size
+
+    @staticmethod
+    def reconcile_project(project):
+        """
+        Scans one project, e.g. after an upload or clone, and moves its owner's total by the difference.
+        """
+        project.refresh_from_db(fields=['storage_used'])
+        adjust_storage(project, folder_size(project.project_path) - project.storage_used)
+
+
+storage_reconciler = StorageReconciler(
+    interval=getattr(settings, 'STORAGE_RECONCILE_INTERVAL', 600),
+    batch_size=getattr(settings, 'STORAGE_RECONCILE_BATCH_SIZE', 50),
+    max_workers=getattr(settings, 'STORAGE_RECONCILE_MAX_WORKERS', 4),
+)
+
+
+class GitMirrorCache(PeriodicWorker):
+    """
+    Bare mirrors of upstream repositories, shared by every clone of the same URL on this host.
+
+    Once `min_clones` projects were cloned from a URL, its clones create or reuse a mirror under
+    `root` and borrow objects from it through `--reference-if-able`, fetching only what the
+    mirror lacks. Every sweep fetches mirrors that were last refreshed over `interval` seconds ago.
+
+    Clones keep reading the mirror's objects through `objects/info/alternates`, so mirrors never
+    garbage collect and are never removed. The root is mounted read-only into terminal containers
+    at the same path, which is why only anonymous http(s) and git:// URLs are mirrored.
+    """
+    name = 'git-mirror-cache'
+    SCHEMES = ('http', 'https', 'git')
+
+    def __init__(self, root, interval, min_clones, enabled=True, timeout=None):
+        super().__init__(interval)
+        self.root = str(root)
+        self.min_clones = min_clones
+        self.enabled = enabled
+        self.timeout = timeout
+        self._locks = [Lock() for _ in range(64)]
+
+    def mirrorable(self, url):
+        parsed = urlparse(url)
+        return (self.enabled and parsed.scheme in self.SCHEMES and bool(parsed.hostname)
+                and not parsed.username and not parsed.password)
+
+    def mirror_path(self, url):
+        """
+        Returns where the mirror of `url` lives, keyed by host and path so `.git` suffixes,
+        trailing slashes and the scheme do not matter.
+        """
+        parsed = urlparse(url)
+        path = parsed.path.rstrip('/')
+        if path.endswith('.git'):
+            path = path[:-len('.git')]
+        key = hashlib.sha256(f"{parsed.hostname.lower()}{path}".encode()).hexdigest()
+        return os.path.join(self.root, key[:2], f"{key}.git")
+
+    def _lock_for(self, path):
+        return self._locks[hash(path) % len(self._locks)]
+
+    def reference_for(self, url, run_git):
+        """
+        Returns the mirror a clone of `url` should borrow from, creating it with `run_git` once
+        the URL is popular enough, or None to clone without one.
+        """
+        if not self.mirrorable(url):
+            return None
+        path = self.mirror_path(url)
+        if os.path.isdir(path):
+            return path
+
+        close_old_connections()
+        stripped = url.rstrip('/')
+        variants = {stripped, stripped[:-len('.git')] if stripped.endswith('.git') else f"{stripped}.git"}
+        if Project.objects.filter(repository__in=variants).count() < self.min_clones:
+            return None
+
+        with self._lock_for(path):
+            if not os.path.isdir(path) and not self._create(url, path, run_git):
+                return None
+        return path
+
+    def _create(self, url, path, run_git):
+        """
+        Clones the mirror next to its final path and moves it into place once complete.
+        """
+        partial = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        returncode, tail = run_git(['git', 'clone', '--mirror', '--progress', '--', url, partial])
+        try:
+            if returncode != 0:
+                logger.warning("Could not mirror %s: %s", url, tail)
+                return False
+            for key, value in (('gc.auto', '0'), ('gc.pruneExpire', 'never'), ('maintenance.auto', 'false')):
+                subprocess.run(['git', '-C', partial, 'config', key, value], check=True, capture_output=True)
+            os.rename(partial, path)
+            return True
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning("Could not mirror %s: %s", url, e)
+            return False
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+
+    def mirrors(self):
+        try:
+            with os.scandir(self.root) as buckets:
+                bucket_paths = [bucket.path for bucket in buckets if bucket.is_dir()]
+        except OSError:
+            return []
+        paths = []
+        for bucket_path in bucket_paths:
+            with os.scandir(bucket_path) as entries:
+                paths.extend(entry.path for entry in entries if entry.name.endswith('.git') and entry.is_dir())
+        return paths
+
+    def run_once(self):
+        """
+        Fetches every stale mirror and returns how many were refreshed.
+        """
+        refreshed = 0
+        for path in self.mirrors():
+            fetch_head = os.path.join(path, 'FETCH_HEAD')
+            last_refresh = os.path.getmtime(fetch_head if os.path.exists(fetch_head) else path)
+            if time.time() - last_refresh < self.interval:
+                continue
+            with self._lock_for(path):
+                try:
+                    subprocess.run(['git', '-C', path, 'fetch', '--prune', '--quiet'], check=True, capture_output=True,
+                                   timeout=self.timeout, env={**os.environ, 'GIT_TERMINAL_PROMPT': '0'})
+                    refreshed += 1
+                except (OSError, subprocess.SubprocessError) as e:
+                    logger.warning("Could not refresh git mirror %s: %s", path, e)
+        return refreshed
+
+    def container_volumes(self):
+        """
+        Returns the `volumes` binding the mirrors into a terminal container, so clones' alternates resolve.
+        """
+        if not self.enabled:
+            return {}
+        os.makedirs(self.root, exist_ok=True)
+        return {self.root: {'bind': self.root, 'mode': 'ro'}}
+
+    def container_mounts(self):
+        """
+        Returns the same binding as `container_volumes` in `mounts` form.
+        """
+        return [docker.types.Mount(target=source, source=source, type='bind', read_only=True)
+                for source in self.container_volumes()]
+
+
+git_mirrors = GitMirrorCache(
+    root=getattr(settings, 'GIT_MIRROR_ROOT', os.path.join(settings.BASE_DIR, 'GitMirrors')),
+    interval=getattr(settings, 'GIT_MIRROR_REFRESH_INTERVAL', 3600),
+    min_clones=getattr(settings, 'GIT_MIRROR_MIN_CLONES', 2),
+    enabled=getattr(settings, 'GIT_MIRROR_ENABLED', True),
+    timeout=getattr(settings, 'CLONE_TIMEOUT', 1800),
+)
+
+
+class CloneError(Exception):
+    """
+    Raised when a clone job cannot be started.
+    """
+
+
+class CloneJob:
+    """
+    One `git clone` running in the background for a project, with its latest progress.
+    """
+
+    def __init__(self, project, url, host, depth=None, blob_filter=False, on_success=None):
+        self.id = uuid.uuid4().hex
+        self.user_id = project.user_id
+        self.project = project
+        self.url = url
+        self.host = host
+        self.depth = depth
+        self.blob_filter = blob_filter
+        self.on_success = on_success
+        self.status = 'queued'
+        self.phase = None
+        self.percent = 0
+        self.error = None
+        self.finished_at = None
+        self.process = None
+        self.cancelled = Event()
+
+    def command(self, reference=None):
+        command = ['git', 'clone', '--progress']
+        if self.depth:
+            command += ['--depth', str(self.depth)]
+        if reference:
+            # Borrowed objects are already local, so there is nothing left to filter
+            command += ['--reference-if-able', reference]
+        elif self.blob_filter:
+            command += ['--filter=blob:none']
+        # `--` keeps a URL starting with a dash from being read as an option
+        return command + ['--', self.url, self.project.project_path]
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'project': self.project.project_name,
+            'url': self.url,
+            'status': self.status,
+            'phase': self.phase,
+            'percent': self.percent,
+            'error': self.error,
+        }
+
+
+def publish_progress(user_id, job):
+    """
+    Pushes the state of one of the user's background jobs, shaped like `CloneJob.as_dict`, to
+    their `clone_<user id>` channel group, which the profile page follows. Best effort: a
+    missing or unreachable channel layer only costs the progress update.
+    """
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        async_to_sync(channel_layer.group_send)(CloneJobManager.group_name(user_id),
+                                                {'type': 'clone.progress', 'job': job})
+    except Exception:
+        logger.warning("Could not publish progress of job %s", job['id'], exc_info=True)
+
+
+class CloneJobManager:
+    """
+    Runs `git clone` outside the request cycle and pushes its progress to the owner's
+    `clone_<user id>` channel group.
+
+    Each job runs in its own thread, but at most `max_per_host` clones per remote host and
+    `max_running` overall hold a slot at once; the rest wait as queued. Jobs only live in the
+    process that started them, and finished ones are forgotten after `retention` seconds.
+    """
+    PROGRESS_PATTERN = re.compile(r'^(?:remote: )?([A-Za-z ]+):\s+(\d+)%')
+
+    def __init__(self, max_running, max_per_host, max_pending, timeout=None, retention=600, progress_interval=0.5):
+        self.max_pending = max_pending
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.retention = retention
+        self.progress_interval = progress_interval
+        self.jobs = {}
+        self._running = Semaphore(max_running)
+        self._hosts = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def host_of(url):
+        """
+        Returns the host of an http(s), ssh or scp-style (`git@host:owner/repo`) remote URL.
+        """
+        if '://' in url:
+            parsed = urlparse(url)
+            host = parsed.hostname if parsed.scheme in ('http', 'https', 'ssh', 'git') else None
+        else:
+            match = re.match(r'^(?:[^@/]+@)?([^:/]+):', url)
+            host = match.group(1) if match else None
+        if not host:
+            raise CloneError(f"Not a remote repository URL: {url}")
+        return host.lower()
+
+    @staticmethod
+    def group_name(user_id):
+        return f"clone_{user_id}"
+
+    def submit(self, project, url, depth=None, blob_filter=False, on_success=None):
+        """
+        Queues a clone of `url` into `project.project_path` and returns the job.
+        """
+        job = CloneJob(project, url, self.host_of(url), depth=depth, blob_filter=blob_filter, on_success=on_success)
+        if getattr(settings, 'GIT_MIRROR_IN_PROCESS', True) and git_mirrors.enabled:
+            git_mirrors.start()
+        with self._lock:
+            self._forget_finished()
+            if sum(1 for queued in self.jobs.values() if not queued.finished_at) >= self.max_pending:
+                raise CloneError("Too many clones in progress. Try again in a few minutes.")
+            self.jobs[job.id] = job
+        Thread(target=self._run, args=(job,), name=f'clone-{job.id[:8]}', daemon=True).start()
+        self._publish(job)
+        return job
+
+    def cancel(self, job_id, user_id):
+        """
+        Cancels a queued or running job owned by `user_id`. Returns False if it is not running here.
+        """
+        job = self.jobs.get(job_id)
+        if not job or job.user_id != user_id or job.finished_at:
+            return False
+        job.cancelled.set()
+        process = job.process
+        if process and process.poll() is None:
+            process.terminate()
+        return True
+
+    def jobs_for(self, user_id):
+        return [job for job in list(self.jobs.values()) if job.user_id == user_id]
+
+    def _forget_finished(self):
+        cutoff = time.monotonic() - self.retention
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def _host_slot(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = Semaphore(self.max_per_host)
+            return self._hosts[host]
+
+    def _acquire(self, semaphore, job):
+        # Poll so a job cancelled while queued gives up its place promptly
+        while not job.cancelled.is_set():
+            if semaphore.acquire(timeout=1):
+                return True
+        return False
+
+    def _run(self, job):
+        host_slot = self._host_slot(job.host)
+        created_dir = not os.path.exists(job.project.project_path)
+        try:
+            if not self._acquire(host_slot, job):
+                return self._finish(job, 'cancelled')
+            try:
+                if not self._acquire(self._running, job):
+                    return self._finish(job, 'cancelled')
+                try:
+                    returncode, tail = self._clone(job)
+                finally:
+                    self._running.release()
+            finally:
+                host_slot.release()
+
+            if returncode == 0 and not job.cancelled.is_set():
+                close_old_connections()
+                storage_reconciler.reconcile_project(job.project)
+                if job.on_success:
+                    job.on_success(job)
+                return self._finish(job, 'finished')
+            self._discard(job, created_dir)
+            if job.cancelled.is_set():
+                return self._finish(job, 'cancelled')
+            self._finish(job, 'failed', error=tail or f"git clone exited with status {returncode}")
+        except Exception as e:
+            logger.exception("Clone of %s failed", job.url)
+            self._discard(job, created_dir)
+            self._finish(job, 'failed', error=str(e))
+
+    def _clone(self, job):
+        """
+        Clones the job's repository, borrowing objects from a shared mirror when there is one,
+        and returns git's exit status and last message line.
+        """
+        job.status = 'running'
+        self._publish(job)
+        reference = git_mirrors.reference_for(job.url, lambda command: self._git(job, command))
+        return self._git(job, job.command(reference))
+
+    def _git(self, job, command):
+        """
+        Runs one git command for the job, publishing its progress, and returns its exit status
+        and last message line.
+        """
+        if job.cancelled.is_set():
+            return -1, ''
+        job.phase, job.percent = None, 0
+        job.process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.PIPE, env={**os.environ, 'GIT_TERMINAL_PROMPT': '0'})
+        if job.cancelled.is_set():
+            job.process.terminate()
+        timer = None
+        if self.timeout:
+            timer = Timer(self.timeout, job.process.kill)
+            timer.daemon = True
+            timer.start()
+        try:
+            tail = self._read_progress(job)
+            return job.process.wait(), tail
+        finally:
+            if timer:
+                timer.cancel()
+
+    @staticmethod
+    def _discard(job, created_dir):
+        """
+        Removes the project of a clone that did not complete, and its checkout if the job created it.
+        """
+        # git cleans up after itself on failure, but never leave a half-written checkout behind
+        if created_dir and os.path.isdir(job.project.project_path):
+            shutil.rmtree(job.project.project_path, ignore_errors=True)
+        close_old_connections()
+        Project.objects.filter(pk=job.project.pk).delete()
+
+    def _read_progress(self, job):
+        """
+        Parses `git clone --progress` output, publishing at most one update per `progress_interval`
+        unless the phase changes. Returns git's last error or message line, for error reports.
+        """
+        buffer, last_line, last_sent = b'', '', 0.0
+        while True:
+            chunk = job.process.stderr.read1(4096)
+            if not chunk:
+                break
+            buffer += chunk
+            *lines, buffer = re.split(rb'[\r\n]', buffer)
+            for line in lines:
+                line = line.decode('utf-8', 'replace').strip()
+                if not line:
+                    continue
+                match = self.PROGRESS_PATTERN.match(line)
+                if not match:
+                    # Keep git's `fatal:` line over the hints that follow it
+                    if line.startswith(('fatal:', 'error:')) or not last_line.startswith(('fatal:', 'error:')):
+                        last_line = line
+                    continue
+                phase, percent = match.group(1), int(match.group(2))
+                if phase == job.phase and percent == job.percent:
+                    continue
+                now = time.monotonic()
+                if phase == job.phase and percent < 100 and now - last_sent < self.progress_interval:
+                    job.percent = percent
+                    continue
+                job.phase, job.percent, last_sent = phase, percent, now
+                self._publish(job)
+        return last_line
+
+    def _finish(self, job, status, error=None):
+        job.status, job.error = status, error
+        job.process = None
+        job.finished_at = time.monotonic()
+        self._publish(job)
+        close_old_connections()
+
+    def _publish(self, job):
+        publish_progress(job.user_id, job.as_dict())
+
+
+clone_jobs = CloneJobManager(
+    max_running=getattr(settings, 'CLONE_MAX_RUNNING', 4),
+    max_per_host=getattr(settings, 'CLONE_MAX_PER_HOST', 2),
+    max_pending=getattr(settings, 'CLONE_MAX_PENDING', 32),
+    timeout=getattr(settings, 'CLONE_TIMEOUT', 1800),
+)
+
+
+def resolve_project_path(project_path, relative_path):
+    """
+    Returns the absolute path of `relative_path` inside the project, refusing paths that escape it.
+    """
+    root = os.path.realpath(project_path)
+    path = os.path.realpath(os.path.join(root, relative_path or ''))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError("Path is outside the project.")
+    return path
+
+
+class DirectoryListingCache:
+    """
+    Sorted listings of single directories, reused until the directory's mtime changes.
+
+    Listings come from `os.scandir`, whose entries carry the type and stat data read while
+    listing, so expanding a directory costs one read of that directory and nothing else.
+    Directories come before files, both ordered by name, and hidden entries are skipped.
+    """
+    PEEK_ENTRIES = 64
+
+    def __init__(self, max_dirs):
+        self.max_dirs = max_dirs
+        self._listings = OrderedDict()  # path -> (mtime, [(kind, sort name, name, size, modified)])
+        self._lock = Lock()
+
+    def listing(self, directory):
+        mtime = os.stat(directory).st_mtime_ns
+        with self._lock:
+            cached = self._listings.get(directory)
+            if cached and cached[0] == mtime:
+                self._listings.move_to_end(directory)
+                return cached[1]
+
+        entries = []
+        with os.scandir(directory) as scanned:
+            for entry in scanned:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    # Like os.walk, symlinked directories are not listed
+                    if entry.is_dir() and entry.is_symlink():
+                        continue
+                    kind = 'd' if entry.is_dir() else 'f'
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((kind, entry.name.lower(), entry.name, stat.st_size, stat.st_mtime))
+        entries.sort()
+
+        with self._lock:
+            self._listings[directory] = (mtime, entries)
+            self._listings.move_to_end(directory)
+            while len(self._listings) > self.max_dirs:
+                self._listings.popitem(last=False)
+        return entries
+
+    @staticmethod
+    def _ignored(matcher, relative_dir, name, is_dir):
+        return matcher is not None and matcher.ignored(f"{relative_dir}/{name}" if relative_dir else name, is_dir)
+
+    def visible(self, directory, relative_dir, matcher=None):
+        """
+        Returns the listing of `directory` without the entries `matcher` ignores.
+        """
+        entries = self.listing(directory)
+        if matcher is None:
+            return entries
+        return [entry for entry in entries if not self._ignored(matcher, relative_dir, entry[2], entry[0] == 'd')]
+
+    def has_children(self, directory, relative_dir, matcher=None):
+        """
+        Tells whether `directory` has a visible entry, from its cached listing while that is current,
+        otherwise by reading at most `PEEK_ENTRIES` of its entries.
+        """
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return False
+        with self._lock:
+            cached = self._listings.get(directory)
+        if cached and cached[0] == mtime:
+            return any(not self._ignored(matcher, relative_dir, name, kind == 'd') for kind, _, name, _, _ in cached[1])
+
+        try:
+            with os.scandir(directory) as scanned:
+                for seen, entry in enumerate(scanned):
+                    if seen == self.PEEK_ENTRIES:
+                        return True  # Too many hidden or ignored entries to rule out; expanding will tell
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        is_dir = entry.is_dir()
+                        if is_dir and entry.is_symlink():
+                            continue
+                    except OSError:
+                        continue
+                    if not self._ignored(matcher, relative_dir, entry.name, is_dir):
+                        return True
+        except OSError:
+            return False
+        return False
+
+    def page(self, project_path, relative_dir, cursor=None, limit=200, matcher=None):
+        """
+        Returns up to `limit` children of `relative_dir` after `cursor`, and the cursor of the next page.
+
+        Subdirectories are not listed, only checked for a visible entry with `has_children`, so
+        the explorer can tell empty folders apart before they are expanded.
+        """
+        directory = resolve_project_path(project_path, relative_dir)
+        relative_dir = os.path.relpath(directory, os.path.realpath(project_path))
+        relative_dir = '' if relative_dir == '.' else relative_dir
+        entries = self.visible(directory, relative_dir, matcher)
+
+        start = 0
+        if cursor:
+            kind, _, name = cursor.partition('/')
+            start = bisect.bisect_right(entries, (kind, name.lower(), name), key=lambda entry: entry[:3])
+        page = entries[start:start + limit]
+
+        children = []
+        for kind, _, name, size, modified in page:
+            path = os.path.join(directory, name)
+            child = {
+                'name': name,
+                'type': 'directory' if kind == 'd' else 'file',
+                'path': path,
+                'relative_path': os.path.join(relative_dir, name),
+                'size': size,
+                'modified': modified,
+            }
+            if kind == 'd':
+                child['has_children'] = self.has_children(path, child['relative_path'], matcher)
+            children.append(child)
+
+        has_more = start + limit < len(entries)
+        return {
+            'path': relative_dir,
+            'entries': children,
+            'next_cursor': f"{page[-1][0]}/{page[-1][2]}" if has_more and page else None,
+        }
+
+
+directory_listings = DirectoryListingCache(max_dirs=getattr(settings, 'PROJECT_DIRECTORY_CACHE_SIZE', 1024))
+
+
+def complete_utf8_length(data):
+    """
+    Returns the length of `data` without a multi-byte UTF-8 character cut off at its end.
+    """
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            continue  # Continuation byte, keep looking for the lead byte
+        needed = 1 if byte < 0x80 else 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+        return len(data) - back if needed > back else len(data)
+    return len(data)
+
+
+def hex_dump(data, offset=0):
+    """
+    Formats bytes like `xxd`: offset, sixteen hex bytes and their printable characters per line.
+    """
+    lines = []
+    for start in range(0, len(data), 16):
+        chunk = data[start:start + 16]
+        hex_part = ' '.join(chunk[i:i + 2].hex() for i in range(0, len(chunk), 2))
+        text_part = ''.join(chr(byte) if 32 <= byte < 127 else '.' for byte in chunk)
+        lines.append(f"{offset + start:08x}: {hex_part:<39}  {text_part}")
+    return '\n'.join(lines)
+
+
+class FileRangeReader:
+    """
+    Reads byte and line ranges of project files through `mmap`, so opening a large file only
+    touches the pages that are shown.
+
+    Line ranges use a sparse index holding the offset of every `LINE_INDEX_STEP`th line,
+    kept per file version (path, mtime, size), so paging through a large file does not rescan
+    it from the start.
+    """
+    SNIFF_BYTES = 8192
+    LINE_INDEX_STEP = 1000
+
+    def __init__(self, max_indexes):
+        self.max_indexes = max_indexes
+        self._line_indexes = OrderedDict()
+        self._lock = Lock()
+
+    def sniff(self, path):
+        """
+        Returns (size, is_binary), judged from the file's first few KB.
+        """
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            head = file.read(self.SNIFF_BYTES)
+        if b'\0' in head:
+            return size, True
+        try:
+            head[:complete_utf8_length(head)].decode('utf-8')
+        except UnicodeDecodeError:
+            return size, True
+        return size, False
+
+    def read_bytes(self, path, offset, length):
+        """
+        Returns the file's bytes from `offset` (at most `length` of them) and its size.
+        """
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if offset >= size or length <= 0:
+                return b'', size
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[offset:offset + length], size
+
+    def read_text(self, path, offset, length):
+        """
+        Returns a text range starting at byte `offset`, cut at a character boundary.
+        """
+        data, size = self.read_bytes(path, offset, length)
+        if offset + len(data) < size:
+            data = data[:complete_utf8_length(data)]
+        return {
+            'content': data.decode('utf-8', errors='replace'),
+            'offset': offset,
+            'next_offset': offset + len(data) if offset + len(data) < size else None,
+            'size': size,
+        }
+
+    def read_hex(self, path, offset, length):
+        """
+        Returns a hex dump of a binary range, aligned to 16-byte rows.
+        """
+        offset -= offset % 16
+        data, size = self.read_bytes(path, offset, length)
+        return {
+            'content': hex_dump(data, offset),
+            'offset': offset,
+            'next_offset': offset + len(data) if offset + len(data) < size else None,
+            'size': size,
+            'binary': True,
+        }
+
+    def read_lines(self, path, start_line, count):
+        """
+        Returns up to `count` lines starting at the zero-based `start_line`.
+        """
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            if stat.st_size == 0:
+                return {'content': '', 'start_line': start_line, 'end_line': start_line, 'offset': 0,
+                        'next_offset': None, 'size': 0}
+
+            key = (path, stat.st_mtime_ns, stat.st_size)
+            with self._lock:
+                checkpoints = list(self._line_indexes.get(key, [0]))
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                size = stat.st_size
+                index = min(start_line // self.LINE_INDEX_STEP, len(checkpoints) - 1)
+                position, line = checkpoints[index], index * self.LINE_INDEX_STEP
+                while line < start_line and position < size:
+                    newline = mapped.find(b'\n', position)
+                    position = size if newline == -1 else newline + 1
+                    line += 1
+                    if line % self.LINE_INDEX_STEP == 0 and line // self.LINE_INDEX_STEP == len(checkpoints):
+                        checkpoints.append(position)
+
+                end, lines_read = position, 0
+                while lines_read < count and end < size:
+                    newline = mapped.find(b'\n', end)
+                    end = size if newline == -1 else newline + 1
+                    lines_read += 1
+                content = mapped[position:end].decode('utf-8', errors='replace')
+
+        with self._lock:
+            self._line_indexes[key] = checkpoints
+            self._line_indexes.move_to_end(key)
+            while len(self._line_indexes) > self.max_indexes:
+                self._line_indexes.popitem(last=False)
+
+        return {
+            'content': content,
+            'start_line': line,
+            'end_line': line + lines_read,
+            'offset': position,
+            'next_offset': end if end < size else None,
+            'size': size,
+        }
+
+
+file_ranges = FileRangeReader(max_indexes=getattr(settings, 'OPEN_FILE_LINE_INDEX_CACHE_SIZE', 64))
+
+
+class FileVersionConflict(Exception):
+    """
+    Raised when a file changed on disk after the version an edit was based on.
+    """
+
+    def __init__(self, version):
+        super().__init__("The file changed on disk since it was opened.")
+        self.version = version
+
+
+_file_digests = OrderedDict()  # path -> (stat signature, git blob hash)
+_file_digests_lock = Lock()
+
+
+def file_version(path):
+    """
+    Returns a token that changes whenever the file is rewritten, or None if it does not exist.
+
+    It combines the mtime with a content hash, since a same-size rewrite within one mtime tick
+    leaves the stat data unchanged. Hashes are reused under the file's stat signature once the
+    file is old enough for the signature to be trusted.
+    """
+    try:
+        stat = os.stat(path)
+        with _file_digests_lock:
+            cached = _file_digests.get(path)
+        if cached and cached[0] == stat_signature(stat):
+            digest = cached[1]
+        else:
+            signature, digest = git_blob_hash(path)
+            if signature:
+                with _file_digests_lock:
+                    _file_digests[path] = (signature, digest)
+                    _file_digests.move_to_end(path)
+                    while len(_file_digests) > getattr(settings, 'FILE_VERSION_CACHE_SIZE', 1024):
+                        _file_digests.popitem(last=False)
+    except OSError:
+        return None
+    return f"{stat.st_mtime_ns:x}-{digest[:16]}"
+
+
+def atomic_write(path, data):
+    """
+    Writes `data` to a temporary file beside `path` and renames it into place, so readers
+    never see a half-written file. The file's mode and, where permitted, owner are kept.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            stat = os.stat(path)
+            os.chmod(temp_path, stat.st_mode & 0o7777)
+            try:
+                os.chown(temp_path, stat.st_uid, stat.st_gid)
+            except PermissionError:
+                pass
+        except FileNotFoundError:
+            os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+_file_write_locks = [Lock() for _ in range(64)]
+
+
+def is_file_edit(edit):
+    """
+    Tells whether `edit` is an {'offset', 'remove', 'text'} object with integer offset and length
+    and string text. 'remove' and 'text' may be left out.
+    """
+    return (isinstance(edit, dict) and 'offset' in edit
+            and all(type(edit.get(key, 0)) is int for key in ('offset', 'remove'))
+            and isinstance(edit.get('text', ''), str))
+
+
+def apply_file_edits(path, base_version, edits):
+    """
+    Applies editor deltas to a file and writes it atomically. Returns (new version, size change).
+
+    Each edit is {'offset', 'remove', 'text'}, applied in order to the result of the previous one.
+    Offsets and lengths count UTF-16 code units, as the browser editor does, over the file's text
+    with line endings normalized to "\\n". Raises ValueError if `edits` is not a list of such
+    edits, and FileVersionConflict if the file is no longer at `base_version`.
+    """
+    if not isinstance(edits, list) or not all(is_file_edit(edit) for edit in edits):
+        raise ValueError("Edits must be a list of {offset, remove, text} objects.")
+
+    with _file_write_locks[hash(path) % len(_file_write_locks)]:
+        current_version = file_version(path)
+        if current_version != base_version:
+            raise FileVersionConflict(current_version)
+
+        with open(path, 'rb') as file:
+            data = file.read()
+        text = data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+        units = bytearray(text.encode('utf-16-le'))
+        for edit in edits:
+            offset, remove = edit['offset'], edit.get('remove', 0)
+            if offset < 0 or remove < 0 or (offset + remove) * 2 > len(units):
+                raise ValueError("Edit is outside the file.")
+            units[offset * 2:(offset + remove) * 2] = edit.get('text', '').encode('utf-16-le')
+
+        new_data = units.decode('utf-16-le').encode('utf-8')
+        atomic_write(path, new_data)
+        return file_version(path), len(new_data) - len(data)
 
 
 class ProjectContainerManager:
     """
     Manages Docker containers for user projects.
+
+    Idle containers are paused and later stopped by the shared `idle_container_reaper`, so
+    every command only needs to refresh `DockerSession.last_activity_at`.
     """
-    TIMEOUT_SECONDS = 3600  # Timeout duration (1 hour)
+    ACTIVITY_WRITE_INTERVAL = 30  # Minimum seconds between last activity writes
 
     def __init__(self, project, user):
         """
@@ -27,64 +2248,92 @@ class ProjectContainerManager:
         self.user = user
         self.container_name = f"{self.user.username}_{self.user.id}"
         self.project_path = user.project_dir
-        self.client = docker.from_env()
-        self.timeout_timer = None
+        self.volume_path = f'/mnt/{self.user.id}_volume'
+        self.client = docker_endpoints.client()
+        self.last_activity_written = 0.0
+
+        if getattr(settings, 'DOCKER_REAPER_IN_PROCESS', True):
+            idle_container_reaper.start()
+        if getattr(settings, 'DOCKER_STATS_IN_PROCESS', False):
+            container_stats_sampler.start()
 
     def get_container(self):
         """
-        Retrieves the container associated with the user from the model.
+        Retrieves the container associated with the user, from the handle cache if possible,
+        otherwise from the model.
         """
+        container = container_handle_cache.get(self.user.id)
+        if container is not None:
+            self.client = container.client
+            return container
+
         try:
             docker_session = DockerSession.objects.get(user=self.user)
-            return self.client.containers.get(docker_session.container_id)
+            self.client = docker_endpoints.client(docker_session.endpoint)
+            container = self.client.containers.get(docker_session.container_id)
         except (DockerSession.DoesNotExist, docker.errors.NotFound):
             return None
 
+        if not warm_container_pool.rebind(container, self.project_path, self.volume_path):
+            # A pool container whose workspace cannot be mounted again is replaced by a new one
+            container.remove(force=True)
+            warm_container_pool.release(container)
+            return None
+
+        if container.status == 'running':
+            container_handle_cache.set(self.user.id, container)
+        return container
+
     def create_container(self):
         """
-        Creates a new Docker container for the user and saves the session in the model.
+        Creates a new Docker container for the user on the least-loaded Docker endpoint, claiming
+        a warm one from the pool when available, and saves the session in the model.
         """
-        volume_path = f'/mnt/{self.user.id}_volume'
         self._remove_existing_container()
 
-        container = self.client.containers.run(
-            image='terminal_session',
-            name=self.container_name,
-            volumes={
-                self.project_path: {'bind': f'/{self.user}', 'mode': 'rw'},
-                volume_path: {'bind': f'{self.project_path}/mnt', 'mode': 'rw'},
-            },
-            working_dir=f'/{self.user}',
-            stdin_open=True,
-            tty=True,
-            command='/bin/bash -l',
-            detach=True,
-            user=f"{os.getuid()}:{os.getgid()}",
-            security_opt=["no-new-privileges"],
-            read_only=False,
-            mem_limit=self.user.subscription.mem_limit,
-            memswap_limit=self.user.subscription.memswap_limit,
-        )
+        endpoint = docker_endpoints.place()
+        self.client = docker_endpoints.client(endpoint)
+        container = warm_container_pool.claim(self.user, self.container_name, endpoint, self.volume_path)
+        if container is None:
+            # Same targets as the slots of pool containers, so both look alike from the inside
+            container = self.client.containers.run(
+                name=self.container_name,
+                volumes={
+                    self.project_path: {'bind': CONTAINER_WORKSPACE, 'mode': 'rw'},
+                    self.volume_path: {'bind': CONTAINER_VOLUME, 'mode': 'rw'},
+                    **git_mirrors.container_volumes(),
+                },
+                working_dir=CONTAINER_WORKSPACE,
+                **terminal_container_options(self.user.subscription.container_limits()),
+            )
 
-        DockerSession.objects.create(
+        DockerSession.objects.update_or_create(
             user=self.user,
-            container_id=container.id,
-            container_name=self.container_name,
-            created_at=timezone.now(),
-            status='running',
-            mounted_volume=volume_path,
+            defaults={
+                'container_id': container.id,
+                'container_name': self.container_name,
+                'endpoint': endpoint,
+                'created_at': timezone.now(),
+                'status': 'running',
+                'mounted_volume': self.volume_path,
+                'last_activity_at': timezone.now(),
+            },
         )
 
-        self._start_timeout_timer()
+        container_handle_cache.set(self.user.id, container)
         return container
 
     def _remove_existing_container(self):
         """
         Removes any existing container with the same name.
         """
+        container_handle_cache.invalidate(self.user.id)
+        docker_session = DockerSession.objects.filter(user=self.user).first()
+        client = docker_endpoints.client(docker_session.endpoint if docker_session else None)
         try:
-            existing_container = self.client.containers.get(self.container_name)
+            existing_container = client.containers.get(self.container_name)
             existing_container.remove(force=True)
+            warm_container_pool.release(existing_container)
         except docker.errors.NotFound:
             pass
 
@@ -93,13 +2342,22 @@ class ProjectContainerManager:
         Starts the container if it's not already running, or creates a new one.
         """
         container = self.get_container()
-        if container and container.status != "running":
+        if container and container.status == "paused":
+            container.unpause()
+            container.reload()
+            container_handle_cache.set(self.user.id, container)
+            DockerSession.objects.filter(user=self.user).update(status='running', last_activity_at=timezone.now())
+            self.last_activity_written = time.monotonic()
+        elif container and container.status != "running":
             container.start()
-            DockerSession.objects.filter(user=self.user).update(status='running')
+            container.reload()
+            container_handle_cache.set(self.user.id, container)
+            DockerSession.objects.filter(user=self.user).update(status='running', last_activity_at=timezone.now())
+            self.last_activity_written = time.monotonic()
         elif not container:
             container = self.create_container()
+            self.last_activity_written = time.monotonic()
 
-        self._start_timeout_timer()
         return container
 
     def attach_container(self):
@@ -110,38 +2368,101 @@ class ProjectContainerManager:
         self._update_last_activity()
         return container
 
-    def _update_last_activity(self):
+    def _update_last_activity(self, force=True):
         """
-        Updates the last activity timestamp for the user's session.
+        Updates the last activity timestamp for the user's session. Unforced updates are
+        throttled to one write per ACTIVITY_WRITE_INTERVAL.
         """
-        DockerSession.objects.filter(user=self.user).update(last_activity_at=timezone.now())
+        if not force and time.monotonic() - self.last_activity_written < self.ACTIVITY_WRITE_INTERVAL:
+            return
 
-    def _start_timeout_timer(self):
+        # Activity on an attached shell can arrive after the reaper paused the container
+        resumed = DockerSession.objects.filter(user=self.user, status='paused').update(
+            status='running', last_activity_at=timezone.now()
+        )
+        if resumed:
+            container_handle_cache.invalidate(self.user.id)
+            container = self.get_container()
+            if container and container.status == 'paused':
+                container.unpause()
+        else:
+            DockerSession.objects.filter(user=self.user).update(last_activity_at=timezone.now())
+        self.last_activity_written = time.monotonic()
+
+    @staticmethod
+    def update_container_limits(user):
         """
-        Starts or resets the timeout timer for the container session.
+        Re-applies the user's plan limits to their existing container, e.g. after a plan change.
+        Returns False if the user has no container.
         """
-        if self.timeout_timer:
-            self.timeout_timer.cancel()
+        try:
+            docker_session = DockerSession.objects.get(user=user)
+            container = docker_endpoints.client(docker_session.endpoint).containers.get(docker_session.container_id)
+        except (DockerSession.DoesNotExist, docker.errors.NotFound):
+            return False
 
-        self.timeout_timer = Timer(self.TIMEOUT_SECONDS, self._stop_container_due_to_timeout)
-        self.timeout_timer.start()
+        container.update(**resource_limit_options(user.subscription.container_limits()))
+        return True
 
-    def _stop_container_due_to_timeout(self):
+    def execute_command(self, command):
         """
-        Stops the container if the session times out.
+        Executes a command in the container and returns the output.
         """
-        container = self.get_container()
-        if container:
-            container.stop()
-            DockerSession.objects.filter(user=self.user).update(status='stopped')
+        container = self.start_container()
 
-    def execute_command(self, command):
+        try:
+            exec_instance = self._exec(container, command)
+        except (docker.errors.NotFound, docker.errors.APIError):
+            # The cached handle went stale (container stopped or removed elsewhere), retry once.
+            container_handle_cache.invalidate(self.user.id)
+            exec_instance = self._exec(self.start_container(), command)
+
+        self._update_last_activity(force=False)
+
+        return {
+            'formatted_output': exec_instance.output.decode().strip(),
+            'exit_code': exec_instance.exit_code
+        }
+
+    def open_shell(self, rows=24, cols=80):
         """
-        Executes a command in the container and returns the output.
+        Starts an interactive login shell on a PTY and returns it attached through one socket
+        that is reused for the whole terminal session.
         """
         container = self.start_container()
+        pid_file = f"/tmp/.ide-shell-{uuid.uuid4().hex}.pid"
+        exec_id = self._exec_create(container, [*SHELL_COMMAND, pid_file], stdin=True,
+                                    environment={'TERM': 'xterm-256color'})
+        sock = self.client.api.exec_start(exec_id, tty=True, socket=True)
+        shell = ShellSession(self, exec_id, pid_file, sock)
+        shell.resize(rows, cols)
+        self._update_last_activity()
+        return shell
+
+    def _exec_create(self, container, cmd, stdin=False, environment=None):
+        """
+        Creates an exec in the container, retrying once with a fresh handle if the cached one went
+        stale (container stopped or removed elsewhere).
+        """
+        options = {'cmd': cmd, 'stdout': True, 'stderr': True, 'stdin': stdin, 'tty': True, 'environment': environment}
+        try:
+            return self.client.api.exec_create(container.id, **options)['Id']
+        except (docker.errors.NotFound, docker.errors.APIError):
+            container_handle_cache.invalidate(self.user.id)
+            return self.client.api.exec_create(self.start_container().id, **options)['Id']
+
+    def exec_exit_code(self, exec_id):
+        """
+        Returns the exit code of a finished exec, or None while it is still running.
+        """
+        return self.client.api.exec_inspect(exec_id)['ExitCode']
 
-        exec_instance = container.exec_run(
+    @staticmethod
+    def _exec(container, command):
+        """
+        Runs a single bash command in the container.
+        """
+        return container.exec_run(
             cmd=['/bin/bash', '-c', command],
             stdout=True,
             stderr=True,
@@ -149,38 +2470,1046 @@ class ProjectContainerManager:
             tty=True
         )
 
-        self._start_timeout_timer()
-
-        return {
-            'formatted_output': exec_instance.output.decode().strip(),
-            'exit_code': exec_instance.exit_code
-        }
-
     def delete_container(self):
         """
         Deletes the Docker container and updates the session status to 'removed'.
         """
         container = self.get_container()
+        container_handle_cache.invalidate(self.user.id)
         if container:
             container.remove(force=True)
+            warm_container_pool.release(container)
             DockerSession.objects.filter(user=self.user).update(status='removed')
 
-        if self.timeout_timer:
-            self.timeout_timer.cancel()
+
+class ShellSession:
+    """
+    Interactive shell attached to a container through a single PTY exec socket.
+    """
+    READ_SIZE = 4096
+
+    def __init__(self, manager, exec_id, pid_file, sock):
+        self.manager = manager
+        self.exec_id = exec_id
+        self.pid_file = pid_file
+        self.sock = sock
+        self._raw = getattr(sock, '_sock', sock)
+
+    def read(self):
+        """
+        Blocks for the next chunk of terminal output, returning b'' once the shell has exited.
+        Output counts as activity, so programs that print without input are not paused.
+        """
+        try:
+            chunk = self._raw.recv(self.READ_SIZE)
+        except OSError:
+            return b''
+        if chunk:
+            self.manager._update_last_activity(force=False)
+        return chunk
+
+    def write(self, data):
+        """
+        Sends raw keystrokes to the shell.
+        """
+        self._raw.sendall(data.encode() if isinstance(data, str) else data)
+        self.manager._update_last_activity(force=False)
+
+    def resize(self, rows, cols):
+        """
+        Resizes the PTY. Ignored while the exec is still starting up.
+        """
+        try:
+            self.manager.client.api.exec_resize(self.exec_id, height=rows, width=cols)
+        except docker.errors.APIError:
+            pass
+
+    def close(self):
+        """
+        Hangs up the shell and closes the exec socket. Closing the socket alone leaves the exec
+        running, so the shell is sent SIGHUP, which it passes on to its jobs.
+        """
+        try:
+            container = self.manager.get_container()
+            if container:
+                container.exec_run(['/bin/sh', '-c', f'[ -f {self.pid_file} ] && kill -HUP $(cat {self.pid_file}); '
+                                                     f'rm -f {self.pid_file}'])
+        except docker.errors.APIError as e:
+            logger.warning("Failed to hang up shell %s: %s", self.exec_id, e)
+        try:
+            self._raw.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def stat_signature(stat):
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def git_blob_hash(path, chunk_size=1024 * 1024):
+    """
+    Hashes a file the way git hashes blobs and returns (stat signature, hex digest). Symlinks
+    hash their target. The signature is None when the result must not be cached: the file
+    changed while it was read, or was modified too recently to rule out a same-mtime rewrite.
+    """
+    if os.path.islink(path):
+        stat, content = os.lstat(path), os.fsencode(os.readlink(path))
+        return stat_signature(stat), hashlib.sha1(b'blob %d\0' % len(content) + content).hexdigest()
+
+    with open(path, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        digest, read = hashlib.sha1(b'blob %d\0' % stat.st_size), 0
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+            read += len(chunk)
+    signature = stat_signature(stat)
+    if read != stat.st_size or stat_signature(os.stat(path)) != signature or stat.st_mtime_ns > time.time_ns() - 2 * 10 ** 9:
+        signature = None
+    return signature, digest.hexdigest()
+
+
+class BlobHashCache:
+    """
+    Remembers each project file's git blob hash under its (size, mtime_ns, inode) signature, so a
+    change scan only rehashes files whose signature changed and otherwise costs one walk.
+
+    Hashes persist per project in `root` as a header followed by fixed-size records (path length,
+    size, mtime_ns, inode, 20-byte SHA-1) each trailed by its UTF-8 path. The `max_projects`
+    most recently scanned projects also stay in memory. Stale files are hashed on a thread pool.
+    """
+    MAGIC = b'BHC1'
+    RECORD = struct.Struct('<HQqQ20s')
+
+    def __init__(self, root, max_projects, max_workers):
+        self.root = str(root)
+        self.max_projects = max_projects
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='blob-hash')
+        self._projects = OrderedDict()
+        self._projects_lock = Lock()  # Guards the LRU order; the striped locks serialize scans of one project
+        self._locks = [Lock() for _ in range(64)]
+
+    def cache_path(self, project_path):
+        key = hashlib.sha256(os.path.normpath(project_path).encode()).hexdigest()[:32]
+        return os.path.join(self.root, f"{key}.bhc")
+
+    def load(self, project_path):
+        """
+        Reads a project's stored hashes as {relative path: (signature, hex digest)}.
+        """
+        try:
+            with open(self.cache_path(project_path), 'rb') as file:
+                data = file.read()
+        except OSError:
+            return {}
+        if not data.startswith(self.MAGIC):
+            return {}
+
+        hashes, offset = {}, len(self.MAGIC)
+        try:
+            while offset < len(data):
+                path_length, size, mtime_ns, inode, digest = self.RECORD.unpack_from(data, offset)
+                offset += self.RECORD.size
+                path = data[offset:offset + path_length].decode('utf-8', 'surrogateescape')
+                offset += path_length
+                hashes[path] = ((size, mtime_ns, inode), digest.hex())
+        except struct.error:
+            return {}  # Truncated; everything is simply rehashed
+        return hashes
+
+    def save(self, project_path, hashes):
+        records = [self.MAGIC]
+        for path, ((size, mtime_ns, inode), digest) in hashes.items():
+            encoded = path.encode('utf-8', 'surrogateescape')
+            records.append(self.RECORD.pack(len(encoded), size, mtime_ns, inode, bytes.fromhex(digest)) + encoded)
+        os.makedirs(self.root, exist_ok=True)
+        atomic_write(self.cache_path(project_path), b''.join(records))
+
+    def hashes(self, project_path, matcher=None):
+        """
+        Returns {relative path: blob hex digest} for the project's files, skipping hidden and
+        ignored paths, and stores the signatures of newly hashed files.
+        """
+        project_path = os.path.normpath(project_path)
+        with self._locks[hash(project_path) % len(self._locks)]:
+            with self._projects_lock:
+                cached = self._projects.pop(project_path, None)
+            if cached is None:
+                cached = self.load(project_path)
+
+            current, stale = {}, {}
+            for relative_dir, dirs, files in walk_project(project_path, matcher):
+                for entry in files:
+                    relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                    try:
+                        signature = stat_signature(entry.stat(follow_symlinks=False))
+                    except OSError:
+                        continue
+                    known = cached.get(relative_path)
+                    if known and known[0] == signature:
+                        current[relative_path] = known
+                    else:
+                        stale[relative_path] = self.executor.submit(git_blob_hash, entry.path)
+
+            uncached = {}
+            for relative_path, future in stale.items():
+                try:
+                    signature, digest = future.result()
+                except OSError:
+                    continue
+                if signature is None:
+                    uncached[relative_path] = digest
+                else:
+                    current[relative_path] = (signature, digest)
+
+            if stale or len(current) != len(cached):
+                try:
+                    self.save(project_path, current)
+                except OSError as e:
+                    logger.warning("Could not store blob hashes for %s: %s", project_path, e)
+            with self._projects_lock:
+                self._projects[project_path] = current
+                while len(self._projects) > self.max_projects:
+                    self._projects.popitem(last=False)
+
+        return {**{path: digest for path, (signature, digest) in current.items()}, **uncached}
+
+
+blob_hashes = BlobHashCache(
+    root=getattr(settings, 'BLOB_HASH_CACHE_DIR', os.path.join(settings.BASE_DIR, 'BlobHashCache')),
+    max_projects=getattr(settings, 'BLOB_HASH_CACHE_PROJECTS', 64),
+    max_workers=getattr(settings, 'BLOB_HASH_WORKERS', 4),
+)
+
+
+def is_git_checkout(project_path):
+    """
+    True if the project has its own `.git` directory. Git files and symlinks pointing at a
+    repository elsewhere do not count.
+    """
+    git_dir = os.path.join(project_path, '.git')
+    return os.path.isdir(git_dir) and not os.path.islink(git_dir)
+
+
+def open_inside(root, path):
+    """
+    Opens `path` for reading only if the file actually opened lies inside `root`, so symlinks
+    (even ones swapped in after a check) cannot make us read other users' files.
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0) | getattr(os, 'O_NONBLOCK', 0))
+    try:
+        try:
+            real_path = os.readlink(f'/proc/self/fd/{fd}')
+        except OSError:
+            real_path = os.path.realpath(path)
+        if not real_path.startswith(root + os.sep):
+            raise ValueError(f"{path} points outside {root}")
+        if not S_ISREG(os.fstat(fd).st_mode):
+            raise ValueError(f"{path} is not a regular file")
+        return os.fdopen(fd, 'rb')
+    except BaseException:
+        os.close(fd)
+        raise
+
+
+class GitObjectStore:
+    """
+    Reads objects from a repository's loose objects and pack files in pure Python.
+
+    Projects' `.git` directories are writable from users' containers, so running host git in
+    them would execute whatever their config asks for (fsmonitor, filters, ...). This reader
+    never runs anything and only opens files inside the repository, or inside the shared git
+    mirrors its alternates may borrow objects from.
+    """
+    TYPES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+    OFS_DELTA, REF_DELTA = 6, 7
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        objects = os.path.join(git_dir, 'objects')
+        self.object_dirs = [(git_dir, objects)]
+        mirror_root = os.path.realpath(git_mirrors.root)
+        try:
+            with open_inside(git_dir, os.path.join(objects, 'info', 'alternates')) as file:
+                alternates = file.read().decode('utf-8', 'surrogateescape').splitlines()
+        except FileNotFoundError:
+            alternates = []
+        for alternate in alternates:
+            if alternate.strip() and not alternate.startswith('#'):
+                alternate = os.path.realpath(os.path.join(objects, alternate.strip()))
+                if not alternate.startswith(mirror_root + os.sep):
+                    raise ValueError(f"Alternate object directory {alternate} is not a git mirror")
+                self.object_dirs.append((mirror_root, alternate))
+        self._packs = None
+
+    def packs(self):
+        """
+        Returns (root, index data, pack path) for every pack, reading the pack indexes once.
+        """
+        if self._packs is None:
+            self._packs = []
+            for root, objects in self.object_dirs:
+                pack_dir = os.path.join(objects, 'pack')
+                try:
+                    names = sorted(name for name in os.listdir(pack_dir) if name.endswith('.idx'))
+                except OSError:
+                    continue
+                for name in names:
+                    with open_inside(root, os.path.join(pack_dir, name)) as file:
+                        index = file.read()
+                    if index[:8] != b'\377tOc\0\0\0\2':
+                        raise ValueError(f"Unsupported pack index {name}")
+                    self._packs.append((root, index, os.path.join(pack_dir, f"{name[:-4]}.pack")))
+        return self._packs
+
+    def read(self, sha):
+        """
+        Returns (type, content) of the object with the hex `sha`.
+        """
+        for root, objects in self.object_dirs:
+            try:
+                with open_inside(root, os.path.join(objects, sha[:2], sha[2:])) as file:
+                    data = zlib.decompress(file.read())
+            except FileNotFoundError:
+                continue
+            header, _, content = data.partition(b'\0')
+            return header.split(b' ')[0].decode(), content
+
+        binary_sha = bytes.fromhex(sha)
+        for root, index, pack_path in self.packs():
+            offset = self._pack_offset(index, binary_sha)
+            if offset is not None:
+                with open_inside(root, pack_path) as file, \
+                        mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as pack:
+                    return self._unpack(pack, offset)
+        raise KeyError(sha)
+
+    @staticmethod
+    def _pack_offset(index, binary_sha):
+        """
+        Looks an object up in a version 2 pack index and returns its offset in the pack.
+        """
+        fanout = struct.unpack_from('>256I', index, 8)
+        count = fanout[255]
+        low, high = fanout[binary_sha[0] - 1] if binary_sha[0] else 0, fanout[binary_sha[0]]
+        names = 8 + 256 * 4
+        while low < high:
+            middle = (low + high) // 2
+            name = index[names + 20 * middle:names + 20 * middle + 20]
+            if name < binary_sha:
+                low = middle + 1
+            elif name > binary_sha:
+                high = middle
+            else:
+                offsets = names + 24 * count
+                offset, = struct.unpack_from('>I', index, offsets + 4 * middle)
+                if offset & 0x80000000:
+                    offset, = struct.unpack_from('>Q', index, offsets + 4 * count + 8 * (offset & 0x7fffffff))
+                return offset
+        return None
+
+    def _unpack(self, pack, offset):
+        """
+        Reads the object at `offset` in a pack, resolving its chain of deltas.
+        """
+        deltas = []
+        while True:
+            byte = pack[offset]
+            kind, position, shift = (byte >> 4) & 7, offset + 1, 4
+            while byte & 0x80:
+                byte = pack[position]
+                position += 1
+                shift += 7
+            if kind == self.OFS_DELTA:
+                byte = pack[position]
+                position += 1
+                distance = byte & 0x7f
+                while byte & 0x80:
+                    byte = pack[position]
+                    position += 1
+                    distance = ((distance + 1) << 7) | (byte & 0x7f)
+                deltas.append(self._inflate(pack, position))
+                offset -= distance
+            elif kind == self.REF_DELTA:
+                deltas.append(self._inflate(pack, position + 20))
+                kind, content = self.read(pack[position:position + 20].hex())
+                break
+            elif kind in self.TYPES:
+                kind, content = self.TYPES[kind], self._inflate(pack, position)
+                break
+            else:
+                raise ValueError(f"Unknown pack object type {kind}")
+
+        for delta in reversed(deltas):
+            content = apply_git_delta(content, delta)
+        return kind, content
+
+    @staticmethod
+    def _inflate(pack, position, chunk_size=65536):
+        decompressor, parts = zlib.decompressobj(), []
+        while not decompressor.eof:
+            chunk = pack[position:position + chunk_size]
+            if not chunk:
+                raise ValueError("Truncated pack object")
+            parts.append(decompressor.decompress(chunk))
+            position += len(chunk)
+        return b''.join(parts)
+
+
+def apply_git_delta(base, delta):
+    """
+    Applies a git pack delta (copy and insert instructions) to `base`.
+    """
+    def size(position):
+        value = shift = 0
+        while True:
+            byte = delta[position]
+            position += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, position
+
+    base_size, position = size(0)
+    result_size, position = size(position)
+    if base_size != len(base):
+        raise ValueError("Delta does not apply to its base")
+
+    result = bytearray()
+    while position < len(delta):
+        opcode = delta[position]
+        position += 1
+        if opcode & 0x80:
+            offset = length = 0
+            for bit in range(4):
+                if opcode & (1 << bit):
+                    offset |= delta[position] << (8 * bit)
+                    position += 1
+            for bit in range(3):
+                if opcode & (0x10 << bit):
+                    length |= delta[position] << (8 * bit)
+                    position += 1
+            result += base[offset:offset + (length or 0x10000)]
+        elif opcode:
+            result += delta[position:position + opcode]
+            position += opcode
+        else:
+            raise ValueError("Invalid delta instruction")
+    if len(result) != result_size:
+        raise ValueError("Delta produced the wrong size")
+    return bytes(result)
+
+
+def git_tree_entries(content):
+    """
+    Yields (mode, name, hex sha) for each entry of a tree object.
+    """
+    position = 0
+    while position < len(content):
+        space = content.index(b' ', position)
+        null = content.index(b'\0', space)
+        yield (int(content[position:space], 8), content[space + 1:null].decode('utf-8', 'surrogateescape'),
+               content[null + 1:null + 21].hex())
+        position = null + 21
+
+
+GIT_INDEX_ENTRY = struct.Struct('>10I20sH')  # ctime, mtime (s, ns), dev, ino, mode, uid, gid, size, sha, flags
+
+
+def read_git_index(git_dir):
+    """
+    Parses a repository's index (versions 2 to 4).
+
+    Returns ({path: (mode, sha, mtime_ns, ctime_ns, size, inode)} for merged entries, set of
+    conflicted paths, cache tree, index mtime_ns). The cache tree is (sha or None, {name: child})
+    for the root directory, taken from the index's TREE extension; a sha means the directory's
+    entries in the index still match that tree. Sizes and inodes are truncated to 32 bits.
+    """
+    try:
+        with open_inside(git_dir, os.path.join(git_dir, 'index')) as file:
+            index_mtime = os.fstat(file.fileno()).st_mtime_ns
+            data = file.read()
+    except FileNotFoundError:
+        return {}, set(), None, 0
+
+    signature, version, count = struct.unpack_from('>4sII', data)
+    if signature != b'DIRC' or version not in (2, 3, 4):
+        raise ValueError(f"Unsupported git index version {version}")
+
+    entries, conflicts, offset, previous = {}, set(), 12, b''
+    for _ in range(count):
+        (ctime_s, ctime_ns, mtime_s, mtime_ns, _, inode, mode, _, _, size, sha,
+         flags) = GIT_INDEX_ENTRY.unpack_from(data, offset)
+        start, offset = offset, offset + GIT_INDEX_ENTRY.size
+        extended = 0
+        if flags & 0x4000 and version >= 3:
+            extended, = struct.unpack_from('>H', data, offset)
+            offset += 2
+        if version == 4:
+            # Paths are stored as a count of bytes to drop from the previous path plus a suffix
+            byte = data[offset]
+            offset += 1
+            strip = byte & 0x7f
+            while byte & 0x80:
+                byte = data[offset]
+                offset += 1
+                strip = ((strip + 1) << 7) | (byte & 0x7f)
+            end = data.index(b'\0', offset)
+            path = previous[:len(previous) - strip] + data[offset:end]
+            offset = end + 1
+        else:
+            end = data.index(b'\0', offset)
+            path = data[offset:end]
+            offset = start + (end - start + 8) // 8 * 8  # NUL padded to a multiple of 8 bytes
+        previous = path
+
+        path = path.decode('utf-8', 'surrogateescape')
+        if flags & 0x3000:
+            conflicts.add(path)
+        elif not extended & 0x4000 and mode != 0o40000:  # Skip skip-worktree and sparse directory entries
+            # Intent-to-add entries carry the empty blob's sha, which no real blob matches
+            entries[path] = (mode, None if extended & 0x2000 else sha.hex(), mtime_s * 10 ** 9 + mtime_ns,
+                             ctime_s * 10 ** 9 + ctime_ns, size, inode)
+
+    cache_tree = None
+    while offset + 8 <= len(data) - 20:
+        name, length = struct.unpack_from('>4sI', data, offset)
+        if name == b'link':
+            raise ValueError("Split indexes are not supported")
+        if name == b'TREE':
+            cache_tree = _parse_cache_tree(data[offset + 8:offset + 8 + length])
+        offset += 8 + length
+    return entries, conflicts - set(entries), cache_tree, index_mtime
+
+
+def _parse_cache_tree(data):
+    position = 0
+
+    def node():
+        nonlocal position
+        null = data.index(b'\0', position)
+        name = data[position:null].decode('utf-8', 'surrogateescape')
+        newline = data.index(b'\n', null)
+        entry_count, subtree_count = (int(value) for value in data[null + 1:newline].split(b' '))
+        position, sha = newline + 1, None
+        if entry_count >= 0:
+            sha, position = data[position:position + 20].hex(), position + 20
+        children = dict(node() for _ in range(subtree_count))
+        return name, (sha, children)
+
+    return node()[1] if data else None
+
+
+def git_head_tree(git_dir, objects):
+    """
+    Returns the sha of the tree HEAD points at, or None on an unborn branch.
+    """
+    def read_ref(name):
+        try:
+            with open_inside(git_dir, os.path.join(git_dir, name)) as file:
+                return file.read().decode().strip()
+        except FileNotFoundError:
+            return None
+
+    value = read_ref('HEAD')
+    for _ in range(5):
+        if not value or not value.startswith('ref: '):
+            break
+        name = value[5:].strip()
+        if not re.fullmatch(r'refs/[\w.\-/]+', name) or '..' in name:
+            raise ValueError(f"Invalid ref {name}")
+        value = read_ref(name)
+        if value is None:
+            packed = read_ref('packed-refs') or ''
+            value = next((line.split(' ')[0] for line in packed.splitlines()
+                          if line.endswith(f" {name}") and not line.startswith(('#', '^'))), None)
+    if not value or not re.fullmatch(r'[0-9a-f]{40}', value):
+        return None
+
+    kind, content = objects.read(value)
+    if kind != 'commit' or not content.startswith(b'tree '):
+        raise ValueError("HEAD does not point at a commit")
+    return content[5:45].decode()
+
+
+GIT_STATUS_CHANGE_TYPES = {'?': 'Untracked', 'A': 'Added', 'D': 'Deleted', 'U': 'Conflicted'}
+# What a damaged or unsupported repository makes `git_status` raise
+GIT_READ_ERRORS = (OSError, ValueError, KeyError, IndexError, struct.error, zlib.error)
+
+
+def git_status(project_path, extra_patterns=()):
+    """
+    Lists a checkout's uncommitted changes, like `git status --untracked-files=all` without
+    rename detection, reading `.git` in pure Python so nothing in the repository is executed.
+
+    Staged changes compare the index with HEAD, skipping directories the index's cache tree
+    vouches for. Worktree changes compare stat data with the index first and only hash files
+    whose stat data differs or is too recent to trust. Content filters and line ending
+    conversion are not applied, so files they would rewrite can show as modified when touched.
+    """
+    project_path = os.path.realpath(project_path)
+    git_dir = os.path.join(project_path, '.git')
+    if not is_git_checkout(project_path) or os.path.lexists(os.path.join(git_dir, 'commondir')):
+        raise ValueError(f"{project_path} is not a standalone git checkout")
+    try:
+        with open_inside(git_dir, os.path.join(git_dir, 'config')) as file:
+            if re.search(rb'^\s*objectformat\s*=\s*sha256', file.read(), re.M | re.I):
+                raise ValueError("SHA-256 repositories are not supported")
+    except FileNotFoundError:
+        pass
+
+    entries, conflicts, cache_tree, index_mtime = read_git_index(git_dir)
+    codes = {path: {'U'} for path in conflicts}
+
+    # Staged: index against HEAD
+    objects = GitObjectStore(git_dir)
+    head_files, clean_dirs = {}, set()
+
+    def read_tree(sha, prefix, cached):
+        if cached and cached[0] == sha:
+            clean_dirs.add(prefix)
+            return
+        kind, content = objects.read(sha)
+        for mode, name, entry_sha in git_tree_entries(content):
+            if mode == 0o40000:
+                read_tree(entry_sha, f"{prefix}{name}/", cached[1].get(name) if cached else None)
+            else:
+                head_files[prefix + name] = (mode, entry_sha)
+
+    head_tree = git_head_tree(git_dir, objects)
+    if head_tree:
+        read_tree(head_tree, '', cache_tree)
+
+    def vouched(path):
+        parts = path.split('/')
+        return any('/'.join(parts[:depth]) + '/' * bool(depth) in clean_dirs for depth in range(len(parts)))
+
+    for path, (mode, sha, *_) in entries.items():
+        head = head_files.get(path)
+        if head is None and not vouched(path):
+            codes.setdefault(path, set()).add('A')
+        elif head is not None and (head[0] != mode or head[1] != sha):
+            codes.setdefault(path, set()).add('M')
+    for path in head_files.keys() - entries.keys() - conflicts:
+        codes.setdefault(path, set()).add('D')
+
+    # Worktree: files against the index
+    stale = []
+    for path, (mode, sha, mtime, ctime, size, inode) in entries.items():
+        if mode == 0o160000:
+            continue  # Submodules are not looked into
+        try:
+            stat = os.lstat(os.path.join(project_path, path))
+        except OSError:
+            codes.setdefault(path, set()).add('D')
+            continue
+        if S_ISDIR(stat.st_mode):
+            codes.setdefault(path, set()).add('D')
+        elif (S_ISLNK(stat.st_mode) != (mode == 0o120000) or not (S_ISREG(stat.st_mode) or S_ISLNK(stat.st_mode))
+              or (S_ISREG(stat.st_mode) and bool(stat.st_mode & 0o100) != bool(mode & 0o100))):
+            codes.setdefault(path, set()).add('M')
+        elif (sha is None or stat.st_mtime_ns != mtime or stat.st_ctime_ns != ctime
+              or stat.st_size & 0xffffffff != size or stat.st_ino & 0xffffffff != inode or mtime >= index_mtime):
+            # Changed stat data, or racily clean (written in the same tick as the index): compare contents
+            stale.append((path, sha))
+
+    def changed(item):
+        path, sha = item
+        try:
+            return git_blob_hash(os.path.join(project_path, path))[1] != sha
+        except OSError:
+            return True
+
+    for (path, _), is_changed in zip(stale, blob_hashes.executor.map(changed, stale)):
+        if is_changed:
+            codes.setdefault(path, set()).add('M')
+
+    # Untracked: walk the tree, skipping ignored paths, submodules and nested repositories
+    tracked = entries.keys() | conflicts
+    tracked_dirs = {path.rsplit('/', 1)[0] for path in tracked if '/' in path}
+    tracked_dirs |= {directory.rsplit('/', i)[0] for directory in tracked_dirs for i in range(directory.count('/') + 1)}
+    for relative_dir, dirs, files in walk_project(project_path, IgnoreMatcher(project_path, extra_patterns), include_hidden=True):
+        for entry in list(dirs):
+            relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+            if relative_path in tracked:
+                dirs.remove(entry)
+            elif relative_path not in tracked_dirs and os.path.lexists(os.path.join(entry.path, '.git')):
+                codes.setdefault(f"{relative_path}/", set()).add('?')
+                dirs.remove(entry)
+        for entry in files:
+            relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+            if relative_path not in tracked:
+                codes.setdefault(relative_path, set()).add('?')
+
+    return [
+        {'file': path, 'change_type': next((GIT_STATUS_CHANGE_TYPES[code] for code in ('U', '?', 'D', 'A')
+                                            if code in path_codes), 'Modified')}
+        for path, path_codes in sorted(codes.items())
+    ]
+
+
+class RemoteTreeCache:
+    """
+    Snapshots of remote branches as {path: blob sha}, shared by the uncommitted files check and pull.
+
+    A branch head is revalidated with a conditional request on its ref's ETag, which GitHub
+    answers with 304 and does not count against the rate limit while the branch has not moved.
+    Trees are fetched once per commit with `get_git_tree(sha, recursive=True)` and, as they never
+    change, shared by every user. Ref handles carry the token that fetched them, so they are per user.
+    """
+
+    def __init__(self, max_trees, max_refs):
+        self.max_trees = max_trees
+        self.max_refs = max_refs
+        self._trees = OrderedDict()
+        self._refs = OrderedDict()
+        self._lock = Lock()
+
+    def _remember(self, cache, key, value, limit):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > limit:
+                cache.popitem(last=False)
+
+    def head(self, user_id, repo, branch):
+        """
+        Returns the commit SHA the branch points at.
+        """
+        key = (user_id, repo.full_name, branch)
+        with self._lock:
+            ref = self._refs.get(key)
+        if ref is None:
+            ref = repo.get_git_ref(f"heads/{branch}")
+        else:
+            ref.update()
+        self._remember(self._refs, key, ref, self.max_refs)
+        return ref.object.sha
+
+    def snapshot(self, user_id, repo, branch):
+        """
+        Returns {path: blob sha} for every file on the branch's head commit.
+        """
+        key = (repo.full_name, self.head(user_id, repo, branch))
+        with self._lock:
+            files = self._trees.get(key)
+        if files is None:
+            tree = repo.get_git_tree(key[1], recursive=True)
+            if tree.raw_data.get('truncated'):
+                logger.warning("Tree of %s at %s is truncated; some files are missing", *key)
+            files = {element.path: element.sha for element in tree.tree if element.type == 'blob'}
+        self._remember(self._trees, key, files, self.max_trees)
+        return files
+
+
+remote_trees = RemoteTreeCache(
+    max_trees=getattr(settings, 'REMOTE_TREE_CACHE_SIZE', 128),
+    max_refs=getattr(settings, 'REMOTE_REF_CACHE_SIZE', 1024),
+)
+
+
+class LatencyHistogram:
+    """
+    Counts latencies, in seconds, into cumulative buckets with the given upper bounds.
+    """
+    BOUNDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.stats = LatencyStats()
+
+    def observe(self, seconds):
+        self.stats.observe(seconds)
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+
+    def snapshot(self):
+        buckets, total = {}, 0
+        for bound, count in zip([*self.bounds, '+Inf'], list(self.counts)):
+            total += count
+            buckets[str(bound)] = total
+        return {**self.stats.snapshot(), 'buckets': buckets}
+
+
+class GitHubRateLimited(Exception):
+    """
+    Raised when a GitHub call is deferred or gives up because its token is out of budget.
+    """
+
+    def __init__(self, retry_in):
+        self.retry_in = retry_in
+        minutes = max(1, round(retry_in / 60))
+        super().__init__(f"GitHub's rate limit was reached. Try again in about {minutes} minute{'s' if minutes > 1 else ''}.")
+
+
+class GitHubTokenBudget:
+    """
+    The last rate limit state GitHub reported for one token, with its call metrics.
+    """
+
+    def __init__(self, max_concurrent):
+        self.remaining = None
+        self.limit = None
+        self.reset_at = 0
+        self.blocked_until = 0
+        self.retries = 0
+        self.deferred = 0
+        self.slots = Semaphore(max_concurrent)
+        self.latency = LatencyHistogram()
+
+    def snapshot(self):
+        return {
+            'remaining': self.remaining,
+            'limit': self.limit,
+            'reset_at': self.reset_at,
+            'blocked_until': self.blocked_until,
+            'retries': self.retries,
+            'deferred': self.deferred,
+            'latency': self.latency.snapshot(),
+        }
+
+
+class GitHubRequestScheduler:
+    """
+    Runs GitHub calls against each token's rate limit budget.
+
+    Budgets come from the `X-RateLimit-*` headers PyGithub records on the client after every
+    response. Background calls (page loads) keep `reserve` requests free for the user's own
+    actions: below it they wait for the reset if it is at most `max_defer` seconds away and are
+    deferred with `GitHubRateLimited` otherwise. Every call waits on a secondary limit's
+    Retry-After and on at most `max_concurrent` calls in flight for its token. A call answered
+    with 403 or 429 for rate limiting is retried up to `max_retries` times with jittered
+    exponential backoff.
+    """
+    BACKOFF_BASE = 1
+    BACKOFF_CAP = 60
+
+    def __init__(self, reserve, max_defer, max_wait, max_retries, max_concurrent):
+        self.reserve = reserve
+        self.max_defer = max_defer
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.max_concurrent = max_concurrent
+        self._budgets = {}
+        self._lock = Lock()
+
+    def transport_retry(self):
+        """
+        The urllib3 retry for clients: transient 5xx and connection errors only, since rate
+        limits are retried here instead of sleeping for the reset inside a web request.
+        """
+        return Retry(total=3, read=0, status_forcelist=(502, 503, 504), backoff_factor=0.5,
+                     backoff_jitter=0.5, raise_on_status=False)
+
+    def budget(self, token_key):
+        with self._lock:
+            if token_key not in self._budgets:
+                self._budgets[token_key] = GitHubTokenBudget(self.max_concurrent)
+            return self._budgets[token_key]
+
+    def call(self, client, func, *args, interactive=True, **kwargs):
+        """
+        Runs `func(*args, **kwargs)`, which makes GitHub requests with `client`, within its token's budget.
+        """
+        budget = self.budget(github_clients.token_key(client))
+        for attempt in itertools.count():
+            self._wait_for_budget(budget, interactive)
+            started = time.monotonic()
+            try:
+                with budget.slots:
+                    return func(*args, **kwargs)
+            except RateLimitExceededException as e:
+                delay = self._retry_in(e, attempt)
+                budget.blocked_until = max(budget.blocked_until, time.time() + delay)
+                if attempt >= self.max_retries:
+                    raise GitHubRateLimited(delay) from e
+                budget.retries += 1
+                logger.info("GitHub rate limited a call (status %s), retrying in %.1fs", e.status, delay)
+            finally:
+                budget.latency.observe(time.monotonic() - started)
+                self._record(budget, client)
+
+    def _wait_for_budget(self, budget, interactive):
+        now = time.time()
+        wait = max(0, budget.blocked_until - now)
+        if budget.remaining is not None and budget.reset_at > now:
+            if budget.remaining <= (0 if interactive else self.reserve):
+                wait = max(wait, budget.reset_at - now)
+        if not wait:
+            return
+        if wait > (self.max_wait if interactive else self.max_defer):
+            budget.deferred += 1
+            raise GitHubRateLimited(wait)
+        time.sleep(wait)
+
+    def _retry_in(self, exception, attempt):
+        """
+        Seconds to wait before retrying: GitHub's Retry-After or reset time when given, with at
+        least a full-jitter exponential backoff.
+        """
+        headers = {key.lower(): value for key, value in (exception.headers or {}).items()}
+        delay = random.uniform(0, min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2 ** attempt))
+        if 'retry-after' in headers:
+            delay = max(delay, float(headers['retry-after']))
+        elif headers.get('x-ratelimit-remaining') == '0' and 'x-ratelimit-reset' in headers:
+            delay = max(delay, float(headers['x-ratelimit-reset']) - time.time())
+        return delay
+
+    @staticmethod
+    def _record(budget, client):
+        remaining, limit = client.requester.rate_limiting
+        if limit >= 0:
+            budget.remaining, budget.limit = remaining, limit
+            budget.reset_at = client.requester.rate_limiting_resettime
+
+    def snapshot(self):
+        """
+        Returns each token's remaining budget and call latency, keyed by a prefix of its hash.
+        """
+        with self._lock:
+            budgets = dict(self._budgets)
+        return {token_key[:12]: budget.snapshot() for token_key, budget in budgets.items()}
+
+
+github_scheduler = GitHubRequestScheduler(
+    reserve=getattr(settings, 'GITHUB_RATE_LIMIT_RESERVE', 200),
+    max_defer=getattr(settings, 'GITHUB_MAX_DEFER', 5),
+    max_wait=getattr(settings, 'GITHUB_MAX_WAIT', 20),
+    max_retries=getattr(settings, 'GITHUB_MAX_RETRIES', 3),
+    max_concurrent=getattr(settings, 'GITHUB_MAX_CONCURRENT_PER_TOKEN', 4),
+)
+
+
+class GitHubClientCache:
+    """
+    Reuses GitHub clients per access token and caches read-only lookups such as repositories and
+    branches, keyed by token so nobody sees objects fetched with someone else's credentials.
+
+    A lookup can be memoised for a request's whole lifetime, and is cached in the process for `ttl`
+    seconds, and concurrent identical lookups wait for the one call already in flight.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clients = OrderedDict()
+        self._token_keys = weakref.WeakKeyDictionary()
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = Lock()
+
+    def client(self, token):
+        token_key = hashlib.sha256(token.encode()).hexdigest()
+        with self._lock:
+            client = self._clients.get(token_key)
+            if client is None:
+                client = self._clients[token_key] = Github(token, retry=github_scheduler.transport_retry())
+                self._token_keys[client] = token_key
+            self._clients.move_to_end(token_key)
+            while len(self._clients) > self.max_entries:
+                self._clients.popitem(last=False)
+        return client
+
+    def token_key(self, client):
+        return self._token_keys.get(client, 'anonymous')
+
+    def lookup(self, client, key, load, memo=None):
+        """
+        Returns `load()` for `key`, reusing a result from `memo` (e.g. one request's lookups), the
+        process cache or a concurrent identical call.
+        """
+        key = (self._token_keys[client],) + tuple(key)
+        if memo is None:
+            return self._single_flight(key, load)
+        if key not in memo:
+            memo[key] = self._single_flight(key, load)
+        return memo[key]
+
+    def _single_flight(self, key, load):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+        if not leader:
+            return flight.result()
+
+        try:
+            value = load()
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(value)
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+
+github_clients = GitHubClientCache(
+    ttl=getattr(settings, 'GITHUB_LOOKUP_TTL', 30),
+    max_entries=getattr(settings, 'GITHUB_LOOKUP_CACHE_SIZE', 1024),
+)
 
 
 class GitHubUtils:
 
     @staticmethod
     def get_github_account(request):
-        """Retrieve GitHub account and token."""
+        """Retrieve the GitHub client for the user's token, and their account."""
+        if hasattr(request, '_github_account'):
+            return request._github_account
         github_account = request.user.social_auth.filter(provider='github').first()
         if not github_account:
             return GitHubUtils._redirect_with_error(request, "GitHub account is not connected. Please link your account.")
         token = github_account.extra_data.get('access_token')
         if not token:
             return GitHubUtils._redirect_with_error(request, "GitHub access token is missing. Please authorize the app.")
-        return Github(token), Github(token).get_user()
+        client = github_clients.client(token)
+        request._github_account = client, client.get_user()
+        return request._github_account
+
+    @staticmethod
+    def call(request, func, *args, **kwargs):
+        """
+        Runs a GitHub call through the rate limit scheduler. Page loads are background work that
+        may be deferred when the token's budget runs low; form posts are the user's own actions.
+        """
+        git_token, _ = GitHubUtils.get_github_account(request)
+        return github_scheduler.call(git_token, func, *args, interactive=request.method == 'POST', **kwargs)
+
+    @staticmethod
+    def lookups(request):
+        """
+        Returns the request's memo of GitHub lookups, so one page load never repeats one.
+        """
+        return request.__dict__.setdefault('_github_lookups', {})
+
+    @staticmethod
+    def find_repo(client, repository, interactive, memo=None):
+        """
+        Looks up the GitHub repository a project's URL names. Safe to call off the request thread.
+        """
+        repo_name = re.search(r"github\.com/([^/]+/[^/]+)", repository).group(1)
+        return github_clients.lookup(client, ('repo', repo_name), lambda: github_scheduler.call(
+            client, client.get_repo, repo_name, interactive=interactive), memo)
+
+    @staticmethod
+    def find_branch(client, repo, branch_name, interactive, memo=None):
+        """
+        Looks up a branch of the repository, shared with other lookups of it for a short while.
+        """
+        return github_clients.lookup(client, ('branch', repo.full_name, branch_name), lambda: github_scheduler.call(
+            client, repo.get_branch, branch_name, interactive=interactive), memo)
 
     @staticmethod
     def get_repo(request, project):
@@ -188,8 +3517,23 @@ class GitHubUtils:
         gets the GitHub token key for the repository
         """
         git_token, _ = GitHubUtils.get_github_account(request)
-        repo_name = re.search(r"github\.com/([^/]+/[^/]+)", project.repository).group(1)
-        return git_token.get_repo(repo_name)
+        return GitHubUtils.find_repo(git_token, project.repository, request.method == 'POST', GitHubUtils.lookups(request))
+
+    @staticmethod
+    def get_branch(request, repo, branch_name):
+        """
+        gets a branch of the repository, shared with other lookups of it for a short while
+        """
+        git_token, _ = GitHubUtils.get_github_account(request)
+        return GitHubUtils.find_branch(git_token, repo, branch_name, request.method == 'POST', GitHubUtils.lookups(request))
+
+    @staticmethod
+    def current_branch(client, repository, interactive):
+        """
+        Returns the name of the repository's default branch. Safe to call off the request thread.
+        """
+        repo = GitHubUtils.find_repo(client, repository, interactive)
+        return GitHubUtils.find_branch(client, repo, repo.default_branch, interactive).name
 
     @staticmethod
     def get_current_branch(request, project):
@@ -199,7 +3543,7 @@ class GitHubUtils:
         if bool(project.repository):
             try:
                 repo = GitHubUtils.get_repo(request, project)
-                branch = repo.get_branch(repo.default_branch)
+                branch = GitHubUtils.get_branch(request, repo, repo.default_branch)
                 return branch.name
             except Exception as e:
                 messages.error(request, f"Error fetching branch: {e}")
@@ -215,58 +3559,63 @@ class GitHubUtils:
         return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
 
     @staticmethod
-    def get_local_files(project_path):
-        """Retrieve a list of local files excluding dot files."""
+    def get_local_files(project):
+        """Retrieve a list of local files excluding dot files and ignored paths."""
         return [
-            {'change_type': 'new', 'file': os.path.relpath(os.path.join(root, file), project_path)}
-            for root, dirs, files in os.walk(project_path)
-            for file in files if
-            not file.startswith('.') and not dirs[:][:].append(d for d in dirs if not d.startswith('.'))
+            {'change_type': 'new', 'file': f"{relative_dir}/{entry.name}" if relative_dir else entry.name}
+            for relative_dir, dirs, files in walk_project(project.project_path, ignore_matcher(project))
+            for entry in files
         ]
 
     @staticmethod
-    def get_uncommitted_files(request, project):
-        """Fetch uncommitted files by comparing local files with GitHub repository."""
-        local_files = GitHubUtils.get_local_files(project.project_path)
-        local_files_dict = {file['file']: file for file in local_files}
+    def uncommitted_files(client, user_id, project_path, repository, ignore_patterns, interactive):
+        """
+        Lists uncommitted files from the local git index, or for projects without a `.git`
+        directory by comparing local files with the GitHub repository. Takes only plain values
+        and raises on failure, so it can run off the request thread.
 
-        try:
-            github_client, _ = GitHubUtils.get_github_account(request)
-            repo = GitHubUtils.get_repo(request, project)
-            github_contents = {content.path: content.sha for content in repo.get_contents("")}
-
-            uncommitted_files = [
-                                    {'file': file, 'change_type': 'Untracked'}
-                                    for file in local_files_dict if file not in github_contents
-                                ] + [
-                                    {'file': file, 'change_type': 'Modified'}
-                                    for file, content in local_files_dict.items()
-                                    if hashlib.sha1(
-                    f"blob {os.path.getsize(os.path.join(project.project_path, file))}\0".encode() + open(
-                        os.path.join(project.project_path, file), 'rb').read()).hexdigest() != github_contents.get(file,
-                                                                                                                   '')
-                                ]
-
-            deleted_files = set(github_contents) - set(local_files_dict)
-            uncommitted_files.extend({'file': file, 'change_type': 'Deleted'} for file in deleted_files)
-
-            return uncommitted_files
-        except Exception as e:
-            messages.error(request, f"Something went wrong while fetching your project files: {e}")
+        `client` is None when the user has no GitHub token; an unreadable checkout then raises
+        its git error, since there is no repository to compare with.
+        """
+        if is_git_checkout(project_path):
+            try:
+                return git_status(project_path, ignore_patterns)
+            except GIT_READ_ERRORS as e:
+                logger.warning("git status failed for %s: %s", project_path, e)
+                if not repository or client is None:
+                    raise
+
+        local_hashes = blob_hashes.hashes(project_path, IgnoreMatcher(project_path, ignore_patterns))
+        repo = GitHubUtils.find_repo(client, repository, interactive)
+        github_contents = github_scheduler.call(client, remote_trees.snapshot, user_id, repo, repo.default_branch,
+                                                interactive=interactive)
+
+        uncommitted_files = [
+            {'file': file, 'change_type': 'Untracked' if file not in github_contents else 'Modified'}
+            for file, sha in local_hashes.items() if sha != github_contents.get(file)
+        ]
+
+        # Hidden and ignored files are not hashed, so only report what is really gone from disk
+        deleted_files = [file for file in github_contents if file not in local_hashes
+                         and not os.path.lexists(os.path.join(project_path, file))]
+        uncommitted_files.extend({'file': file, 'change_type': 'Deleted'} for file in deleted_files)
+
+        return uncommitted_files
 
     @staticmethod
     def create_git_repo(request, project):
         """Create and initialize a GitHub repository with a README file."""
         try:
             git_token, git_user = GitHubUtils.get_github_account(request)
-            repo = git_user.create_repo(
+            repo = GitHubUtils.call(
+                request, git_user.create_repo,
                 name=request.POST['repo_name'],
                 description=request.POST['repo_description'],
                 private=not bool(request.POST.get('repo_public', False)),
                 auto_init=False
             )
             with open(os.path.join(project.project_path, "README.md")) as f:
-                repo.create_file("README.md", "Initial commit", f.read(), branch="main")
+                GitHubUtils.call(request, repo.create_file, "README.md", "Initial commit", f.read(), branch="main")
 
             project.repository, project.project_description, project.is_public = repo.html_url, repo.description, repo.private
             project.save()
@@ -289,7 +3638,8 @@ class GitHubUtils:
 
         try:
             repo = GitHubUtils.get_repo(request, project)
-            latest_commit = repo.get_git_commit(repo.get_git_ref("heads/main").object.sha)
+            main_ref = GitHubUtils.call(request, repo.get_git_ref, "heads/main")
+            latest_commit = GitHubUtils.call(request, repo.get_git_commit, main_ref.object.sha)
             base_tree = latest_commit.tree
 
             # Create new tree with the files
@@ -298,13 +3648,14 @@ class GitHubUtils:
                     path=file_path,
                     mode="100644",
                     type="blob",
-                    sha=repo.create_git_blob(open(os.path.join(project.project_path, file_path), "r").read(), "utf-8").sha
+                    sha=GitHubUtils.call(request, repo.create_git_blob,
+                                         open(os.path.join(project.project_path, file_path), "r").read(), "utf-8").sha
                 ) for file_path in selected_files
             ]
 
-            new_tree = repo.create_git_tree(elements, base_tree)
-            new_commit = repo.create_git_commit(commit_message, new_tree, [latest_commit])
-            repo.get_git_ref("heads/main").edit(new_commit.sha)
+            new_tree = GitHubUtils.call(request, repo.create_git_tree, elements, base_tree)
+            new_commit = GitHubUtils.call(request, repo.create_git_commit, commit_message, new_tree, [latest_commit])
+            GitHubUtils.call(request, main_ref.edit, new_commit.sha)
 
             if commit_push_files:
                 GitHubUtils.push_all_commits(request, project)
@@ -323,12 +3674,9 @@ class GitHubUtils:
             branch = GitHubUtils.get_current_branch(request, project)
             repo = GitHubUtils.get_repo(request, project)
 
-            # Get current and remote commit references
-            remote_ref = f"heads/{branch}"
-            local_ref = f"heads/{branch}"
-
-            remote_commit = repo.get_git_commit(repo.get_git_ref(remote_ref).object.sha)
-            local_commit = repo.get_git_commit(repo.get_git_ref(local_ref).object.sha)
+            # Get current and remote commit references; both name the same GitHub ref, so fetch it once
+            branch_ref = GitHubUtils.call(request, repo.get_git_ref, f"heads/{branch}")
+            remote_commit = local_commit = GitHubUtils.call(request, repo.get_git_commit, branch_ref.object.sha)
 
             # Compare commits to ensure local is ahead of remote
             if remote_commit.sha != local_commit.sha:
@@ -339,7 +3687,7 @@ class GitHubUtils:
                 return HttpResponseRedirect(request.META.get("HTTP_REFERER", "/"))
 
             # Push the local commit to the remote branch
-            repo.get_git_ref(remote_ref).edit(local_commit.sha)
+            GitHubUtils.call(request, branch_ref.edit, local_commit.sha)
             messages.success(request, f"Your changes have been successfully pushed to the {branch} branch!")
 
         except Exception as e:
@@ -349,26 +3697,21 @@ class GitHubUtils:
 
     @staticmethod
     def pull_and_update_files(request, project):
-        """Pull and update project files from GitHub."""
+        """Pull and update project files from GitHub, fetching only files whose blob differs."""
         try:
             repo = GitHubUtils.get_repo(request, project)
-            current_branch = GitHubUtils.get_current_branch(request, project)
-            local_files = GitHubUtils.get_local_files(project.project_path)
+            remote_files = GitHubUtils.call(request, remote_trees.snapshot, request.user.id, repo, repo.default_branch)
+            local_hashes = blob_hashes.hashes(project.project_path, ignore_matcher(project))
 
-            for file_info in local_files:
-                file_path = file_info['file']
+            for file_path, local_sha in local_hashes.items():
+                remote_sha = remote_files.get(file_path)
+                if remote_sha is None or remote_sha == local_sha:
+                    continue
                 try:
-                    github_file = repo.get_contents(file_path, ref=current_branch)
-                    if github_file:
-                        file_path_full = os.path.join(project.project_path, file_path)
-
-                        # Decode base64 content if it's not already decoded
-                        file_content = base64.b64decode(github_file.content).decode('utf-8')
-
-                        # Write the decoded content to the local file
-                        with open(file_path_full, 'w', encoding='utf-8') as f:
-                            f.write(file_content)
-                        file_info['change_type'] = 'updated'
+                    file_path_full = os.path.join(project.project_path, file_path)
+                    previous_size = file_size(file_path_full)
+                    atomic_write(file_path_full, base64.b64decode(GitHubUtils.call(request, repo.get_git_blob, remote_sha).content))
+                    adjust_storage(project, file_size(file_path_full) - previous_size)
                 except Exception as e:
                     messages.error(request, f"Error pulling {file_path}: {e}")
                     return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
@@ -398,7 +3741,7 @@ class GitHubUtils:
         """
         try:
             repo = GitHubUtils.get_repo(request, project)
-            branch_exists = lambda: repo.get_branch(branch_name)
+            branch_exists = lambda: GitHubUtils.call(request, repo.get_branch, branch_name)
 
             if create_new:
                 try:
@@ -407,9 +3750,10 @@ class GitHubUtils:
                         request, f"Branch '{branch_name}' already exists."
                     )
                 except Exception:  # Branch doesn't exist, proceed to create it
-                    repo.create_git_ref(
+                    GitHubUtils.call(
+                        request, repo.create_git_ref,
                         ref=f"refs/heads/{branch_name}",
-                        sha=repo.get_branch(repo.default_branch).commit.sha
+                        sha=GitHubUtils.call(request, repo.get_branch, repo.default_branch).commit.sha
                     )
                     messages.success(request, f"Branch '{branch_name}' created successfully.")
             else:
@@ -429,11 +3773,10 @@ class GitHubUtils:
         """
         try:
             repo = GitHubUtils.get_repo(request, project)
-            repo.get_branch(branch_name)
 
             # Set the remote reference
-            branch_sha = repo.get_branch(branch_name).commit.sha
-            repo.create_git_ref(ref=f"refs/heads/{branch_name}", sha=branch_sha)
+            branch_sha = GitHubUtils.call(request, repo.get_branch, branch_name).commit.sha
+            GitHubUtils.call(request, repo.create_git_ref, ref=f"refs/heads/{branch_name}", sha=branch_sha)
 
             messages.success(request, f"Remote branch '{branch_name}' set successfully.")
 
@@ -1,56 +1,27 @@
+import json
 import os
 import shutil
 import markdown
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import (HttpResponse, HttpResponseRedirect, JsonResponse, FileResponse)
+from django.http import (HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse)
 from django.shortcuts import render, get_object_or_404, redirect
 from django.utils.timezone import now
-from django.views.generic import TemplateView
+from django.views.generic import TemplateView, View
 
 from .models import Project, Task
 from chat.models import ChatRoom, Message
 from profile.views import add_activity_to_log
 from home.models import HomePage
 from user.models import CustomUser, ActivityLog
-from .utils import ProjectContainerManager, GitHubUtils
-
-
-def get_project_tree(project_path):
-    """
-    Generates a hierarchical representation of a project's directory structure,
-    excluding hidden files and folders (those starting with a dot).
-    """
-    project_tree = []
-    root_dir = os.path.basename(project_path)
-    for root, dirs, files in os.walk(project_path):
-        dirs[:] = [d for d in dirs if not d.startswith('.')]
-
-        relative_path = os.path.relpath(root, project_path)
-        if relative_path == '.':
-            relative_path = ''
-
-        node = {
-            'name': root_dir if relative_path == '' else os.path.join(root_dir, relative_path),
-            'type': 'directory',
-            'children': []
-        }
-
-        for file in files:
-            if not file.startswith('.'):
-                file_path = os.path.join(root, file)
-                node['children'].append({
-                    'name': file,
-                    'type': 'file',
-                    'path': file_path
-                })
-
-        project_tree.append(node)
-
-    return project_tree
+from .utils import (ProjectContainerManager, GitHubUtils, github_call_pool, directory_listings,
+                    ignore_matcher, adjust_storage, file_size, file_ranges, resolve_project_path,
+                    file_version, atomic_write, apply_file_edits, FileVersionConflict, stream_zip,
+                    github_scheduler, project_ignore_patterns, is_git_checkout)
 
 
 def update_task(request, project):
@@ -84,7 +55,6 @@ class ProjectView(TemplateView):
         if not current_project:
             return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
 
-        project_tree = get_project_tree(current_project.project_path)
         readme_content = "<p>No README file available.</p>"
         readme_path = os.path.join(current_project.project_path, "README.md")
 
@@ -112,7 +82,6 @@ class ProjectView(TemplateView):
         context = {
             'home': HomePage.objects.first(),
             'current_project': current_project,
-            'project_tree': project_tree,
             'readme_content': readme_content,
             'tasks': current_project.tasks.all(),
             'recent_chats': chat_rooms,
@@ -222,7 +191,7 @@ class ProjectView(TemplateView):
     @staticmethod
     def edit_project_details(request, project):
         """
-        Handle updating project name, description, and visibility.
+        Handle updating project name, description, visibility and ignored paths.
         """
         new_name, new_description = request.POST.get('name'), request.POST.get('description')
         is_public = 'is_public' in request.POST
@@ -233,6 +202,7 @@ class ProjectView(TemplateView):
                 project.project_path = os.path.join(request.user.project_dir, new_name)
 
             project.project_name, project.project_description, project.is_public = new_name, new_description, is_public
+            project.ignore_patterns = request.POST.get('ignore_patterns', project.ignore_patterns)
             project.save()
 
             add_activity_to_log(user=request.user, activity_type='project_updated', sender=None, task=None,
@@ -256,6 +226,7 @@ class ProjectView(TemplateView):
             container_manager = ProjectContainerManager(project, request.user)
             container_manager.delete_container()
             shutil.rmtree(project.project_path)
+            adjust_storage(project, -project.storage_used)
 
             add_activity_to_log(user=request.user, activity_type='project_deleted', sender=None, task=None,
                                 project=project, message='')
@@ -273,27 +244,21 @@ class ProjectView(TemplateView):
     @staticmethod
     def download_project(request, project):
         """
-        Create and return a zip file of the project's directory for download.
+        Stream a zip of the project's directory, compressed on the fly and without ignored paths.
+        The submitted `download_project` value picks the compression level (0-9).
         """
-        project_name = project.project_name
-        project_path = project.project_path
-        zip_file_path = os.path.join("/tmp", f"{os.path.basename(project_path)}.zip")
-
+        default_level = getattr(settings, 'DOWNLOAD_COMPRESSION_LEVEL', 6)
         try:
-            shutil.make_archive(zip_file_path[:-4], 'zip', project_path)
+            level = min(max(int(request.POST.get('download_project') or default_level), 0), 9)
+        except ValueError:
+            level = default_level
 
-            with open(zip_file_path, 'rb') as zip_file:
-                response = FileResponse(zip_file, as_attachment=True)
-                response['Content-Disposition'] = f'attachment; filename="{os.path.basename(project_path)}.zip"'
-        except Exception:
-            messages.warning(request, "Unable to Download project at this time!")
-            return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
-        finally:
-            if os.path.exists(zip_file_path):
-                os.remove(zip_file_path)
+        response = StreamingHttpResponse(stream_zip(project.project_path, ignore_matcher(project), level),
+                                         content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{os.path.basename(project.project_path)}.zip"'
 
         add_activity_to_log(user=request.user, activity_type='project_updated', sender=None, task=None,
-                            project=project, message=f"Downloaded the project: {project_name}")
+                            project=project, message=f"Downloaded the project: {project.project_name}")
 
         return response
 
@@ -312,31 +277,105 @@ class IdeView(LoginRequiredMixin, TemplateView):
         if not project:
             return HttpResponse("Project not found", status=404)
 
-        readme_path, readme_content = self.handle_readme(project)
-
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return JsonResponse({'project_tree': get_project_tree(project.project_path)})
+            if 'file' in request.GET:
+                return self.read_file_range(request, project)
+            return self.list_directory(request, project)
+
+        readme_path, readme_content = self.handle_readme(project)
 
         return render(request, self.template_name, self.get_context(request, project, readme_path, readme_content, file_name='README.md'))
 
     @staticmethod
-    def get_context(request, project, file_path, file_content, file_name):
+    def list_directory(request, project):
+        """
+        Return one page of a single directory's children for the file explorer.
+        """
+        page_size = getattr(settings, 'PROJECT_TREE_PAGE_SIZE', 200)
+        try:
+            limit = min(max(int(request.GET.get('limit', page_size)), 1), page_size * 10)
+        except ValueError:
+            limit = page_size
+
+        try:
+            listing = directory_listings.page(project.project_path, request.GET.get('dir', ''),
+                                              cursor=request.GET.get('cursor'), limit=limit,
+                                              matcher=ignore_matcher(project))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except OSError:
+            return JsonResponse({'error': "Directory not found."}, status=404)
+
+        return JsonResponse(listing)
+
+    @staticmethod
+    def read_file_range(request, project):
+        """
+        Return a byte range (`offset`, `length`) or line range (`line`, `lines`) of a project file.
+        Binary files are returned as a hex dump.
+        """
+        max_bytes = getattr(settings, 'OPEN_FILE_RANGE_MAX_BYTES', 1048576)
+        try:
+            file_path = resolve_project_path(project.project_path, request.GET['file'])
+            size, binary = file_ranges.sniff(file_path)
+            if 'line' in request.GET and not binary:
+                lines = min(max(int(request.GET.get('lines', 1000)), 1), 10000)
+                return JsonResponse(file_ranges.read_lines(file_path, max(int(request.GET['line']), 0), lines))
+
+            offset = max(int(request.GET.get('offset', 0)), 0)
+            length = min(max(int(request.GET.get('length', max_bytes)), 1), max_bytes)
+            if binary:
+                length = min(length, getattr(settings, 'OPEN_FILE_HEX_BYTES', 16384))
+                return JsonResponse(file_ranges.read_hex(file_path, offset, length))
+            return JsonResponse(file_ranges.read_text(file_path, offset, length))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except OSError:
+            return JsonResponse({'error': "File not found."}, status=404)
+
+    @staticmethod
+    def get_context(request, project, file_path, file_content, file_name, file_partial=False):
         """
         method to get all template context and return it.
+
+        Partially loaded files cannot be saved from the editor, so they get no `file_version`.
         """""
 
+        # The GitHub lookups are independent, so run them in parallel on the GitHub pool. The workers
+        # only get plain values; the request and its messages stay on this thread.
+        uncommitted_files = branch = None
+        if project.repository:
+            account = GitHubUtils.get_github_account(request)
+            git_token = account[0] if isinstance(account, tuple) else None
+            interactive = request.method == 'POST'
+            if git_token or is_git_checkout(project.project_path):
+                uncommitted_files = github_call_pool.submit(
+                    GitHubUtils.uncommitted_files, git_token, request.user.id, project.project_path,
+                    project.repository, project_ignore_patterns(project), interactive)
+            if git_token:
+                branch = github_call_pool.submit(GitHubUtils.current_branch, git_token, project.repository, interactive)
+        else:
+            messages.error(request, "GitHub account is not connected. Please link your account.")
+
+        def result(future, error, default=None):
+            try:
+                return future.result() if future else default
+            except Exception as e:
+                messages.error(request, f"{error}: {e}")
+                return default
+
         context = {
             'is_read_only': not (request.user in project.collaborators.all() or request.user == project.user),
             'home': HomePage.objects.first(),
             'current_project': project,
-            'project_tree': get_project_tree(project.project_path),
             'file_name': file_name,
             'file_path': file_path,
             'file_content': file_content,
+            'file_version': file_version(file_path) if file_path and not file_partial else None,
             'tasks': project.tasks.all(),
             'is_git_repo': bool(project.repository),
-            'uncommitted_files': GitHubUtils.get_uncommitted_files(request, project) if project.repository else [],
-            'branch': GitHubUtils.get_current_branch(request, project),
+            'uncommitted_files': result(uncommitted_files, "Something went wrong while fetching your project files", []),
+            'branch': result(branch, "Error fetching branch"),
         }
         return context
 
@@ -348,6 +387,7 @@ class IdeView(LoginRequiredMixin, TemplateView):
         if not os.path.exists(readme_path):
             with open(readme_path, 'w', encoding='utf-8') as file:
                 file.write(f"# Welcome to your {project.project_name}!\n\nThis is the README.md file for your project.\n\n{project.project_description or 'No description provided.'}")
+            adjust_storage(project, file_size(readme_path))
 
         try:
             with open(readme_path, 'r', encoding='utf-8') as file:
@@ -370,6 +410,7 @@ class IdeView(LoginRequiredMixin, TemplateView):
         action_map = {
             'delete': self.delete,
             'save_file': self.save_file,
+            'apply_edits': self.apply_edits,
             'rename_file': self.save_file,
             'open_file': self.open_file,
             'update_ide_settings': self.update_ide_settings,
@@ -418,14 +459,33 @@ class IdeView(LoginRequiredMixin, TemplateView):
             messages.warning(request, "File Not Found!")
             return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
 
+        return self.render_file(request, project, file_path)
+
+    def render_file(self, request, project, file_path):
+        """
+        Render the IDE with a file loaded. Files larger than OPEN_FILE_PREVIEW_BYTES open read-only
+        with their first window and binary files open as a hex dump; the editor fetches the rest in ranges.
+        """
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                file_content = file.read()
+            size, binary = file_ranges.sniff(file_path)
+            if binary:
+                window = file_ranges.read_hex(file_path, 0, getattr(settings, 'OPEN_FILE_HEX_BYTES', 16384))
+            else:
+                window = file_ranges.read_text(file_path, 0, getattr(settings, 'OPEN_FILE_PREVIEW_BYTES', 262144))
         except Exception:
             messages.warning(request, "Error Reading File!")
             return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
 
-        return render(request, self.template_name, self.get_context(request, project, file_path, file_content, file_name=os.path.basename(file_path)))
+        file_partial = binary or window['next_offset'] is not None
+        context = self.get_context(request, project, file_path, window['content'], file_name=os.path.basename(file_path),
+                                   file_partial=file_partial)
+        context.update({
+            'file_size': size,
+            'file_binary': binary,
+            'file_partial': file_partial,
+            'file_next_offset': window['next_offset'],
+        })
+        return render(request, self.template_name, context)
 
     @staticmethod
     def delete(request, project):
@@ -435,7 +495,9 @@ class IdeView(LoginRequiredMixin, TemplateView):
         file_path = request.POST.get('file_path')
 
         try:
+            size = file_size(file_path)
             os.remove(file_path)
+            adjust_storage(project, -size)
             action = f"Deleted file {os.path.basename(file_path)}"
         except OSError as e:
             action = f"Failed to delete file {file_path}: {e}"
@@ -446,6 +508,29 @@ class IdeView(LoginRequiredMixin, TemplateView):
 
         return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
 
+    @staticmethod
+    def apply_edits(request, project):
+        """
+        Apply the editor's deltas to a file, if it is still at the version the editor loaded,
+        and acknowledge with the new version instead of re-rendering the page.
+        """
+        try:
+            file_path = resolve_project_path(project.project_path, request.POST.get('file_path', ''))
+            version, size_change = apply_file_edits(file_path, request.POST.get('base_version'),
+                                                    json.loads(request.POST.get('edits', '[]')))
+        except FileVersionConflict as e:
+            return JsonResponse({'error': str(e), 'version': e.version}, status=409)
+        except (KeyError, ValueError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except OSError:
+            return JsonResponse({'error': "File not found."}, status=404)
+
+        adjust_storage(project, size_change)
+        add_activity_to_log(user=request.user, activity_type='project_updated', sender=None, task=None,
+                            project=project, message=f"Saved changes to file {os.path.basename(file_path)}")
+
+        return JsonResponse({'version': version})
+
     def save_file(self, request, project):
         """
         Save or rename an existing file in the project and update project settings.
@@ -456,6 +541,12 @@ class IdeView(LoginRequiredMixin, TemplateView):
         file_path = request.POST.get('file_path')
         new_file_name = request.POST.get('new_file_name')
 
+        # A partially loaded file only holds its first window in the editor, so it can be renamed but not saved
+        file_partial = bool(request.POST.get('file_partial'))
+        if file_partial and not new_file_name:
+            messages.warning(request, "This file is too large or binary to be saved from the editor.")
+            return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
+
         if new_file_name:
             if not file_path:
                 messages.warning(request, "File path is required to rename a file.")
@@ -470,6 +561,11 @@ class IdeView(LoginRequiredMixin, TemplateView):
             except Exception:
                 messages.warning(request, "Error renaming file.")
                 return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
+
+            if file_partial:
+                add_activity_to_log(user=request.user, activity_type='project_updated', sender=None, task=None,
+                                    project=project, message=action)
+                return self.render_file(request, project, file_path)
         elif file_path:
             action = f"Saved changes to file {file_name}"
         else:
@@ -478,8 +574,9 @@ class IdeView(LoginRequiredMixin, TemplateView):
 
         try:
             normalized_content = file_content.replace('\r\n', '\n').replace('\r', '\n')
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(normalized_content)
+            previous_size = file_size(file_path)
+            atomic_write(file_path, normalized_content.encode('utf-8'))
+            adjust_storage(project, file_size(file_path) - previous_size)
         except Exception:
             messages.warning(request, "Error saving file.")
             return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
@@ -488,3 +585,15 @@ class IdeView(LoginRequiredMixin, TemplateView):
                             project=project, message=action)
 
         return render(request, self.template_name, self.get_context(request, project, file_path, file_content, file_name))
+
+
+class GitHubMetricsView(View):
+    """
+    Staff-only metrics for GitHub calls: each token's remaining rate limit budget and latency
+    histogram, and the GitHub call pool's queue.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_staff:
+            return JsonResponse({'error': "Staff only."}, status=403)
+        return JsonResponse({'tokens': github_scheduler.snapshot(), 'call_pool': github_call_pool.snapshot()})
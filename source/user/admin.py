@@ -2,12 +2,12 @@ from django.contrib import admin
 from django.core.exceptions import ValidationError
 from django.http import HttpResponseRedirect
 from django.urls import path
-from .models import CustomUser, DockerSession, ActivityLog, IDESettings, Subscription
+from .models import CustomUser, DockerSession, ActivityLog, IDESettings, Subscription, ContainerUsageSample
 from django.contrib.auth.admin import UserAdmin
 
 
 class SubscriptionAdmin(admin.ModelAdmin):
-    list_display = ('user', 'plan_name', 'mem_limit', 'memswap_limit', 'cpus', 'storage_limit', 'created_at', 'expires_at')
+    list_display = ('user', 'plan_name', 'mem_limit', 'memswap_limit', 'cpus', 'cpu_shares', 'pids_limit', 'storage_limit', 'created_at', 'expires_at')
     list_filter = ('plan_name', 'created_at')
     search_fields = ('user__username', 'stripe_customer_id', 'stripe_subscription_id')
     readonly_fields = ('stripe_customer_id', 'stripe_subscription_id', 'created_at')
@@ -43,7 +43,7 @@ class CustomUserAdmin(UserAdmin):
     """
     Admin interface for CustomUser.
     """
-    list_display = ('username', 'email', 'is_staff', 'is_superuser', 'date_joined', 'project_dir')
+    list_display = ('username', 'email', 'is_staff', 'is_superuser', 'date_joined', 'project_dir', 'storage_used')
     list_filter = ('is_staff', 'is_superuser', 'is_active')
     search_fields = ('username', 'email')
     ordering = ('username',)
@@ -52,7 +52,7 @@ class CustomUserAdmin(UserAdmin):
         (None, {'fields': ('username', 'email', 'password')}),
         ('Personal Info', {'fields': ('first_name', 'last_name', 'bio', 'profile_picture')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser')}),
-        ('Project Info', {'fields': ('project_dir',)}),
+        ('Project Info', {'fields': ('project_dir', 'storage_used', 'storage_reconciled_at')}),
         ('Important Dates', {'fields': ('last_login', 'date_joined')}),
     )
 
@@ -71,9 +71,20 @@ class DockerSessionAdmin(admin.ModelAdmin):
     """
     Admin interface for DockerSession.
     """
-    list_display = ('user', 'container_name', 'status', 'created_at', 'last_activity_at')
+    list_display = ('user', 'container_name', 'endpoint', 'status', 'created_at', 'last_activity_at')
     search_fields = ('user__username', 'container_name')
-    list_filter = ('status', 'created_at')
+    list_filter = ('status', 'endpoint', 'created_at')
+
+
+@admin.register(ContainerUsageSample)
+class ContainerUsageSampleAdmin(admin.ModelAdmin):
+    """
+    Admin interface for ContainerUsageSample.
+    """
+    list_display = ('session', 'sampled_at', 'cpu_percent', 'memory_bytes', 'pids')
+    search_fields = ('session__user__username', 'session__container_name')
+    list_filter = ('sampled_at',)
+    raw_id_fields = ('session',)
 
 
 @admin.register(ActivityLog)
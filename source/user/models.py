@@ -15,6 +15,43 @@ class Subscription(models.Model):
         ('full', 'Full'),
     ]
 
+    PLAN_LIMITS = {
+        'free': {
+            'mem_limit': '512m',
+            'memswap_limit': '1g',
+            'cpus': 0.5,
+            'cpu_shares': 512,
+            'pids_limit': 256,
+            'storage_limit': 10000,  # 10GB for free users
+        },
+        'basic': {
+            'mem_limit': '1g',
+            'memswap_limit': '2g',
+            'cpus': 1.0,
+            'cpu_shares': 1024,
+            'pids_limit': 512,
+            'storage_limit': 50000,  # 50GB for basic users
+        },
+        'full': {
+            'mem_limit': '4g',
+            'memswap_limit': '8g',
+            'cpus': 4.0,
+            'cpu_shares': 2048,
+            'pids_limit': 1024,
+            'storage_limit': 200000,  # 200GB for full users
+        },
+    }
+
+    # Number of pre-warmed terminal containers kept idle per plan (see DOCKER_WARM_POOL_SIZES)
+    WARM_POOL_SIZES = getattr(settings, 'DOCKER_WARM_POOL_SIZES', {'free': 4, 'basic': 2, 'full': 1})
+
+    # Seconds of inactivity before a plan's terminal container is paused, then stopped (see DOCKER_IDLE_TIMEOUTS)
+    IDLE_TIMEOUTS = getattr(settings, 'DOCKER_IDLE_TIMEOUTS', {
+        'free': {'pause': 300, 'stop': 3600},
+        'basic': {'pause': 900, 'stop': 7200},
+        'full': {'pause': 1800, 'stop': 14400},
+    })
+
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     stripe_customer_id = models.CharField(max_length=255, unique=True)
     stripe_subscription_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
@@ -30,34 +67,28 @@ class Subscription(models.Model):
                                        help_text="Number of CPUs allocated for Docker containers.")
     cpu_shares = models.PositiveIntegerField(default=512,
                                                      help_text="Relative CPU weight for Docker containers.")
+    pids_limit = models.PositiveIntegerField(default=256,
+                                             help_text="Maximum number of processes in Docker containers.")
     storage_limit = models.PositiveIntegerField(default=10000,
                                                      help_text="Maximum size of the directory containing all user projects in megabytes (MB).")
 
     def __str__(self):
         return f"{self.user.username} - {self.get_plan_name_display()}"
 
+    def container_limits(self):
+        """Return the Docker resource limits of this subscription."""
+        return {
+            'mem_limit': self.mem_limit,
+            'memswap_limit': self.memswap_limit,
+            'cpus': self.cpus,
+            'cpu_shares': self.cpu_shares,
+            'pids_limit': self.pids_limit,
+        }
+
     def save(self, *args, **kwargs):
         # Set plan-specific values
-        if self.plan_name == 'free':
-            self.mem_limit = '512m'
-            self.memswap_limit = '1g'
-            self.cpus = 0.5
-            self.cpu_shares = 512
-            self.storage_limit = 10000  # 10GB for free users
-
-        elif self.plan_name == 'basic':
-            self.mem_limit = '1g'
-            self.memswap_limit = '2g'
-            self.cpus = 1.0
-            self.cpu_shares = 1024
-            self.storage_limit = 50000  # 50GB for basic users
-
-        elif self.plan_name == 'full':
-            self.mem_limit = '4g'
-            self.memswap_limit = '8g'
-            self.cpus = 4.0
-            self.cpu_shares = 2048
-            self.storage_limit = 200000  # 200GB for full users
+        for field, value in self.PLAN_LIMITS.get(self.plan_name, {}).items():
+            setattr(self, field, value)
 
         super().save(*args, **kwargs)
 
@@ -65,6 +96,7 @@ class Subscription(models.Model):
 class DockerSessionStatus(Enum):
     """Enumeration for Docker session statuses."""
     RUNNING = 'running'
+    PAUSED = 'paused'
     STOPPED = 'stopped'
     REMOVED = 'removed'
 
@@ -74,6 +106,8 @@ class DockerSession(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     container_id = models.CharField(max_length=255)
     container_name = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=100, blank=True, default='',
+                                help_text="Name of the Docker endpoint that owns the container.")
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=[(status.name, status.value) for status in DockerSessionStatus],
                               default=DockerSessionStatus.STOPPED.value)
@@ -81,6 +115,18 @@ class DockerSession(models.Model):
     last_activity_at = models.DateTimeField(null=True, blank=True)
 
 
+class ContainerUsageSample(models.Model):
+    """Point-in-time resource usage of a user's Docker container."""
+    session = models.ForeignKey(DockerSession, on_delete=models.CASCADE, related_name='usage_samples')
+    sampled_at = models.DateTimeField()
+    cpu_percent = models.FloatField(help_text="CPU usage as a percentage of one CPU.")
+    memory_bytes = models.BigIntegerField()
+    pids = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['session', 'sampled_at'])]
+
+
 class CustomUser(AbstractUser):
     """Custom user model extending the default user with additional fields."""
     is_active = models.BooleanField(default=False)
@@ -88,6 +134,8 @@ class CustomUser(AbstractUser):
     following = models.ManyToManyField('self', symmetrical=False, related_name='followers', blank=True)
     bio = models.TextField(blank=True)
     project_dir = models.CharField(max_length=512, null=True, blank=True)
+    storage_used = models.BigIntegerField(default=0, help_text="Bytes used under project_dir.")
+    storage_reconciled_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         """Return the username of the user."""
@@ -1,4 +1,3 @@
-import os
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.files.storage import FileSystemStorage
@@ -20,6 +19,7 @@ from .models import ActivityLog, CustomUser
 from django.conf import settings
 import stripe
 from .models import Subscription
+from project.utils import storage_used, plan_storage_limit
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
@@ -64,8 +64,18 @@ class SubscriptionView(LoginRequiredMixin, TemplateView):
             subscription.save()
             messages.success(request, f"Your plan has been changed to {subscription.get_plan_name_display()}.")
 
+        self.update_container_limits(request)
         return redirect('settings')
 
+    @staticmethod
+    def update_container_limits(request):
+        """Apply the new plan's resource limits to the user's existing terminal container."""
+        from project.utils import ProjectContainerManager
+        try:
+            ProjectContainerManager.update_container_limits(request.user)
+        except Exception as e:
+            messages.warning(request, f"Your terminal's resource limits could not be updated: {e}")
+
     @staticmethod
     def update_stripe_subscription(subscription, plan):
         """Helper function to update Stripe subscription."""
@@ -113,13 +123,11 @@ class SettingsView(LoginRequiredMixin, TemplateView):
         except UserSocialAuth.DoesNotExist:
             github_account = None
 
-        subscription = Subscription.objects.filter(user=self.request.user).first()
+        # Stored usage, kept current by file actions and the storage reconciler
+        current_folder_size = storage_used(request.user) / (1024 * 1024)  # In MB
 
-        # Calculate the current folder size
-        current_folder_size = self.get_folder_size(request.user.project_dir)  # In MB
-
-        # Get the folder size limit (assuming it's a model field for user)
-        storage_limit = subscription.storage_limit
+        # The plan's folder size limit, or the free plan's without a subscription
+        storage_limit = plan_storage_limit(request.user)
 
         # Calculate remaining space
         remaining_size = storage_limit - current_folder_size
@@ -140,16 +148,6 @@ class SettingsView(LoginRequiredMixin, TemplateView):
 
         return self.render_to_response(context)
 
-    @staticmethod
-    def get_folder_size(folder_path):
-        """Calculate the total size of files in a folder."""
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(folder_path):
-            for f in filenames:
-                file_path = os.path.join(dirpath, f)
-                total_size += os.path.getsize(file_path)
-        return total_size / (1024 * 1024)  # Return size in MB
-
     def post(self, request, *args, **kwargs):
         """
         Handle actions such as updating user information, notifications, or account.